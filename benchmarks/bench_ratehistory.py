@@ -0,0 +1,52 @@
+"""
+Measures /history query time on a pair with millions of stored rate changes.
+
+Usage: python benchmarks/bench_ratehistory.py [--points N] [--days D]
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from currency_exchange_tg_bot.ratehistory import RateHistoryStore, RECORD, rate_stats, downsample, sparkline
+
+
+def fill(directory: Path, points: int, step: float) -> float:
+    started_at = time.time() - points * step
+    rate = 1.0
+    records = bytearray()
+    for i in range(points):
+        rate *= 1 + random.uniform(-0.001, 0.001)
+        records += RECORD.pack(started_at + i * step, rate)
+    (directory / 'USDEUR.bin').write_bytes(records)
+    return started_at
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--points', type=int, default=3_000_000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--step', type=float, default=10.0, help='seconds between stored changes')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fill(Path(tmp_dir), args.points, args.step)
+        store = RateHistoryStore(Path(tmp_dir))
+
+        end = time.time()
+        started_at = time.perf_counter()
+        series = store.query('USD', 'EUR', end - args.days * 86400, end)
+        queried_at = time.perf_counter()
+        stats = rate_stats(series)
+        line = sparkline(downsample(series, 30))
+        finished_at = time.perf_counter()
+
+    print(f'stored points: {args.points}, points in {args.days}d: {len(series.rates)}')
+    print(f'query: {(queried_at - started_at) * 1000:.1f} ms, '
+          f'stats and sparkline: {(finished_at - queried_at) * 1000:.1f} ms')
+    print(stats, line)
+
+
+if __name__ == '__main__':
+    main()
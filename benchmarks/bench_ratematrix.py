@@ -0,0 +1,49 @@
+"""
+Measures building the cross-rate matrix (/ratematrix, /arbitrage) of hundreds of currencies.
+
+Usage: python benchmarks/bench_ratematrix.py [--currencies N] [--rates-per-currency R] [--noise X]
+"""
+import argparse
+import random
+import time
+
+from currency_exchange_tg_bot.ratematrix import RateMatrix
+
+
+def make_rates(currencies: int, rates_per_currency: int, noise: float) -> list[tuple[str, str, float]]:
+    codes = [f'{chr(65 + i // 676)}{chr(65 + i // 26 % 26)}{chr(65 + i % 26)}' for i in range(currencies)]
+    # rates consistent with a value per currency, noise makes arbitrage cycles
+    values = {code: random.uniform(0.01, 100) for code in codes}
+    rates = []
+    for base in codes:
+        for target in random.sample(codes, rates_per_currency):
+            if target != base:
+                rates.append((base, target, values[target] / values[base] * random.uniform(1 - noise, 1 + noise)))
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--currencies', type=int, default=500)
+    parser.add_argument('--rates-per-currency', type=int, default=5)
+    parser.add_argument('--noise', type=float, default=0.001, help='0 for rates without arbitrage')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rates = make_rates(args.currencies, args.rates_per_currency, args.noise)
+    timings = []
+    for _ in range(args.repeat):
+        started_at = time.perf_counter()
+        matrix = RateMatrix.from_rates(rates)
+        built_at = time.perf_counter()
+        cycles = matrix.cycles()
+        finished_at = time.perf_counter()
+        timings.append((built_at - started_at, finished_at - built_at))
+
+    build, find = min(timings)
+    print(f'currencies: {len(matrix.codes)}, rates: {len(rates)}, cycles: {len(cycles)}')
+    print(f'matrix: {build * 1000:.1f} ms, cycles: {find * 1000:.1f} ms (best of {args.repeat})')
+
+
+if __name__ == '__main__':
+    main()
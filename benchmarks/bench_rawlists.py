@@ -0,0 +1,93 @@
+"""
+Compares the model path and the raw-json path of the list endpoints on a large catalog.
+
+Both paths go through the generated client, only its http layer is replaced by a canned response, so the time
+is spent on building models (or parsing rows) and not on the network. The body is generated with --rows rates,
+or read from --body: a json list saved from GET of the exchange rates endpoint.
+
+Usage: python benchmarks/bench_rawlists.py [--rows N] [--body RATES.json] [--repeat R]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+
+from currency_exchange_fapi_client import ApiClient, Configuration, CurrencyExchangeApi
+from currency_exchange_fapi_client.rest import RESTResponse
+
+from currency_exchange_tg_bot import rawlists
+
+
+class CannedHttpResponse:
+
+    def __init__(self, body: bytes):
+        self.status = 200
+        self.reason = 'OK'
+        self.headers = {'Content-Type': 'application/json'}
+        self._body = body
+
+    async def read(self) -> bytes:
+        return self._body
+
+
+def make_rates_body(rows: int) -> bytes:
+    currencies = [{'id': i, 'code': f'{chr(65 + i // 676)}{chr(65 + i // 26 % 26)}{chr(65 + i % 26)}',
+                   'name': f'Currency {i}', 'sign': '¤'} for i in range(int(rows ** 0.5) + 2)]
+    rates = []
+    for i in range(rows):
+        base, target = currencies[i % len(currencies)], currencies[(i // len(currencies) + 1 + i) % len(currencies)]
+        rates.append({'id': i, 'base_currency': base, 'target_currency': target, 'rate': f'{1 + i % 1000 / 997:.6f}'})
+    return json.dumps(rates).encode()
+
+
+async def model_path(api: CurrencyExchangeApi) -> list[tuple[str, str, float]]:
+    response = await api.currency_exchange_get_all_exchange_rates()
+    return [(er.base_currency.code, er.target_currency.code, float(er.rate)) for er in response]
+
+
+async def raw_path(api: CurrencyExchangeApi) -> list[tuple[str, str, float]]:
+    return await rawlists.get_all_exchange_rates(api, None)
+
+
+async def measure(path, api: CurrencyExchangeApi, repeat: int) -> tuple[list[float], list]:
+    timings, rows = [], None
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        rows = await path(api)
+        timings.append(time.perf_counter() - started_at)
+    return timings, rows
+
+
+async def run(body: bytes, repeat: int):
+    async with ApiClient(Configuration(host='http://bench.invalid')) as api_client:
+        async def call_api(*args, **kwargs):
+            return RESTResponse(CannedHttpResponse(body))
+
+        api_client.call_api = call_api
+        api = CurrencyExchangeApi(api_client)
+
+        model_timings, model_rows = await measure(model_path, api, repeat)
+        raw_timings, raw_rows = await measure(raw_path, api, repeat)
+
+    assert model_rows == raw_rows, 'paths disagree on the rows'
+    print(f'rows: {len(raw_rows)}, body: {len(body) / 1024:.0f} KiB, runs: {repeat}')
+    for name, timings in (('models', model_timings), ('raw json', raw_timings)):
+        print(f'{name:>9}: best {min(timings) * 1000:8.1f} ms, mean {statistics.fmean(timings) * 1000:8.1f} ms')
+    print(f'  speedup: {min(model_timings) / min(raw_timings):.1f}x (best to best)')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20_000)
+    parser.add_argument('--body', type=Path)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    body = args.body.read_bytes() if args.body else make_rates_body(args.rows)
+    asyncio.run(run(body, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
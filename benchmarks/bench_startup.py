@@ -0,0 +1,129 @@
+"""
+Measures time-to-first-update of the bot: the time it takes to import the bot, build the application,
+run the startup phases and handle the first /start update.
+
+Bot API calls are answered by a local fake which simulates network round-trip time, so the result
+reflects how many round-trips startup waits for, not the speed of a real Telegram server.
+
+Usage: python benchmarks/bench_startup.py [--admins N] [--rtt SECONDS]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest
+
+from currency_exchange_tg_bot.bothandlers import make_handlers
+from currency_exchange_tg_bot.ioc import Container
+
+
+class FakeBotApiRequest(BaseRequest):
+    """Answers Bot API methods used by the bot after a fixed delay"""
+
+    def __init__(self, rtt: float):
+        self._rtt = rtt
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self): ...
+
+    async def shutdown(self): ...
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        await asyncio.sleep(self._rtt)
+        api_method = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if api_method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'}
+        elif api_method in ('sendMessage', 'sendDocument'):
+            result = {'message_id': 1, 'date': int(time.time()), 'text': params.get('text', ''),
+                      'chat': {'id': params['chat_id'], 'type': 'private'}}
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+def measure_import() -> float:
+    # measured in a fresh interpreter, as modules imported by this script are already cached
+    code = ('import time; started_at = time.perf_counter(); import currency_exchange_tg_bot.main; '
+            'print(time.perf_counter() - started_at)')
+    return float(subprocess.run([sys.executable, '-c', code], capture_output=True, check=True, text=True).stdout)
+
+
+def make_start_update(bot) -> Update:
+    return Update.de_json({
+        'update_id': 1,
+        'message': {
+            'message_id': 1,
+            'date': int(time.time()),
+            'chat': {'id': 100, 'type': 'private'},
+            'from': {'id': 100, 'is_bot': False, 'first_name': 'user'},
+            'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+        },
+    }, bot)
+
+
+async def run(admins: int, rtt: float) -> dict[str, float]:
+    started_at = time.perf_counter()
+    container = Container()
+
+    application = (
+        Application.builder()
+        .token(container.bot_settings.tg_bot_token)
+        .request(FakeBotApiRequest(rtt))
+        .post_init(container.startup)
+        .build()
+    )
+    application.add_handlers(make_handlers(container))
+
+    await application.initialize()
+    await application.post_init(application)
+    started_up_at = time.perf_counter()
+
+    await application.process_update(make_start_update(application.bot))
+    first_update_at = time.perf_counter()
+    await application.shutdown()
+
+    return {
+        'startup': started_up_at - started_at,
+        'first_update': first_update_at - started_up_at,
+        'first_update_after_startup': first_update_at - started_at,
+        'sequential_commands_push_estimate': (admins + 1) * rtt,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--admins', type=int, default=10)
+    parser.add_argument('--rtt', type=float, default=0.1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        with open('admin_records', 'w', encoding='utf-8') as f:
+            f.write(','.join(str(1000 + i) for i in range(args.admins)))
+        os.environ.update({
+            'TG_BOT_TOKEN': '123456:benchmark',
+            'CURRENCY_EXCHANGE_HOST': 'http://localhost:8000',
+            'CONNECTION_URI': os.path.join(tmp_dir, 'accesstoken.sqlite3'),
+        })
+        results = {'import': measure_import()}
+        results.update(asyncio.run(run(args.admins, args.rtt)))
+        results['time_to_first_update'] = results['import'] + results['first_update_after_startup']
+
+    for name, seconds in results.items():
+        print(f'{name:>36}: {seconds * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
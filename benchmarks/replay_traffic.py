@@ -0,0 +1,237 @@
+"""
+Replays traffic captured with TRAFFIC_CAPTURE_ENABLED=true through the bot application, and compares runs.
+
+Updates are fed to the application built by main.build_application at their captured pace sped up
+--speed times (0 feeds them as fast as they are handled). Service requests are answered from the captured
+responses after their captured latency, Bot API requests by a local fake, so a run measures the bot itself.
+Latency of an update is counted from the moment it is due to the end of its handling, so it includes
+the wait behind earlier updates.
+
+Usage:
+    python benchmarks/replay_traffic.py run CAPTURE_FILE [--speed N] [--no-backend-latency] [--out RESULT.json]
+    python benchmarks/replay_traffic.py compare BASELINE.json RESULT.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+from collections import defaultdict, deque
+from functools import cached_property
+from pathlib import Path
+
+from telegram import Update
+
+from currency_exchange_fapi_client import exceptions as apiexc
+from currency_exchange_fapi_client import models
+
+from currency_exchange_tg_bot.botcallbacks import get_update_command
+from currency_exchange_tg_bot.ioc import Container, SharedContainer
+from currency_exchange_tg_bot.main import build_application
+from currency_exchange_tg_bot.rawlists import RawResponse
+from currency_exchange_tg_bot.traffic import API_RESPONSE, UPDATE, read_traffic
+
+from bench_startup import FakeBotApiRequest
+
+
+def from_jsonable(value):
+    if isinstance(value, list):
+        return [from_jsonable(item) for item in value]
+    if isinstance(value, dict) and '__model__' in value:
+        return getattr(models, value['__model__']).from_dict(value['data'])
+    if isinstance(value, dict) and '__raw__' in value:
+        return RawResponse(value['status'], value['__raw__'].encode())
+    return value
+
+
+class ReplayBackend:
+    """
+    Answers each request with the next captured response to the same request; once those run out,
+    the last one is repeated, and a request never captured gets a 404
+    """
+
+    def __init__(self, responses: list[dict], *, latency: bool):
+        self._responses: dict[tuple[str, str], deque] = defaultdict(deque)
+        self._last: dict[tuple[str, str], dict] = {}
+        self._latency = latency
+        for response in responses:
+            self._responses[(response['method'], json.dumps(response['args']))].append(response)
+
+    async def call(self, method: str, args: list):
+        key = (method, json.dumps(args, default=str))
+        queue = self._responses.get(key)
+        response = queue.popleft() if queue else self._last.get(key)
+        if response is None:
+            raise apiexc.NotFoundException(status=404, reason='Not captured')
+        self._last[key] = response
+        if self._latency:
+            await asyncio.sleep(response['latency'])
+        if 'error' in response:
+            raise getattr(apiexc, response['error'], apiexc.ApiException)(status=0, reason='Replayed')
+        return from_jsonable(response['result'])
+
+
+class ReplayApi:
+
+    def __init__(self, backend: ReplayBackend):
+        self._backend = backend
+
+    def __getattr__(self, name: str):
+        def call(*args, **kwargs):
+            return self._backend.call(name, [*args, *(v for k, v in kwargs.items() if not k.startswith('_'))])
+        return call
+
+
+class ReplaySharedContainer(SharedContainer):
+
+    def __init__(self, backend: ReplayBackend):
+        super().__init__()
+        self._backend = backend
+
+    @cached_property
+    def traffic_recorder(self):
+        return None
+
+    @cached_property
+    def cur_exch_api_factory(self):
+        @contextlib.asynccontextmanager
+        async def session():
+            yield ReplayApi(self._backend)
+        return session
+
+
+def restamp(payload: dict, sent_at: float) -> dict:
+    """Dates the messages of a captured update as sent now, admission control sheds updates by their age"""
+    payload = dict(payload)
+    for key in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if isinstance(payload.get(key), dict):
+            payload[key] = {**payload[key], 'date': int(sent_at)}
+            if 'edit_date' in payload[key]:
+                payload[key]['edit_date'] = int(sent_at)
+    return payload
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def summarize(latencies: list[tuple[str, float]], duration: float) -> dict:
+    all_latencies = [latency for _, latency in latencies]
+    by_command = defaultdict(list)
+    for command, latency in latencies:
+        by_command[command].append(latency)
+    return {
+        'updates': len(latencies),
+        'duration': duration,
+        'throughput': len(latencies) / duration if duration else 0.0,
+        'latency': {
+            'mean': statistics.fmean(all_latencies) if all_latencies else 0.0,
+            'p50': percentile(all_latencies, 0.5),
+            'p95': percentile(all_latencies, 0.95),
+            'p99': percentile(all_latencies, 0.99),
+            'max': max(all_latencies, default=0.0),
+        },
+        'commands': {
+            command: {'count': len(values), 'p50': percentile(values, 0.5), 'p95': percentile(values, 0.95)}
+            for command, values in sorted(by_command.items())
+        },
+    }
+
+
+async def replay(capture: Path, speed: float, backend_latency: bool) -> dict:
+    records = list(read_traffic(capture))
+    updates = [record for record in records if record.kind == UPDATE]
+    backend = ReplayBackend([record.payload for record in records if record.kind == API_RESPONSE],
+                            latency=backend_latency)
+    container = Container(ReplaySharedContainer(backend))
+    application = build_application(container, FakeBotApiRequest(rtt=0))
+    await application.initialize()
+    await application.post_init(application)
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    latencies: list[tuple[str, float]] = []
+
+    # updates are handled one by one, like the application does when polling
+    async def handle_updates():
+        while True:
+            update, due_at = await queue.get()
+            await application.process_update(update)
+            latencies.append((get_update_command(update) or '(reply)', loop.time() - due_at))
+            queue.task_done()
+
+    worker = asyncio.create_task(handle_updates())
+    started_at = loop.time()
+    for record in updates:
+        due_at = started_at + (record.timestamp - updates[0].timestamp) / speed if speed > 0 else loop.time()
+        await asyncio.sleep(max(0.0, due_at - loop.time()))
+        queue.put_nowait((Update.de_json(restamp(record.payload, time.time()), application.bot), due_at))
+    await queue.join()
+    duration = loop.time() - started_at
+    worker.cancel()
+
+    await container.shutdown(application)
+    await application.shutdown()
+    return summarize(latencies, duration)
+
+
+def compare(baseline: dict, result: dict):
+    def row(name: str, before: float, after: float, unit_scale: float = 1000.0, unit: str = 'ms'):
+        change = f'{(after - before) / before:+.1%}' if before else 'n/a'
+        print(f'{name:>28}: {before * unit_scale:10.1f} {unit} -> {after * unit_scale:10.1f} {unit}  {change}')
+
+    row('throughput', baseline['throughput'], result['throughput'], 1, 'upd/s')
+    for name in ('mean', 'p50', 'p95', 'p99', 'max'):
+        row(f'latency {name}', baseline['latency'][name], result['latency'][name])
+    for command, stats in result['commands'].items():
+        before = baseline['commands'].get(command)
+        if before is not None:
+            row(f'{command} p95', before['p95'], stats['p95'])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='action', required=True)
+    run_parser = subparsers.add_parser('run')
+    run_parser.add_argument('capture', type=Path)
+    run_parser.add_argument('--speed', type=float, default=1.0)
+    run_parser.add_argument('--no-backend-latency', action='store_true')
+    run_parser.add_argument('--out', type=Path)
+    compare_parser = subparsers.add_parser('compare')
+    compare_parser.add_argument('baseline', type=Path)
+    compare_parser.add_argument('result', type=Path)
+    args = parser.parse_args()
+
+    if args.action == 'compare':
+        compare(json.loads(args.baseline.read_text()), json.loads(args.result.read_text()))
+        return
+
+    logging.basicConfig(level=logging.WARNING)
+    capture = args.capture.resolve()
+    out = args.out.resolve() if args.out else None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # the bot keeps its files in the working directory, a replay must not touch the real ones
+        os.chdir(tmp_dir)
+        Path('admin_records').write_text('', encoding='utf-8')
+        os.environ.update({
+            'TG_BOT_TOKEN': '123456:replay',
+            'CURRENCY_EXCHANGE_HOST': 'http://localhost:8000',
+            'CONNECTION_URI': os.path.join(tmp_dir, 'accesstoken.sqlite3'),
+        })
+        started_at = time.perf_counter()
+        result = asyncio.run(replay(capture, args.speed, not args.no_backend_latency))
+        result['wall_time'] = time.perf_counter() - started_at
+
+    output = json.dumps(result, indent=2)
+    if out:
+        out.write_text(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
 from .accesstokenservice import AuthToken, AccessTokenService
+from .credentialpool import CredentialPool, PooledCredential
 from .tokenrepo import Sqlite3TokenRepository
-from .db import get_sqlite3_connection
\ No newline at end of file
+from .db import get_sqlite3_connection
@@ -1,5 +1,10 @@
+import asyncio
 import datetime
 import logging
+import os
+import socket
+import uuid
+from typing import get_args
 
 
 from currency_exchange_fapi_client import Configuration, TokenCreatedResponse
@@ -13,16 +18,29 @@ logger = logging.getLogger('auth_token_service')
 
 
 class AccessTokenService:
-
-    def __init__(self, token_repo: SyncTokenRepositoryInterface, settings):
+    """
+    Several processes may share one token repository: only the process holding the repository lock
+    gains or refreshes tokens, the others wait and pick up the token it saves.
+    Tokens are gained for the account of the settings, unless another username and password are given
+    """
+
+    def __init__(self, token_repo: SyncTokenRepositoryInterface, settings, *,
+                 username: str | None = None, password: str | None = None,
+                 lock_ttl: float = 30.0, lock_poll_interval: float = 0.2):
         self._api_settings = settings
         self._token_repo = token_repo
+        self._username = username if username is not None else settings.username
+        self._password = password if password is not None else settings.password
         self._configuration = Configuration(
             host = settings.host,
-            username = settings.username,
-            password = settings.password
+            username = self._username,
+            password = self._password
         )
         self._cached_access_token: AuthToken | None = None
+        self._lock = asyncio.Lock()
+        self._lock_owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}'
+        self._lock_ttl = lock_ttl
+        self._lock_poll_interval = lock_poll_interval
 
     async def get_access_token(self, *, invalidate_cache=False) -> str:
         if invalidate_cache:
@@ -36,19 +54,39 @@ class AccessTokenService:
         if token:
             logger.debug('Returning fresh token from db')
         if token is None:
-            logger.debug('Refreshing token')
-            token = await self._refresh_access_token()
-            if token:
-                logger.debug('Returning fresh token obtained through refresh')
-        if token is None:
-            logger.debug('Gaining token')
-            token = await self._gain_token()
-            logger.debug('Returning newly gained token')
+            token = await self._obtain_access_token()
 
         self._cached_access_token = token
         logger.debug('Token was cached')
         return token.data
 
+    async def _obtain_access_token(self) -> AuthToken:
+        async with self._lock:
+            while not self._token_repo.try_acquire_lock(self._lock_owner, self._lock_ttl):
+                logger.debug('Waiting for another process to obtain token')
+                await asyncio.sleep(self._lock_poll_interval)
+                token = self._token_repo.get_fresh_token(token_type='access')
+                if token:
+                    logger.debug('Returning fresh token obtained by another process')
+                    return token
+            try:
+                # the token might have been saved by another process or coroutine before the lock was acquired
+                token = self._token_repo.get_fresh_token(token_type='access')
+                if token:
+                    logger.debug('Returning fresh token from db')
+                    return token
+                logger.debug('Refreshing token')
+                token = await self._refresh_access_token()
+                if token:
+                    logger.debug('Returning fresh token obtained through refresh')
+                    return token
+                logger.debug('Gaining token')
+                token = await self._gain_token()
+                logger.debug('Returning newly gained token')
+                return token
+            finally:
+                self._token_repo.release_lock(self._lock_owner)
+
     def invalidate_cached_access_token(self):
         logger.debug('Invalidating cached access token')
         self._cached_access_token = None
@@ -62,8 +100,7 @@ class AccessTokenService:
     async def _gain_token(self) -> AuthToken:
         async with ApiClient(self._configuration) as api_client:
             auth = AuthApi(api_client)
-            settings = self._api_settings
-            response = await auth.auth_create_token(settings.username, settings.password)
+            response = await auth.auth_create_token(self._username, self._password)
             self.remove_all_tokens()
             auth_tokens = self._response_as_auth_tokens(response)
             self._save_token(auth_tokens['access'], 'access')
@@ -88,6 +125,11 @@ class AccessTokenService:
     def remove_all_tokens(self):
         self._token_repo.delete_all_tokens()
 
+    def remove_expired_tokens(self) -> int:
+        removed = sum(self._token_repo.remove_expired_tokens(token_type) for token_type in get_args(tokenType))
+        logger.debug(f'Removed {removed} expired tokens')
+        return removed
+
     def _save_token(self, token: AuthToken, type_: tokenType):
 
         self._token_repo.save_token(
@@ -0,0 +1,84 @@
+import logging
+import time
+from typing import Callable, Literal, Optional
+
+from .accesstokenservice import AccessTokenService
+
+
+logger = logging.getLogger('credential_pool')
+
+SelectionStrategy = Literal['least_in_flight', 'round_robin']
+
+
+class PooledCredential:
+    """An account of the service with its own token service, and the state of its use by the pool"""
+
+    def __init__(self, username: Optional[str], password: Optional[str], token_service: AccessTokenService):
+        self.username = username
+        self.password = password
+        self.token_service = token_service
+        self.in_flight = 0
+        # monotonic time until which the service asked not to send requests of this account
+        self.cooldown_until = 0.0
+
+
+class CredentialPool:
+    """
+    Spreads requests over several accounts of the service, which limits requests per account.
+    A request takes the account with the fewest requests in flight, or the next one in turn.
+    An account the service throttled cools down and is skipped meanwhile, unless all of them are cooling down:
+    then the one that is free the soonest is taken, a request should still be tried rather than dropped
+    """
+
+    def __init__(self, credentials: list[PooledCredential], *, strategy: SelectionStrategy = 'least_in_flight',
+                 cooldown: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        if not credentials:
+            raise ValueError('Credential pool needs at least one credential')
+        self._credentials = credentials
+        self._strategy = strategy
+        self._cooldown = cooldown
+        self._clock = clock
+        self._next = 0
+
+    @property
+    def credentials(self) -> list[PooledCredential]:
+        return self._credentials
+
+    def acquire(self, credential: Optional[PooledCredential] = None) -> PooledCredential:
+        """Takes the given credential, or picks one, for a request; it must be released once the request is done"""
+        if credential is None:
+            credential = self._pick()
+        credential.in_flight += 1
+        return credential
+
+    def release(self, credential: PooledCredential):
+        credential.in_flight -= 1
+
+    def throttle(self, credential: PooledCredential, retry_after: Optional[float] = None):
+        cooldown = retry_after if retry_after is not None else self._cooldown
+        credential.cooldown_until = max(credential.cooldown_until, self._clock() + cooldown)
+        logger.warning('Service throttled credential %s, it cools down for %g s', credential.username, cooldown)
+
+    def remove_all_tokens(self):
+        for credential in self._credentials:
+            credential.token_service.remove_all_tokens()
+
+    def invalidate_cached_access_token(self):
+        for credential in self._credentials:
+            credential.token_service.invalidate_cached_access_token()
+
+    def remove_expired_tokens(self) -> int:
+        return sum(credential.token_service.remove_expired_tokens() for credential in self._credentials)
+
+    def _pick(self) -> PooledCredential:
+        now = self._clock()
+        # the scan starts from the next credential each time, so ties are spread too
+        start = self._next
+        self._next = (start + 1) % len(self._credentials)
+        ordered = self._credentials[start:] + self._credentials[:start]
+        available = [credential for credential in ordered if credential.cooldown_until <= now]
+        if not available:
+            return min(ordered, key=lambda credential: credential.cooldown_until)
+        if self._strategy == 'round_robin':
+            return available[0]
+        return min(available, key=lambda credential: credential.in_flight)
@@ -1,10 +1,5 @@
 import contextlib
 import sqlite3
-import datetime
-
-
-sqlite3.register_adapter(datetime.datetime, lambda v: v.isoformat())
-sqlite3.register_converter('datetime', lambda v: datetime.datetime.fromisoformat(v))
 
 
 def get_sqlite3_connection(db_url: str):
@@ -20,12 +15,61 @@ def get_sqlite3_connection(db_url: str):
     return connect
 
 def create_schema(connection: sqlite3.Connection):
+    # several bot processes may share the db file, WAL lets them read while one of them writes
+    connection.execute('PRAGMA journal_mode=WAL;')
+    # expiry is stored as UTC epoch seconds, so that lookups by (token_type, expiry) can use the index
     with connection:
+        if _has_legacy_token_table(connection):
+            _migrate_legacy_token_table(connection)
         connection.execute(
             '''CREATE TABLE IF NOT EXISTS token (
                data TEXT,
                token_type TEXT,
-               expiry_date DATETIME
+               expiry INTEGER,
+               owner TEXT NOT NULL DEFAULT ''
+               );
+            '''
+        )
+        # tokens of the accounts of a credential pool are told apart by owner, those kept before belong
+        # to the primary account, which has the empty owner
+        if not _has_token_owner(connection):
+            connection.execute("ALTER TABLE token ADD COLUMN owner TEXT NOT NULL DEFAULT '';")
+        connection.execute('DROP INDEX IF EXISTS token_type_expiry_idx;')
+        connection.execute('CREATE INDEX IF NOT EXISTS token_owner_type_expiry_idx ON token (owner, token_type, expiry);')
+        # a lease held by the process that is currently gaining or refreshing tokens
+        connection.execute(
+            '''CREATE TABLE IF NOT EXISTS token_lock (
+               name TEXT PRIMARY KEY,
+               owner TEXT,
+               expiry REAL
                );
             '''
-        )
\ No newline at end of file
+        )
+
+def _has_token_owner(connection: sqlite3.Connection) -> bool:
+    columns = [row[1] for row in connection.execute('PRAGMA table_info(token);')]
+    return 'owner' in columns
+
+def _has_legacy_token_table(connection: sqlite3.Connection) -> bool:
+    columns = [row[1] for row in connection.execute('PRAGMA table_info(token);')]
+    return 'expiry_date' in columns
+
+def _migrate_legacy_token_table(connection: sqlite3.Connection):
+    # legacy layout kept expiry as naive local time in ISO format
+    connection.execute('BEGIN;')
+    connection.execute('ALTER TABLE token RENAME TO legacy_token;')
+    connection.execute(
+        '''CREATE TABLE token (
+           data TEXT,
+           token_type TEXT,
+           expiry INTEGER
+           );
+        '''
+    )
+    connection.execute(
+        '''INSERT INTO token (data, token_type, expiry)
+           SELECT data, token_type, CAST(strftime('%s', expiry_date, 'utc') AS INTEGER)
+           FROM legacy_token WHERE expiry_date IS NOT NULL;
+        '''
+    )
+    connection.execute('DROP TABLE legacy_token;')
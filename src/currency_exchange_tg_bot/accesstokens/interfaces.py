@@ -15,3 +15,7 @@ class SyncTokenRepositoryInterface(Protocol):
     def save_token(self, data: str, expiry_time: datetime.datetime, token_type: tokenType) -> None: ...
 
     def delete_all_tokens(self): ...
+
+    def try_acquire_lock(self, owner: str, ttl: float) -> bool: ...
+
+    def release_lock(self, owner: str) -> None: ...
@@ -1,5 +1,6 @@
 import sqlite3
 import datetime
+import time
 from typing import Callable
 
 from .interfaces import SyncTokenRepositoryInterface, tokenType, AuthToken
@@ -7,34 +8,56 @@ from .interfaces import SyncTokenRepositoryInterface, tokenType, AuthToken
 
 
 class Sqlite3TokenRepository(SyncTokenRepositoryInterface):
+    """
+    Tokens and the lock of one account of the service: accounts of a credential pool share the db,
+    each through its own repository. The primary account owns the tokens with an empty owner
+    """
 
-    def __init__(self, connection: Callable[..., sqlite3.Connection]):
+    def __init__(self, connection: Callable[..., sqlite3.Connection], owner: str = ''):
         self._db_connection = connection
+        self._owner = owner
+        self._lock_name = f'token:{owner}' if owner else 'token'
 
     def get_fresh_token(self, token_type: tokenType) -> AuthToken | None:
         with self._db_connection() as conn:
-            res = conn.execute("SELECT * FROM token WHERE token_type = ? "
-                               "AND strftime('%Y-%m-%d %H:%M:%S', expiry_date) > datetime('now', 'localtime') LIMIT 1;",
-                               (token_type,)).fetchone()
+            res = conn.execute('SELECT data, expiry FROM token WHERE owner = ? AND token_type = ? AND expiry > ? '
+                               'ORDER BY expiry DESC LIMIT 1;',
+                               (self._owner, token_type, int(time.time()))).fetchone()
             if res is not None:
-                return AuthToken(res[0], res[1])
+                return AuthToken(res[0], datetime.datetime.fromtimestamp(res[1]))
             else:
                 return res
 
     def remove_expired_tokens(self, token_type: tokenType) -> int:
         with self._db_connection() as conn:
             with conn:
-                res = conn.execute("DELETE FROM token WHERE token_type = ? "
-                                   "AND strftime('%Y-%m-%d %H:%M:%S', expiry_date) < datetime('now', 'localtime') "
-                                   "RETURNING *;", (token_type,))
+                res = conn.execute('DELETE FROM token WHERE owner = ? AND token_type = ? AND expiry <= ?;',
+                                   (self._owner, token_type, int(time.time())))
                 return res.rowcount
 
     def save_token(self, data: str, expiry_time: datetime.datetime, token_type: tokenType) -> None:
         with self._db_connection() as conn:
             with conn:
-                conn.execute('INSERT INTO token VALUES (?, ?, ?);', (data, token_type, expiry_time))
+                conn.execute('INSERT INTO token (data, token_type, expiry, owner) VALUES (?, ?, ?, ?);',
+                             (data, token_type, int(expiry_time.timestamp()), self._owner))
 
     def delete_all_tokens(self):
         with self._db_connection() as conn:
             with conn:
-                conn.execute('DELETE FROM token;')
+                conn.execute('DELETE FROM token WHERE owner = ?;', (self._owner,))
+
+    def try_acquire_lock(self, owner: str, ttl: float) -> bool:
+        """Takes the lock unless another owner holds it and its ttl (in seconds) has not run out yet"""
+        now = time.time()
+        with self._db_connection() as conn:
+            with conn:
+                res = conn.execute("INSERT INTO token_lock VALUES (?, ?, ?) "
+                                   "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expiry = excluded.expiry "
+                                   "WHERE token_lock.expiry < ? OR token_lock.owner = excluded.owner;",
+                                   (self._lock_name, owner, now + ttl, now))
+                return res.rowcount == 1
+
+    def release_lock(self, owner: str) -> None:
+        with self._db_connection() as conn:
+            with conn:
+                conn.execute("DELETE FROM token_lock WHERE name = ? AND owner = ?;", (self._lock_name, owner))
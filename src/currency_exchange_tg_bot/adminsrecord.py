@@ -1,3 +1,5 @@
+import os
+
 from currency_exchange_tg_bot.config import TgBotSettings
 
 
@@ -9,7 +11,20 @@ class AdminsRecord:
 
     def __init__(self, settings: TgBotSettings):
         self._records_file = settings.admin_records_file
+        self._cached_ids: frozenset[int] = frozenset()
+        self._cached_mtime: int | None = None
 
     def read_ids(self) -> list[int]:
         with open(self._records_file, 'r', encoding='utf-8') as f:
             return [int(id_str) for id_str in f.read().strip('\n').split(',') if id_str]
+
+    def is_admin(self, user_id: int) -> bool:
+        """Checked on every update, so the ids are reread only when the file changes"""
+        try:
+            mtime = os.stat(self._records_file).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime != self._cached_mtime:
+            self._cached_ids = frozenset(self.read_ids())
+            self._cached_mtime = mtime
+        return user_id in self._cached_ids
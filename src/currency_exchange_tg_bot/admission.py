@@ -0,0 +1,67 @@
+import datetime
+import enum
+from typing import Optional
+
+from telegram import Update
+
+
+class Admission(enum.Enum):
+    ADMIT = 'admit'
+    # answered from the catalog rather than by the service
+    SERVE_CACHED = 'serve_cached'
+    # answered with a short "busy, try later" reply
+    REJECT = 'reject'
+    # too old for any reply to be of use, or one that no handler would answer anyway
+    DROP = 'drop'
+
+
+# reads that can be answered from the catalog snapshot
+CACHED_COMMANDS = frozenset(('showcurrency', 'showexchangerate'))
+
+# reads served from memory anyway, shedding them saves nothing but the reply
+CHEAP_COMMANDS = frozenset(('start', 'allcurrencies', 'allexchangerates'))
+
+
+class AdmissionPolicy:
+    """
+    Decides whether an update is handled as usual or shed, from the load of the bot when the update
+    is taken for handling: how many updates wait behind it and how long ago it was sent.
+    Updates are handled one by one, so both grow together once handlers get slower than the traffic
+    """
+
+    def __init__(self, *, max_pending_updates: int, max_update_age: float, drop_update_age: float):
+        self._max_pending_updates = max_pending_updates
+        self._max_update_age = max_update_age
+        self._drop_update_age = drop_update_age
+
+    def is_overloaded(self, pending_updates: int, update_age: float) -> bool:
+        return pending_updates > self._max_pending_updates or update_age > self._max_update_age
+
+    def decide(self, pending_updates: int, update_age: float, command: Optional[str], is_admin: bool,
+               is_answerable: bool = True) -> Admission:
+        """
+        is_answerable tells whether a handler would answer the update (a command, a reply in a conversation
+        in progress, a button press): under overload the rest, like group chatter, is dropped without a reply
+        """
+        if is_admin:
+            return Admission.ADMIT
+        if update_age > self._drop_update_age:
+            return Admission.DROP
+        if not self.is_overloaded(pending_updates, update_age) or command in CHEAP_COMMANDS:
+            return Admission.ADMIT
+        if not is_answerable:
+            return Admission.DROP
+        if command in CACHED_COMMANDS:
+            return Admission.SERVE_CACHED
+        return Admission.REJECT
+
+
+def get_update_age(update: Update, now: Optional[datetime.datetime] = None) -> float:
+    """Seconds since the update was sent, 0 for updates without a date (e.g. inline button presses)"""
+    message = update.effective_message
+    if message is None or update.callback_query is not None:
+        return 0.0
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    # an edited message is as old as its edit
+    sent_at = message.edit_date or message.date
+    return max(0.0, (now - sent_at).total_seconds())
@@ -1,52 +1,272 @@
-from typing import Protocol, Callable, Union, Optional
+import asyncio
+import functools
+import math
+import time
+from collections import defaultdict, deque
+from typing import Callable, Union, Optional
 from copy import copy
 
+from currency_exchange_fapi_client import exceptions as apiexc
 from currency_exchange_fapi_client.api import CurrencyExchangeApi, AuthApi, UsersApi
 from currency_exchange_fapi_client.api_client import ApiClient
 from currency_exchange_fapi_client.configuration import Configuration
 
+from currency_exchange_tg_bot.accesstokens import CredentialPool, PooledCredential
+from currency_exchange_tg_bot.config import CurrencyExchangeApiSettings
+from currency_exchange_tg_bot.metrics import Metrics
+from currency_exchange_tg_bot.rawlists import RAW_RESPONSE_SUFFIX
+from currency_exchange_tg_bot.traffic import TrafficRecorder
+
 
 ApiType = type[Union[CurrencyExchangeApi, AuthApi, UsersApi]]
 
 
-class AccessTokenGatewayProtocol(Protocol):
+class LatencyTracker:
+    """Rolling window of the latest latencies of each endpoint"""
+
+    def __init__(self, window: int, min_samples: int):
+        self._latencies: dict[str, deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._min_samples = min_samples
+
+    def record(self, endpoint: str, latency: float):
+        self._latencies[endpoint].append(latency)
+
+    def quantile(self, endpoint: str, q: float) -> Optional[float]:
+        """None until the endpoint has enough samples for the quantile to mean something"""
+        latencies = self._latencies.get(endpoint)
+        if latencies is None or len(latencies) < self._min_samples:
+            return None
+        ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+
+class HedgeBudget:
+    """
+    Each request earns `ratio` of a hedge and each hedge spends a whole one, so hedges stay under
+    that share of requests. Unspent hedges pile up to `burst` at most
+    """
+
+    def __init__(self, ratio: float, burst: float = 10.0):
+        self._ratio = ratio
+        self._burst = burst
+        self._tokens = 0.0
+
+    def on_request(self):
+        self._tokens = min(self._burst, self._tokens + self._ratio)
+
+    def try_spend(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class RequestHedging:
+    """
+    Derives request timeouts of read endpoints from their observed latencies, and sends a second (hedged)
+    request for a read that takes longer than the observed hedge quantile, the first answer wins.
+    Raw reads, returning the response unread, get the derived timeouts but are never hedged.
+    Until an endpoint has enough samples its requests use the configured fixed timeout and aren't hedged
+    """
+
+    def __init__(self, settings: CurrencyExchangeApiSettings, metrics: Optional[Metrics] = None):
+        self._settings = settings
+        self._metrics = metrics
+        self.tracker = LatencyTracker(settings.latency_window, settings.latency_min_samples)
+        self.budget = HedgeBudget(settings.hedge_budget_ratio)
+
+    @staticmethod
+    def is_read(endpoint: str) -> bool:
+        return endpoint.startswith('currency_exchange_get_')
+
+    @classmethod
+    def is_hedgeable(cls, endpoint: str) -> bool:
+        # reads are idempotent, so sending one twice is harmless; except for raw ones, the unread response
+        # of the losing attempt would hold its pooled connection
+        return cls.is_read(endpoint) and not endpoint.endswith(RAW_RESPONSE_SUFFIX)
+
+    def timeout(self, endpoint: str) -> Optional[float]:
+        fixed = self._settings.request_timeout
+        observed = self.tracker.quantile(endpoint, self._settings.adaptive_timeout_quantile)
+        if observed is None:
+            return fixed
+        adaptive = max(self._settings.min_request_timeout, observed * self._settings.adaptive_timeout_multiplier)
+        return adaptive if fixed is None else min(fixed, adaptive)
+
+    async def call(self, endpoint: str, method: Callable, *args, **kwargs):
+        timeout = self.timeout(endpoint)
+        kwargs['_request_timeout'] = timeout
+        hedge_delay = None
+        if self.is_hedgeable(endpoint):
+            self.budget.on_request()
+            hedge_delay = self.tracker.quantile(endpoint, self._settings.hedge_quantile)
+
+        attempts = [asyncio.ensure_future(self._timed(endpoint, timeout, method, *args, **kwargs))]
+        try:
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(attempts, timeout=hedge_delay)
+                if not done and self.budget.try_spend():
+                    self._count('api_hedged_requests_total', endpoint)
+                    attempts.append(asyncio.ensure_future(self._timed(endpoint, timeout, method, *args, **kwargs)))
+            pending = set(attempts)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                failed = None
+                for attempt in done:
+                    if attempt.exception() is None:
+                        if len(attempts) > 1 and attempt is attempts[1]:
+                            self._count('api_hedge_wins_total', endpoint)
+                        return attempt.result()
+                    failed = attempt
+                # the other attempt may still succeed, the error is raised only when none is left
+                if not pending:
+                    return failed.result()
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
 
-    async def get_access_token(self): ...
+    async def _timed(self, endpoint: str, timeout: Optional[float], method: Callable, *args, **kwargs):
+        started = time.monotonic()
+        try:
+            result = await method(*args, **kwargs)
+        except TimeoutError:
+            # a timed out request took at least the timeout, leaving it out would make the latencies look better
+            if timeout is not None:
+                self.tracker.record(endpoint, timeout)
+            raise
+        self.tracker.record(endpoint, time.monotonic() - started)
+        return result
+
+    def _count(self, name: str, endpoint: str):
+        if self._metrics is not None:
+            self._metrics.increment(name, endpoint=endpoint)
+
+
+class HedgedApi:
+    """Proxy of a generated api object sending its requests through RequestHedging"""
+
+    def __init__(self, api, hedging: RequestHedging):
+        self._api = api
+        self._hedging = hedging
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._api, name)
+        if not (callable(attr) and self._hedging.is_read(name)):
+            return attr
+        return functools.partial(self._hedging.call, name, attr)
+
+
+class CapturingApi:
+    """Proxy of a generated api object recording the responses of its requests for replay"""
+
+    def __init__(self, api, recorder: TrafficRecorder):
+        self._api = api
+        self._recorder = recorder
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._api, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+
+        async def call(*args, **kwargs):
+            args_to_record = [*args, *(value for key, value in kwargs.items() if not key.startswith('_'))]
+            started = time.monotonic()
+            try:
+                result = await attr(*args, **kwargs)
+            except apiexc.ApiException as e:
+                self._recorder.record_api_response(name, args_to_record, error=type(e).__name__,
+                                                   latency=time.monotonic() - started)
+                raise
+            recorded = result
+            if name.endswith(RAW_RESPONSE_SUFFIX):
+                # the body is buffered by the response, so it's still there for the caller to read
+                recorded = {'__raw__': (await result.read()).decode(), 'status': result.status}
+            self._recorder.record_api_response(name, args_to_record, recorded, latency=time.monotonic() - started)
+            return result
+
+        return call
+
+
+def is_throttling(exc: Optional[BaseException]) -> bool:
+    return isinstance(exc, apiexc.ApiException) and exc.status == 429
+
+
+def get_retry_after(exc: apiexc.ApiException) -> Optional[float]:
+    """Seconds the service asked to wait before the next request, None if it didn't tell"""
+    try:
+        return float((exc.headers or {}).get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
 
 
 class ApiSession:
+    """
+    A client of the service for the requests of one `async with` block, authorized as a credential of the pool,
+    which is either given or picked by the pool
+    """
 
-    def __init__(self, api_type: ApiType, access_token_gateway: AccessTokenGatewayProtocol,
-                 configuration: Configuration, *, ensure_access_token_is_active: bool = True):
+    def __init__(self, api_type: ApiType, credentials: CredentialPool,
+                 configuration: Configuration, *, ensure_access_token_is_active: bool = True,
+                 hedging: Optional[RequestHedging] = None, capture: Optional[TrafficRecorder] = None,
+                 credential: Optional[PooledCredential] = None):
         self._configuration = copy(configuration)
         self._api_type = api_type
-        self._access_token_gateway = access_token_gateway
+        self._credentials = credentials
         self._ensure_access_token_is_active = ensure_access_token_is_active
+        self._hedging = hedging
+        self._capture = capture
+        self._credential = credential
 
     async def __aenter__(self):
+        self._credential = self._credentials.acquire(self._credential)
+        if self._credential.username is not None:
+            self._configuration.username = self._credential.username
+            self._configuration.password = self._credential.password
         self._api_client = ApiClient(self._configuration)
-        if self._ensure_access_token_is_active:
-            await self._ensure_active_access_token()
-        return self._api_type(self._api_client)
+        try:
+            if self._ensure_access_token_is_active:
+                await self._ensure_active_access_token()
+        except BaseException:
+            await self._close()
+            raise
+        api = self._api_type(self._api_client)
+        if self._hedging is not None:
+            api = HedgedApi(api, self._hedging)
+        if self._capture is not None:
+            api = CapturingApi(api, self._capture)
+        return api
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self._api_client.close()
+        if is_throttling(exc_val):
+            self._credentials.throttle(self._credential, get_retry_after(exc_val))
+        await self._close()
+
+    async def _close(self):
+        try:
+            await self._api_client.close()
+        finally:
+            self._credentials.release(self._credential)
 
     async def _ensure_active_access_token(self):
-        active_token = await self._access_token_gateway.get_access_token()
+        active_token = await self._credential.token_service.get_access_token()
         self._configuration.access_token = active_token
 
 
-def api_session_factory(access_token_gateway: AccessTokenGatewayProtocol,
+def api_session_factory(credentials: CredentialPool,
                         configuration: Configuration, api_type: Optional[ApiType] = None, *,
-                        ensure_access_token_activeness: bool = True) -> Callable[..., ApiSession]:
+                        ensure_access_token_activeness: bool = True,
+                        hedging: Optional[RequestHedging] = None,
+                        capture: Optional[TrafficRecorder] = None) -> Callable[..., ApiSession]:
+    """Sessions are authorized as a credential picked by the pool, unless one is given"""
     if api_type:
-        def _make_session():
-            return ApiSession(api_type, access_token_gateway, configuration,
-                              ensure_access_token_is_active=ensure_access_token_activeness)
+        def _make_session(credential: Optional[PooledCredential] = None):
+            return ApiSession(api_type, credentials, configuration,
+                              ensure_access_token_is_active=ensure_access_token_activeness, hedging=hedging,
+                              capture=capture, credential=credential)
     else:
-        def _make_session(api_type: ApiType):
-            return ApiSession(api_type, access_token_gateway, configuration,
-                              ensure_access_token_is_active=ensure_access_token_activeness)
+        def _make_session(api_type: ApiType, credential: Optional[PooledCredential] = None):
+            return ApiSession(api_type, credentials, configuration,
+                              ensure_access_token_is_active=ensure_access_token_activeness, hedging=hedging,
+                              capture=capture, credential=credential)
 
     return _make_session
@@ -0,0 +1,42 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Coroutine
+
+
+logger = logging.getLogger('background_tasks')
+
+
+class BackgroundTasks:
+    """
+    Keeps track of tasks that run alongside update processing, so that all of them are cancelled on shutdown
+    """
+
+    def __init__(self):
+        self._tasks: set[asyncio.Task] = set()
+
+    def start(self, coro: Coroutine, name: str) -> asyncio.Task:
+        task = asyncio.create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def start_periodic(self, func: Callable[[], Awaitable], interval: float, name: str, *,
+                       immediately: bool = False) -> asyncio.Task:
+        return self.start(run_periodically(func, interval, name, immediately=immediately), name)
+
+    async def stop(self):
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run_periodically(func: Callable[[], Awaitable], interval: float, name: str, *, immediately: bool = False):
+    if not immediately:
+        await asyncio.sleep(interval)
+    while True:
+        try:
+            await func()
+        except Exception:
+            logger.exception(f'Periodic task {name} failed')
+        await asyncio.sleep(interval)
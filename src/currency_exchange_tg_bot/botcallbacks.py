@@ -1,21 +1,46 @@
+import abc
+import asyncio
 import json
+import math
 import re
+import time
 import traceback
 from typing import AsyncContextManager, Callable
 import html
 import logging
 
+import aiohttp
 from tabulate import tabulate
 import telegram
 import telegram.ext
-from telegram import Update
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
 from currency_exchange_fapi_client import exceptions as apiexc
 
+from currency_exchange_tg_bot.admission import Admission, AdmissionPolicy, get_update_age
 from currency_exchange_tg_bot.adminsrecord import AdminsRecord
-from currency_exchange_tg_bot.config import TgBotSettings, CurrencyExchangeApiSettings
-from currency_exchange_tg_bot.accesstokens import AccessTokenService
+from currency_exchange_tg_bot.config import TgBotSettings, CurrencyExchangeApiSettings, RatesHistorySettings
+from currency_exchange_tg_bot.accesstokens import CredentialPool
+from currency_exchange_tg_bot.botcommands import KNOWN_COMMANDS
+from currency_exchange_tg_bot.catalog import Catalog, CatalogSnapshot, format_age
+from currency_exchange_tg_bot.commandargs import (CURRENCY_CODE_PATTERN, parse_amount, parse_conversion,
+                                                  parse_currency_code, parse_currency_pair, parse_currency_pairs,
+                                                  parse_exchange_rate, parse_new_currency)
+from currency_exchange_tg_bot.export import EXPORT_FIELDS, EXPORT_FORMATS, iter_export, write_spooled
+from currency_exchange_tg_bot.loggingconf import update_log_context
+from currency_exchange_tg_bot.memory import MemoryInspector, render_report
+from currency_exchange_tg_bot.metrics import Metrics
+from currency_exchange_tg_bot.profiling import EventLoopProfiler, ProfilerBusyError, render_stats, dump_stats
+from currency_exchange_tg_bot.ratelimit import RateLimiter
+from currency_exchange_tg_bot.traffic import TrafficRecorder
+from currency_exchange_tg_bot.writecoalescer import WriteCoalescer
+from currency_exchange_tg_bot.digest import Sqlite3DigestRepository
+from currency_exchange_tg_bot.favorites import FavoritesDashboard
+from currency_exchange_tg_bot.currencysearch import CurrencySearchIndex, CurrencyEntry
+from currency_exchange_tg_bot import rawlists
+from currency_exchange_tg_bot.ratematrix import RateMatrix
+from currency_exchange_tg_bot.ratehistory import RateHistoryStore, rate_stats, downsample, sparkline
 
 
 logger = logging.getLogger('tg_bot')
@@ -30,9 +55,12 @@ WELCOMING_MSG = ('Привет! При помощи бота обмена вал
 
 RESPONSE_TABLEFMT = 'psql'
 
-CURRENCY_CODE_PATTERN = re.compile('^ *[a-zA-Z]{3} *$')
+HISTORY_PERIOD_PATTERN = re.compile('^(\\d{1,4})([hdw])$')
 
-CURRENCY_AMOUNT_PATTERN = re.compile('-?\\d+(\\.\\d+)?')
+HISTORY_PERIOD_UNITS = {'h': 3600, 'd': 86400, 'w': 604800}
+
+# failures of the service itself, as opposed to it answering that something is missing or conflicting
+BACKEND_ERRORS = (apiexc.ApiException, aiohttp.ClientError, TimeoutError)
 
 
 def make_currencies_table(data: list[tuple[str, str, str]]):
@@ -43,6 +71,150 @@ def make_exchange_rates_table(data: list[tuple[str, str, float]]):
     return tabulate(data, tablefmt=RESPONSE_TABLEFMT)
 
 
+def make_data_age_note(snapshot: CatalogSnapshot) -> str:
+    return f'Данные получены {format_age(snapshot.age())} назад, сервис сейчас не отвечает или обновляется\n'
+
+
+def get_update_command(update: Update) -> str | None:
+    message_text = update.effective_message.text if update.effective_message else None
+    if message_text and message_text.startswith('/'):
+        return message_text.split(maxsplit=1)[0][1:].split('@')[0]
+    return None
+
+
+def get_command_label(command: str | None) -> str:
+    """Command as a metric label, unknown ones share a label so that arbitrary text doesn't make new series"""
+    if command is None:
+        return ''
+    return command if command in KNOWN_COMMANDS else 'other'
+
+
+async def bind_update_log_context(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    update_log_context.set({
+        'bot': context.bot.username,
+        'update_id': update.update_id,
+        'chat_id': update.effective_chat.id if update.effective_chat else None,
+        'command': get_update_command(update),
+    })
+
+
+class TrafficCaptureCallback:
+
+    def __init__(self, recorder: TrafficRecorder):
+        self._recorder = recorder
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        self._recorder.record_update(update.to_dict())
+
+
+class AdmissionControlCallback:
+    """
+    Runs before the rate limiter and sheds load while the bot can't keep up with the traffic: reads that the catalog
+    can answer are served from it, other updates that a handler would answer get a short "busy" reply (button
+    presses get it as the answer to the query), and the rest, as well as updates too old for a reply, are dropped
+    silently. Replies are sent in the background, so shedding an update takes no Bot API round trip.
+    Admins are never shed
+    """
+
+    def __init__(self, policy: AdmissionPolicy, catalog: Catalog, admins_rec: AdminsRecord, metrics: Metrics):
+        self._policy = policy
+        self._catalog = catalog
+        self._admins_rec = admins_rec
+        self._metrics = metrics
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        pending_updates = context.application.update_queue.qsize()
+        update_age = get_update_age(update)
+        self._metrics.observe('update_age_seconds', update_age)
+        user_id = update.effective_user.id if update.effective_user else None
+        command = get_update_command(update)
+        # handlers are only asked under overload, when the answer matters
+        is_answerable = (not self._policy.is_overloaded(pending_updates, update_age)
+                         or self._is_answerable(update, context.application))
+        admission = self._policy.decide(pending_updates, update_age, command,
+                                        user_id is not None and self._admins_rec.is_admin(user_id), is_answerable)
+        if admission is Admission.ADMIT:
+            return
+
+        self._metrics.increment('shed_updates_total', admission=admission.value,
+                                command=get_command_label(command))
+        logger.info('Update is shed (%s): %d updates pending, %.1f s old', admission.value, pending_updates,
+                    update_age)
+        text = None
+        if admission is Admission.SERVE_CACHED:
+            text = self._answer_from_catalog(command, update.effective_message.text.split()[1:])
+        if text is None and admission is not Admission.DROP:
+            text = 'Бот сейчас перегружен\U0001F975 Попробуй еще раз через минуту'
+        if text is not None and update.callback_query is not None:
+            context.application.create_task(update.callback_query.answer(text=text), update=update)
+        elif text is not None and update.effective_chat is not None:
+            context.application.create_task(
+                context.bot.send_message(chat_id=update.effective_chat.id, text=text,
+                                         parse_mode=telegram.constants.ParseMode.HTML),
+                update=update
+            )
+        raise telegram.ext.ApplicationHandlerStop
+
+    @staticmethod
+    def _is_answerable(update: Update, application: telegram.ext.Application) -> bool:
+        # conversation handlers only take replies of conversations in progress, command handlers only known commands
+        for handler in application.handlers.get(0, ()):
+            check = handler.check_update(update)
+            if check is not None and check is not False:
+                return True
+        return False
+
+    def _answer_from_catalog(self, command: str, args: list[str]) -> str | None:
+        snapshot = self._catalog.snapshot
+        if snapshot is None or not args:
+            return None
+        if command == 'showcurrency':
+            code = parse_currency_code(' '.join(args))
+            row = snapshot.find_currency(code) if code else None
+            table = make_currencies_table([row]) if row else None
+        else:
+            pair = parse_currency_pair(' '.join(args))
+            row = snapshot.find_rate(*pair) if pair else None
+            table = make_exchange_rates_table([row]) if row else None
+        if table is None:
+            return None
+        return f'{make_data_age_note(snapshot)}<pre>{html.escape(table)}</pre>'
+
+
+class RateLimitCallback:
+    """
+    Runs before the command handlers and stops handling of an update when its user or chat is over the limit.
+    Only the first limited update gets a reply, the following ones are dropped silently
+    """
+
+    def __init__(self, limiter: RateLimiter, admins_rec: AdminsRecord, metrics: Metrics, settings: TgBotSettings):
+        self._limiter = limiter
+        self._admins_rec = admins_rec
+        self._metrics = metrics
+        self._settings = settings
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user_id = update.effective_user.id if update.effective_user else None
+        chat_id = update.effective_chat.id if update.effective_chat else None
+        if user_id is not None and self._admins_rec.is_admin(user_id):
+            return
+
+        command = get_update_command(update)
+        cost = self._settings.rate_limit_command_costs.get(command, self._settings.rate_limit_default_cost)
+        scope, retry_after = self._limiter.acquire(user_id, chat_id, cost)
+        if scope is None:
+            return
+
+        self._metrics.increment('rate_limited_updates_total', scope=scope, command=get_command_label(command))
+        logger.info('Update is rate limited by %s bucket, retry after %.1f s', scope, retry_after)
+        if chat_id is not None and self._limiter.should_notify(scope, user_id, chat_id):
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text=f'Слишком много запросов\U0001F975 Попробуй еще раз через {math.ceil(retry_after)} с.'
+            )
+        raise telegram.ext.ApplicationHandlerStop
+
+
 class BaseCallback:
 
     def __init__(self, api_session_factory: Callable[..., AsyncContextManager],
@@ -75,73 +247,169 @@ class StartCallback(BaseCallback):
         await context.bot.send_message(chat_id=update.effective_chat.id, text=WELCOMING_MSG+chat_id_msg)
 
 
-class GetAllCurrenciesCallback(BaseCallback):
+class BaseCatalogCallback:
+    """Serves listings from the catalog, data older than the catalog max age is marked with its age"""
+
+    def __init__(self, catalog: Catalog):
+        self._catalog = catalog
+
+    def _data_age_note(self, snapshot: CatalogSnapshot) -> str:
+        return make_data_age_note(snapshot) if self._catalog.is_stale(snapshot) else ''
+
+
+class GetAllCurrenciesCallback(BaseCatalogCallback):
 
     async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        async with self.api_session() as api:
-            response = await api.currency_exchange_get_all_currencies(_request_timeout=self.api_settings.request_timeout)
-            msg = html.escape(make_currencies_table([(crncy.code, crncy.name, crncy.sign) for crncy in response]))
+        snapshot = await self._catalog.get()
+        msg = html.escape(make_currencies_table(snapshot.currencies))
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
-            text=f'<pre>{msg}</pre>',
+            text=f'{self._data_age_note(snapshot)}<pre>{msg}</pre>',
             parse_mode=telegram.constants.ParseMode.HTML
         )
 
 
-class GetAllExchangeRatesCallback(BaseCallback):
+class GetAllExchangeRatesCallback(BaseCatalogCallback):
 
     async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        async with self.api_session() as api:
-            response = await api.currency_exchange_get_all_exchange_rates(
-                _request_timeout=self.api_settings.request_timeout
-            )
-        msg = html.escape(
-            make_exchange_rates_table([(er.base_currency.code, er.target_currency.code, er.rate) for er in response])
-        )
+        snapshot = await self._catalog.get()
+        msg = html.escape(make_exchange_rates_table(snapshot.rates))
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
-            text=f'<pre>{msg}</pre>',
+            text=f'{self._data_age_note(snapshot)}<pre>{msg}</pre>',
             parse_mode=telegram.constants.ParseMode.HTML
         )
 
 
+class ExportCallback(BaseCatalogCallback):
+    """Sends a table of the catalog as a csv or json document"""
+
+    def __init__(self, catalog: Catalog, settings: TgBotSettings):
+        self._settings = settings
+        super().__init__(catalog)
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        args = [arg.lower() for arg in context.args or []]
+        formats = [arg for arg in args if arg in EXPORT_FORMATS]
+        tables = [arg for arg in args if arg in EXPORT_FIELDS]
+        if len(formats) > 1 or len(tables) > 1 or len(formats) + len(tables) != len(args):
+            await context.bot.send_message(chat_id=update.effective_chat.id,
+                                           text='Использование: /export [csv|json] [currencies|rates]')
+            return
+        export_format = formats[0] if formats else 'csv'
+        table = tables[0] if tables else 'rates'
+
+        snapshot = await self._catalog.get()
+        # the document is written row by row into a buffer that goes to disk once it's big
+        document = await asyncio.to_thread(write_spooled, iter_export(snapshot, table, export_format),
+                                           self._settings.export_max_memory)
+        try:
+            fetched_at = time.strftime('%Y%m%d-%H%M%S', time.gmtime(snapshot.fetched_at))
+            await context.bot.send_document(
+                chat_id=update.effective_chat.id,
+                document=document,
+                filename=f'{table}-{fetched_at}.{export_format}',
+                caption=self._data_age_note(snapshot) or None
+            )
+        finally:
+            document.close()
+
+
 class GetCurrencyConversationCallbacks(BaseCallback, BaseTextConversationCallbacks):
 
     ENTER_CODE = 1
 
+    FOUND_CURRENCY_CALLBACK_PREFIX = 'currency:'
+
     _input_pattern = CURRENCY_CODE_PATTERN
 
+    def __init__(self, search_index: CurrencySearchIndex, catalog: Catalog, *args, **kwargs):
+        self._search_index = search_index
+        self._catalog = catalog
+        super().__init__(*args, **kwargs)
+
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        await context.bot.send_message(chat_id=update.effective_chat.id, text='Отправь код валюты (три латинские буквы)')
+        if context.args:
+            return await self._send_currency_or_search_results(update, context, ' '.join(context.args))
+
+        await context.bot.send_message(chat_id=update.effective_chat.id,
+                                       text='Отправь код валюты (три латинские буквы) или часть её названия')
 
         return self.ENTER_CODE
 
     async def send_currency(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        return await self._send_currency_or_search_results(update, context, update.message.text)
+
+    async def send_found_currency(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        await query.answer()
+        currency = self._search_index.get(query.data.removeprefix(self.FOUND_CURRENCY_CALLBACK_PREFIX))
+        if currency is None:
+            await context.bot.send_message(chat_id=update.effective_chat.id,
+                                           text='Такую валюту найти не получилось\U0001F937')
+            return
+
+        msg = html.escape(make_currencies_table([(currency.code, currency.name, currency.sign)]))
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f'<pre>{msg}</pre>',
+            parse_mode=telegram.constants.ParseMode.HTML
+        )
+
+    async def _send_currency_or_search_results(self, update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
         bot = context.bot
-        code = update.message.text
-        if not self._is_valid_code_input(code):
-            await bot.send_message(chat_id=update.effective_chat.id, text='Какой-то неправильный код валюты\U0001F615')
+        if not self._is_valid_code_input(text):
+            found = self._search_index.search(text)
+            if found:
+                await self._send_search_results(update, context, found)
+            else:
+                await bot.send_message(chat_id=update.effective_chat.id,
+                                       text='Какой-то неправильный код валюты\U0001F615')
             return self.END
-        code = code.upper()
+        code = text.strip().upper()
+        note = ''
         try:
             async with self.api_session() as api:
                 currency = await api.currency_exchange_get_currency(code,
                                                                     _request_timeout=self.api_settings.request_timeout)
+            row = (currency.code, currency.name, currency.sign)
         except apiexc.NotFoundException:
-            await bot.send_message(chat_id=update.effective_chat.id,
-                                   text='Такую валюту найти не получилось\U0001F937')
+            # three letters may as well be a word of a name, e.g. "yen"
+            found = self._search_index.search(text)
+            if found:
+                await self._send_search_results(update, context, found)
+            else:
+                await bot.send_message(chat_id=update.effective_chat.id,
+                                       text='Такую валюту найти не получилось\U0001F937')
             return self.END
+        except BACKEND_ERRORS:
+            snapshot = self._catalog.snapshot
+            row = snapshot.find_currency(code) if snapshot else None
+            if row is None:
+                raise
+            logger.warning('Service failed to return currency %s, it is served from the catalog', code, exc_info=True)
+            note = make_data_age_note(snapshot)
 
-        msg = make_currencies_table([(currency.code, currency.name, currency.sign)])
+        msg = html.escape(make_currencies_table([row]))
 
         await bot.send_message(
             chat_id=update.effective_chat.id,
-            text=f'<pre>{msg}</pre>',
+            text=f'{note}<pre>{msg}</pre>',
             parse_mode=telegram.constants.ParseMode.HTML
         )
 
         return self.END
 
+    async def _send_search_results(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                                   found: list[CurrencyEntry]):
+        keyboard = [
+            [InlineKeyboardButton(f'{currency.code} {currency.name} ({currency.sign})',
+                                  callback_data=f'{self.FOUND_CURRENCY_CALLBACK_PREFIX}{currency.code}')]
+            for currency in found
+        ]
+        await context.bot.send_message(chat_id=update.effective_chat.id, text='Вот что нашлось\U0001F50E',
+                                       reply_markup=InlineKeyboardMarkup(keyboard))
+
     def _is_valid_code_input(self, code: str):
         return bool(re.fullmatch(self._input_pattern, code))
 
@@ -150,9 +418,14 @@ class GetExchangeRateCallbacks(BaseCallback, BaseTextConversationCallbacks):
 
     ENTER_CODES = 1
 
-    _input_pattern = re.compile('[a-zA-Z]{3} [a-zA-Z]{3}')
+    def __init__(self, catalog: Catalog, *args, **kwargs):
+        self._catalog = catalog
+        super().__init__(*args, **kwargs)
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if context.args:
+            return await self._send_exchange_rate(update, context, ' '.join(context.args))
+
         await context.bot.send_message(chat_id=update.effective_chat.id,
                                        text='Отправь коды валюты (по три латинских буквы разделенных пробелом, '
                                             'например USD EUR)')
@@ -160,42 +433,60 @@ class GetExchangeRateCallbacks(BaseCallback, BaseTextConversationCallbacks):
         return self.ENTER_CODES
 
     async def send_exchange_rate(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        return await self._send_exchange_rate(update, context, update.message.text)
+
+    async def _send_exchange_rate(self, update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
         bot = context.bot
-        codes = update.message.text
-        if not self._is_valid_codes_input(codes):
-            await bot.send_message(chat_id=update.effective_chat.id, text='Неправильные коды валют\U0001F937')
+        codes = parse_currency_pair(text)
+        if codes is None:
+            await bot.send_message(chat_id=update.effective_chat.id,
+                                   text='Неправильные коды валют\U0001F937 Пример: /showexchangerate USD EUR')
             return self.END
 
+        base, target = codes
+        note = ''
         try:
             async with self.api_session() as api:
-                er = await api.currency_exchange_get_exchange_rate(''.join(codes.upper().split(' ')),
+                er = await api.currency_exchange_get_exchange_rate(f'{base}{target}',
                                                                    _request_timeout=self.api_settings.request_timeout)
+            row = (er.base_currency.code, er.target_currency.code, er.rate)
         except apiexc.NotFoundException:
             await bot.send_message(chat_id=update.effective_chat.id,
                                    text='Такой курс найти не получилось\U0001F937')
             return self.END
+        except BACKEND_ERRORS:
+            snapshot = self._catalog.snapshot
+            row = snapshot.find_rate(base, target) if snapshot else None
+            if row is None:
+                raise
+            logger.warning('Service failed to return exchange rate %s%s, it is served from the catalog', base, target,
+                           exc_info=True)
+            note = make_data_age_note(snapshot)
 
-        msg = html.escape(make_exchange_rates_table([(er.base_currency.code, er.target_currency.code, er.rate)]))
+        msg = html.escape(make_exchange_rates_table([row]))
 
         await bot.send_message(
             chat_id=update.effective_chat.id,
-            text=f'Держи\n<pre>{msg}</pre>',
+            text=f'{note}Держи\n<pre>{msg}</pre>',
             parse_mode=telegram.constants.ParseMode.HTML
         )
 
         return self.END
 
-    def _is_valid_codes_input(self, codes: str):
-        return bool(re.fullmatch(self._input_pattern, codes))
-
 
 class AddCurrencyConversationCallbacks(BaseCallback, BaseTextConversationCallbacks):
 
     ENTER_FIELDS = 1
 
-    _input_pattern = re.compile('^ *([a-zA-z]{3}). +([a-zA-Z ]+), +([^\\s_]+) *$')
+    def __init__(self, search_index: CurrencySearchIndex, catalog: Catalog, *args, **kwargs):
+        self._search_index = search_index
+        self._catalog = catalog
+        super().__init__(*args, **kwargs)
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if context.args:
+            return await self._add_currency(update, context, ' '.join(context.args))
+
         await context.bot.send_message(chat_id=update.effective_chat.id,
                                        text='Отправь код, имя и символ валюты в формате <код, имя, символ> (без скобок).'
                                             ' Код состоит из 3 латинских букв, имя только из латинских букв, '
@@ -204,13 +495,16 @@ class AddCurrencyConversationCallbacks(BaseCallback, BaseTextConversationCallbac
         return self.ENTER_FIELDS
 
     async def add_currency(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        return await self._add_currency(update, context, update.message.text)
+
+    async def _add_currency(self, update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
         bot = context.bot
-        currency_data = update.message.text
-        if not self._is_valid_currency_input(currency_data):
-            await bot.send_message(chat_id=update.effective_chat.id, text='Неправильные данные\U0001F937')
+        currency_data = parse_new_currency(text)
+        if currency_data is None:
+            await bot.send_message(chat_id=update.effective_chat.id,
+                                   text='Неправильные данные\U0001F937 Пример: /addcurrency USD, US Dollar, $')
             return self.END
-        code, name, sign = self._get_data_from_input(currency_data)
-        code = code.upper()
+        code, name, sign = currency_data
 
         try:
             async with self.api_session() as api:
@@ -221,63 +515,77 @@ class AddCurrencyConversationCallbacks(BaseCallback, BaseTextConversationCallbac
                                    text='Валюта с таким кодом уже есть\U0001F611')
             return self.END
 
+        self._search_index.add(added.code, added.name, added.sign)
+        self._catalog.revalidate(changed=True)
         msg = html.escape(make_currencies_table([(added.code, added.name, added.sign)]))
         await bot.send_message(chat_id=update.effective_chat.id,
                                text=f'Добавлено\U0001F44C\n<pre>{msg}</pre>',
                                parse_mode=telegram.constants.ParseMode.HTML)
         return self.END
 
-    def _is_valid_currency_input(self, currency_data: str):
-        return bool(re.fullmatch(self._input_pattern, currency_data))
 
-    def _get_data_from_input(self, currency_data: str) -> tuple:
-        return re.match(self._input_pattern, currency_data).groups()
-
-
-class BaseExchangeRateConversationCallbacks(BaseCallback, BaseTextConversationCallbacks):
+class BaseExchangeRateConversationCallbacks(BaseCallback, BaseTextConversationCallbacks, abc.ABC):
     ENTER_FIELDS = 1
 
-    _input_pattern = re.compile('^ *([a-zA-z]{3}), +([a-zA-z]{3}), +(-?\\d+|\\d+\\.\\d+) *$')
+    _command = ''
+
+    def __init__(self, catalog: Catalog, *args, **kwargs):
+        self._catalog = catalog
+        super().__init__(*args, **kwargs)
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if context.args:
+            return await self._receive_exchange_rate(update, context, ' '.join(context.args))
+
         await context.bot.send_message(chat_id=update.effective_chat.id,
                                        text='Отправь коды валют и курс в формате <код, код, значение_курса> (без скобок).'
                                             ' Код состоит из 3 латинских букв, имя только из латинских букв, символ')
 
         return self.ENTER_FIELDS
 
-    def _is_valid_exchange_rate_input(self, currency_data: str):
-        return bool(re.fullmatch(self._input_pattern, currency_data))
+    @abc.abstractmethod
+    async def _receive_exchange_rate(self, update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+        """Handles the rate entered as the command args or as the reply"""
+
+    async def _parse_exchange_rate(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                                   text: str) -> tuple[str, str, float] | None:
+        """Parsed input, or None once the user is told what's wrong with it"""
+        exchange_rate = parse_exchange_rate(text)
+        if exchange_rate is None:
+            await context.bot.send_message(chat_id=update.effective_chat.id,
+                                           text=f'Неправильные данные\U0001F937 Пример: /{self._command} USD, EUR, 0.92')
+            return None
+        if not self._is_valid_rate(exchange_rate[2]):
+            await context.bot.send_message(chat_id=update.effective_chat.id,
+                                           text='Это как так: курс должен быть строго положительным и больше 0🤔')
+            return None
+        return exchange_rate
 
     def _is_valid_rate(self, rate: float):
         return rate > 0
 
-    def _get_data_from_input(self, currency_data: str) -> tuple:
-        return re.match(self._input_pattern, currency_data).groups()
-
 
 class AddExchangeRateConversationCallbacks(BaseExchangeRateConversationCallbacks):
 
+    _command = 'addexchangerate'
+
     async def add_exchange_rate(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        return await self._receive_exchange_rate(update, context, update.message.text)
+
+    async def _receive_exchange_rate(self, update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
         bot = context.bot
-        currency_data = update.message.text
-        if not self._is_valid_exchange_rate_input(currency_data):
-            await bot.send_message(chat_id=update.effective_chat.id, text='Неправильные данные\U0001F937')
+        exchange_rate = await self._parse_exchange_rate(update, context, text)
+        if exchange_rate is None:
             return self.END
-        base, target, rate = self._get_data_from_input(currency_data)
-        base, target = base.upper(), target.upper()
+        base, target, rate = exchange_rate
         if base == target:
             await bot.send_message(chat_id=update.effective_chat.id, text='Добавлять курс валюты к самой же себе '
                                                                           'не имеет смысла💯')
             return self.END
-        if not self._is_valid_rate(float(rate)):
-            await bot.send_message(chat_id=update.effective_chat.id, text='Это как так: курс должен быть строго '
-                                                                    'положительным и больше 0🤔')
-            return self.END
 
         try:
             async with self.api_session() as api:
-                added = await api.currency_exchange_add_exchange_rate(base.upper(), target.upper(), float(rate),
+                added = await api.currency_exchange_add_exchange_rate(base, target, rate,
                                                                       _request_timeout=self.api_settings.request_timeout)
         except apiexc.ConflictException:
             await bot.send_message(chat_id=update.effective_chat.id,
@@ -291,6 +599,7 @@ class AddExchangeRateConversationCallbacks(BaseExchangeRateConversationCallbacks
         msg = html.escape(
             make_exchange_rates_table([(added.base_currency.code, added.target_currency.code, added.rate)])
         )
+        self._catalog.revalidate(changed=True)
         await bot.send_message(chat_id=update.effective_chat.id,
                                text=f'Добавлено\U0001F44C\n<pre>{msg}</pre>',
                                parse_mode=telegram.constants.ParseMode.HTML)
@@ -299,44 +608,48 @@ class AddExchangeRateConversationCallbacks(BaseExchangeRateConversationCallbacks
 
 class UpdateExchangeRateConversationCallbacks(BaseExchangeRateConversationCallbacks):
 
+    _command = 'editexchangerate'
+
+    def __init__(self, writes: WriteCoalescer, *args, **kwargs):
+        self._writes = writes
+        super().__init__(*args, **kwargs)
+
     async def update_exchange_rate(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        bot = context.bot
-        currency_data = update.message.text.upper()
-        if not self._is_valid_exchange_rate_input(currency_data):
-            await bot.send_message(chat_id=update.effective_chat.id, text='Неправильные данные\U0001F937')
-            return self.END
+        return await self._receive_exchange_rate(update, context, update.message.text)
 
-        base, target, rate = self._get_data_from_input(currency_data)
-        if not self._is_valid_rate(float(rate)):
-            await bot.send_message(chat_id=update.effective_chat.id, text='Это как так: курс должен быть строго '
-                                                                    'положительным и больше 0🤔')
+    async def _receive_exchange_rate(self, update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+        exchange_rate = await self._parse_exchange_rate(update, context, text)
+        if exchange_rate is None:
             return self.END
+        base, target, rate = exchange_rate
+        # writes of a pair are held for a short window to be coalesced, the reply is sent once the write is done
+        # without holding up the updates behind this one
+        context.application.create_task(self._update_and_reply(update, context, base, target, rate), update=update)
+        return self.END
 
+    async def _update_and_reply(self, update: Update, context: ContextTypes.DEFAULT_TYPE, base: str, target: str,
+                                rate: float):
+        bot = context.bot
         try:
-            async with self.api_session() as api:
-                updated = await api.currency_exchange_update_exchange_rate(
-                    f'{base}{target}', float(rate), _request_timeout=self.api_settings.request_timeout
-                )
+            updated = await self._writes.submit((base, target), rate)
         except apiexc.NotFoundException:
             await bot.send_message(chat_id=update.effective_chat.id,
                                    text='Такого курса нет, чтобы его менять🧐')
-            return self.END
+            return
 
         msg = html.escape(
             make_exchange_rates_table([(updated.base_currency.code, updated.target_currency.code, updated.rate)])
         )
+        self._catalog.revalidate(changed=True)
         await bot.send_message(chat_id=update.effective_chat.id,
                                text=f'Изменено\U0001F44C\n<pre>{msg}</pre>',
                                parse_mode=telegram.constants.ParseMode.HTML)
-        return self.END
 
 
 class ConvertCurrencyConversationCallbacks(BaseCallback, BaseTextConversationCallbacks):
 
     ENTER_BASE, ENTER_TARGET, ENTER_AMOUNT = range(3)
 
-    _currency_code_pattern = CURRENCY_CODE_PATTERN
-    _currency_amount_pattern = CURRENCY_AMOUNT_PATTERN
     _invalid_code_entered_msg = 'Неправильный код🤨'
 
     _user_codes: dict[int, list[str]]
@@ -345,7 +658,25 @@ class ConvertCurrencyConversationCallbacks(BaseCallback, BaseTextConversationCal
         self._user_codes = {}
         super().__init__(*args, **kwargs)
 
+    @property
+    def conversations_in_progress(self) -> int:
+        return len(self._user_codes)
+
+    async def received_not_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        self._user_codes.pop(update.effective_user.id, None)
+        return await super().received_not_text(update, context)
+
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if context.args:
+            # one call to the service does it all, unknown currencies are reported by it as an unknown rate
+            conversion = parse_conversion(' '.join(context.args))
+            if conversion is None or not self._is_valid_amount_input(conversion[0]):
+                await context.bot.send_message(chat_id=update.effective_chat.id,
+                                               text='Неправильные данные🧐 Пример: /convertcurrency 100 USD EUR')
+                return self.END
+            amount, base, target = conversion
+            return await self._convert(update, context, base, target, amount)
+
         await context.bot.send_message(chat_id=update.effective_chat.id,
                                        text='Отправь конвертируемую валюту (код из 3 латинских букв)')
         self._user_codes[update.effective_user.id] = []
@@ -355,8 +686,9 @@ class ConvertCurrencyConversationCallbacks(BaseCallback, BaseTextConversationCal
     async def receive_currency(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
         bot = context.bot
-        code = update.message.text.upper()
-        if not self._is_valid_currency_code(code):
+        code = parse_currency_code(update.message.text)
+        if code is None:
+            self._user_codes.pop(user_id, None)
             await bot.send_message(chat_id=update.effective_chat.id, text=self._invalid_code_entered_msg)
             return self.END
 
@@ -364,6 +696,7 @@ class ConvertCurrencyConversationCallbacks(BaseCallback, BaseTextConversationCal
             async with self.api_session() as api:
                 await api.currency_exchange_get_currency(code, _request_timeout=self.api_settings.request_timeout)
         except apiexc.NotFoundException:
+            self._user_codes.pop(user_id, None)
             await bot.send_message(chat_id=update.effective_chat.id, text='Сожалею, но такая валюта мне неизвестна☹')
             return self.END
 
@@ -378,23 +711,25 @@ class ConvertCurrencyConversationCallbacks(BaseCallback, BaseTextConversationCal
             return self.ENTER_TARGET
 
     async def receive_amount(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        bot = context.bot
-        try:
-            amount = float(update.message.text)
-            if not self._is_valid_amount_input(amount):
-                raise ValueError
-        except ValueError:
-            await bot.send_message(chat_id=update.effective_chat.id, text='Неправильное количество🧐')
+        base, target = self._user_codes.pop(update.effective_user.id)
+        amount = parse_amount(update.message.text)
+        if amount is None or not self._is_valid_amount_input(amount):
+            await context.bot.send_message(chat_id=update.effective_chat.id, text='Неправильное количество🧐')
             return self.END
 
+        return await self._convert(update, context, base, target, amount)
+
+    async def _convert(self, update: Update, context: ContextTypes.DEFAULT_TYPE, base: str, target: str,
+                       amount: float):
+        bot = context.bot
         try:
             async with self.api_session() as api:
-                base, target = self._user_codes[update.effective_user.id]
                 converted = await api.currency_exchange_convert_currencies(
                     base, target, amount, _request_timeout=self.api_settings.request_timeout
                 )
         except apiexc.NotFoundException:
             await bot.send_message(chat_id=update.effective_chat.id, text='Извини, но я не знаю такого курса☹')
+            return self.END
 
         answer = (f'Вот:*\n{converted.amount} {converted.base_currency.code} = '
                   f'{converted.converted_amount} {converted.target_currency.code}*, '
@@ -403,13 +738,147 @@ class ConvertCurrencyConversationCallbacks(BaseCallback, BaseTextConversationCal
                                parse_mode=telegram.constants.ParseMode.MARKDOWN)
         return self.END
 
-    def _is_valid_currency_code(self, currency_code: str):
-        return bool(re.fullmatch(self._currency_code_pattern, currency_code))
-
     def _is_valid_amount_input(self, amount: float):
         return amount > 0
 
 
+class RateHistoryCallback(BaseCallback):
+
+    _default_period = '30d'
+
+    def __init__(self, store: RateHistoryStore, history_settings: RatesHistorySettings, *args, **kwargs):
+        self._store = store
+        self._history_settings = history_settings
+        super().__init__(*args, **kwargs)
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        bot = context.bot
+        args = context.args or []
+        if len(args) == 2:
+            args = [*args, self._default_period]
+        if len(args) != 3 or not all(re.fullmatch(CURRENCY_CODE_PATTERN, code) for code in args[:2]):
+            await bot.send_message(chat_id=update.effective_chat.id,
+                                   text='Отправь коды валют и период, например /history USD EUR 30d '
+                                        '(период в часах h, днях d или неделях w)')
+            return
+        period = re.fullmatch(HISTORY_PERIOD_PATTERN, args[2].lower())
+        if period is None:
+            await bot.send_message(chat_id=update.effective_chat.id, text='Неправильный период🧐')
+            return
+
+        base, target = args[0].upper(), args[1].upper()
+        end = time.time()
+        start = end - int(period.group(1)) * HISTORY_PERIOD_UNITS[period.group(2)]
+        # reading and aggregating the series is file IO and number crunching, kept off the event loop
+        series = await asyncio.to_thread(self._store.query, base, target, start, end)
+        stats = rate_stats(series)
+        if stats is None:
+            await bot.send_message(chat_id=update.effective_chat.id,
+                                   text='Истории этого курса за такой период у меня нет\U0001F937')
+            return
+
+        line = sparkline(downsample(series, self._history_settings.sparkline_width))
+        msg = html.escape(
+            f'{base}/{target} за {args[2].lower()}\n'
+            f'мин {stats.min:g}, макс {stats.max:g}, среднее {stats.avg:g}\n'
+            f'изменений: {stats.changes}\n'
+            f'{line}'
+        )
+        await bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f'<pre>{msg}</pre>',
+            parse_mode=telegram.constants.ParseMode.HTML
+        )
+
+
+class DigestSubscriptionCallbacks:
+
+    def __init__(self, repo: Sqlite3DigestRepository, max_pairs: int):
+        self._repo = repo
+        self._max_pairs = max_pairs
+
+    async def subscribe(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        pairs = parse_currency_pairs(context.args)
+        if not pairs:
+            await context.bot.send_message(chat_id=update.effective_chat.id,
+                                           text='Отправь пары кодов валют, например /subscribe USD EUR USD RUB')
+            return
+        chat_id = update.effective_chat.id
+        subscribed = await asyncio.to_thread(self._repo.get_pairs, chat_id)
+        if len(set(subscribed) | set(pairs)) > self._max_pairs:
+            await context.bot.send_message(chat_id=chat_id,
+                                           text=f'В сводке может быть не больше {self._max_pairs} курсов\U0001F62C')
+            return
+        await asyncio.to_thread(self._repo.subscribe, chat_id, pairs)
+        await self._send_pairs(update, context, 'Подписка на ежедневную сводку оформлена\U0001F44C')
+
+    async def unsubscribe(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        chat_id = update.effective_chat.id
+        if context.args:
+            pairs = parse_currency_pairs(context.args)
+            if not pairs:
+                await context.bot.send_message(chat_id=chat_id, text='Неправильные коды валют\U0001F937')
+                return
+            await asyncio.to_thread(self._repo.unsubscribe, chat_id, pairs)
+            await self._send_pairs(update, context, 'Готово\U0001F44C')
+        else:
+            await asyncio.to_thread(self._repo.unsubscribe, chat_id)
+            await context.bot.send_message(chat_id=chat_id, text='Ежедневная сводка больше не придет\U0001F44B')
+
+    async def _send_pairs(self, update: Update, context: ContextTypes.DEFAULT_TYPE, title: str):
+        pairs = await asyncio.to_thread(self._repo.get_pairs, update.effective_chat.id)
+        listed = ', '.join(f'{base}/{target}' for base, target in pairs) or 'пусто'
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=f'{title}\nКурсы в сводке: {listed}')
+
+
+class FavoritesCallbacks:
+
+    def __init__(self, dashboard: FavoritesDashboard, max_pairs: int):
+        self._dashboard = dashboard
+        self._max_pairs = max_pairs
+
+    async def add(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        pairs = parse_currency_pairs(context.args)
+        if not pairs:
+            await context.bot.send_message(chat_id=update.effective_chat.id,
+                                           text='Отправь пары кодов валют, например /addfavorite USD EUR USD RUB')
+            return
+        user_id = update.effective_user.id
+        favorites = await self._dashboard.get_pairs(user_id)
+        if len(set(favorites) | set(pairs)) > self._max_pairs:
+            await context.bot.send_message(chat_id=update.effective_chat.id,
+                                           text=f'В избранном может быть не больше {self._max_pairs} курсов\U0001F62C')
+            return
+        await self._dashboard.add(user_id, pairs)
+        await self._send_pairs(update, context, 'Добавлено в избранное\U0001F44C')
+
+    async def remove(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        pairs = None
+        if context.args:
+            pairs = parse_currency_pairs(context.args)
+            if not pairs:
+                await context.bot.send_message(chat_id=update.effective_chat.id,
+                                               text='Неправильные коды валют\U0001F937')
+                return
+        await self._dashboard.remove(update.effective_user.id, pairs)
+        await self._send_pairs(update, context, 'Готово\U0001F44C')
+
+    async def show(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        text = await self._dashboard.render(update.effective_user.id)
+        if text is None:
+            await context.bot.send_message(chat_id=update.effective_chat.id,
+                                           text='В избранном пока пусто, добавь курсы, например '
+                                                '/addfavorite USD EUR USD RUB')
+            return
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=text,
+                                       parse_mode=telegram.constants.ParseMode.HTML)
+
+    async def _send_pairs(self, update: Update, context: ContextTypes.DEFAULT_TYPE, title: str):
+        pairs = await self._dashboard.get_pairs(update.effective_user.id)
+        listed = ', '.join(f'{base}/{target}' for base, target in pairs) or 'пусто'
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=f'{title}\nИзбранные курсы: {listed}')
+
+
 class AdminAllowedCallbackMixin:
 
     _admins_rec: AdminsRecord
@@ -420,8 +889,8 @@ class AdminAllowedCallbackMixin:
 
 class RevokeTokensCallback(BaseCallback, AdminAllowedCallbackMixin):
 
-    def __init__(self, tokens_service: AccessTokenService, admins_rec: AdminsRecord, *args, **kwargs):
-        self._tokens_service = tokens_service
+    def __init__(self, credentials: CredentialPool, admins_rec: AdminsRecord, *args, **kwargs):
+        self._credentials = credentials
         self._admins_rec = admins_rec
         super().__init__(*args, **kwargs)
 
@@ -429,29 +898,196 @@ class RevokeTokensCallback(BaseCallback, AdminAllowedCallbackMixin):
         if not self.is_request_from_admin(update):
             return
 
-        async with self.api_session() as api:
-            revoked = await api.auth_revoke_users_token(_request_timeout=self.api_settings.request_timeout)
+        # tokens are revoked for each account of the pool, a session is authorized as one account
+        revoked = 0
+        for credential in self._credentials.credentials:
+            async with self.api_session(credential) as api:
+                response = await api.auth_revoke_users_token(_request_timeout=self.api_settings.request_timeout)
+            revoked += len(response.revoked)
 
-        self._tokens_service.remove_all_tokens()
-        self._tokens_service.invalidate_cached_access_token()
+        self._credentials.remove_all_tokens()
+        self._credentials.invalidate_cached_access_token()
 
-        await context.bot.send_message(chat_id=update.effective_chat.id, text=f'Revoked {len(revoked.revoked)} tokens')
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=f'Revoked {revoked} tokens')
 
 
 class ExpungeTokensCallback(AdminAllowedCallbackMixin):
 
-    def __init__(self, tokens_service: AccessTokenService, admins_rec: AdminsRecord):
-        self._tokens_service = tokens_service
+    def __init__(self, credentials: CredentialPool, admins_rec: AdminsRecord):
+        self._credentials = credentials
         self._admins_rec = admins_rec
 
     async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not self.is_request_from_admin(update):
             return
-        self._tokens_service.remove_all_tokens()
-        self._tokens_service.invalidate_cached_access_token()
+        self._credentials.remove_all_tokens()
+        self._credentials.invalidate_cached_access_token()
         await context.bot.send_message(chat_id=update.effective_chat.id, text='All tokens removed')
 
 
+class MetricsCallback(AdminAllowedCallbackMixin):
+
+    def __init__(self, metrics: Metrics, admins_rec: AdminsRecord):
+        self._metrics = metrics
+        self._admins_rec = admins_rec
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not self.is_request_from_admin(update):
+            return
+        rendered = self._metrics.render()
+        if not rendered:
+            await context.bot.send_message(chat_id=update.effective_chat.id, text='No metrics recorded yet')
+            return
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f'<pre>{html.escape(rendered)}</pre>',
+            parse_mode=telegram.constants.ParseMode.HTML
+        )
+
+
+class ProfileCallback(AdminAllowedCallbackMixin):
+
+    def __init__(self, profiler: EventLoopProfiler, admins_rec: AdminsRecord, settings: TgBotSettings):
+        self._profiler = profiler
+        self._admins_rec = admins_rec
+        self._settings = settings
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not self.is_request_from_admin(update):
+            return
+
+        args = [arg.lower() for arg in context.args or []]
+        raw = 'raw' in args
+        args = [arg for arg in args if arg != 'raw']
+        duration = self._settings.profile_default_duration
+        if args:
+            try:
+                duration = float(args[0])
+            except ValueError:
+                duration = None
+        if len(args) > 1 or duration is None or not 0 < duration <= self._settings.profile_max_duration:
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id,
+                text=f'Usage: /profile [seconds, up to {self._settings.profile_max_duration:g}] [raw]'
+            )
+            return
+        if self._profiler.running:
+            await context.bot.send_message(chat_id=update.effective_chat.id, text='Profiling is already running')
+            return
+
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=f'Profiling for {duration:g} s')
+        # updates are handled one by one, so the profiling runs as a task to let the traffic through meanwhile
+        context.application.create_task(
+            self._profile_and_send(update.effective_chat.id, context.bot, duration, raw), update=update
+        )
+
+    async def _profile_and_send(self, chat_id: int, bot: telegram.Bot, duration: float, raw: bool):
+        try:
+            profiler = await self._profiler.profile(duration)
+        except ProfilerBusyError:
+            await bot.send_message(chat_id=chat_id, text='Profiling is already running')
+            return
+
+        report = await asyncio.to_thread(render_stats, profiler)
+        await bot.send_document(chat_id=chat_id, document=report.encode('utf-8'), filename='profile.txt',
+                                caption=f'Event loop profile for {duration:g} s')
+        if raw:
+            await bot.send_document(chat_id=chat_id, document=dump_stats(profiler), filename='profile.pstats',
+                                    caption='Load with pstats.Stats(path)')
+
+
+class MemoryCallback(AdminAllowedCallbackMixin):
+
+    def __init__(self, inspector: MemoryInspector, admins_rec: AdminsRecord):
+        self._inspector = inspector
+        self._admins_rec = admins_rec
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not self.is_request_from_admin(update):
+            return
+
+        args = [arg.lower() for arg in context.args or []]
+        if args == ['trace']:
+            self._inspector.start_tracing()
+        elif args == ['stop']:
+            self._inspector.stop_tracing()
+            await context.bot.send_message(chat_id=update.effective_chat.id, text='Tracing stopped')
+            return
+        elif args:
+            await context.bot.send_message(chat_id=update.effective_chat.id, text='Usage: /memory [trace|stop]')
+            return
+
+        # snapshots and object counts walk the whole heap, the loop shouldn't wait for it
+        report = render_report(await asyncio.to_thread(self._inspector.report))
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f'<pre>{html.escape(report)}</pre>',
+            parse_mode=telegram.constants.ParseMode.HTML
+        )
+
+
+class BaseRateMatrixCallback(BaseCallback, AdminAllowedCallbackMixin):
+
+    def __init__(self, admins_rec: AdminsRecord, *args, tolerance: float, **kwargs):
+        self._admins_rec = admins_rec
+        self._tolerance = tolerance
+        super().__init__(*args, **kwargs)
+
+    async def _build_rate_matrix(self) -> RateMatrix:
+        async with self.api_session() as api:
+            if self.api_settings.raw_list_responses:
+                rates = await rawlists.get_all_exchange_rates(api, self.api_settings.request_timeout)
+            else:
+                response = await api.currency_exchange_get_all_exchange_rates(
+                    _request_timeout=self.api_settings.request_timeout
+                )
+                rates = [(er.base_currency.code, er.target_currency.code, float(er.rate)) for er in response]
+        # computing cross rates is cubic in the number of currencies, so it's kept off the event loop
+        return await asyncio.to_thread(RateMatrix.from_rates, rates, tolerance=self._tolerance)
+
+
+class RateMatrixCallback(BaseRateMatrixCallback):
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not self.is_request_from_admin(update):
+            return
+
+        matrix = await self._build_rate_matrix()
+        document = await asyncio.to_thread(matrix.to_csv)
+        await context.bot.send_document(
+            chat_id=update.effective_chat.id,
+            document=document.encode('utf-8'),
+            filename='rate_matrix.csv',
+            caption=f'Best cross rates between {len(matrix.codes)} currencies (row is base, column is target)'
+        )
+
+
+class ArbitrageCallback(BaseRateMatrixCallback):
+
+    _max_reported_cycles = 20
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not self.is_request_from_admin(update):
+            return
+
+        matrix = await self._build_rate_matrix()
+        cycles = await asyncio.to_thread(matrix.cycles)
+        if not cycles:
+            await context.bot.send_message(chat_id=update.effective_chat.id,
+                                           text=f'No arbitrage cycles among {len(matrix.codes)} currencies')
+            return
+
+        lines = [f'{" -> ".join(cycle.codes)}: +{cycle.profit:.4%}' for cycle in cycles[:self._max_reported_cycles]]
+        if len(cycles) > self._max_reported_cycles:
+            lines.append(f'... and {len(cycles) - self._max_reported_cycles} more')
+        msg = html.escape('\n'.join(lines))
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f'Found {len(cycles)} arbitrage cycles\n<pre>{msg}</pre>',
+            parse_mode=telegram.constants.ParseMode.HTML
+        )
+
+
 class ErrorHandler:
 
     def __init__(self, admins_records: AdminsRecord, settings: TgBotSettings):
@@ -1,21 +1,38 @@
-from telegram import BotCommandScopeChat, BotCommandScope, BotCommandScopeDefault
+import asyncio
+
+from telegram import Bot, BotCommandScopeChat, BotCommandScope, BotCommandScopeDefault
 
 default_commands = [
     ('allcurrencies', 'Показать все валюты, известные боту'),
     ('allexchangerates', 'Показать все обменные курсы, известные боту'),
-    ('showcurrency', 'Показать определенную валюту'),
-    ('showexchangerate', 'Показать определенный обменный курс'),
-    ('addcurrency', 'Добавить валюту'),
-    ('addexchangerate', 'Добавить обменный курс'),
-    ('editexchangerate', 'Поменять значение обменного курса'),
-    ('convertcurrency', 'Конвертировать валюту'),
+    ('export', 'Выгрузить курсы или валюты файлом, например /export json rates'),
+    ('showcurrency', 'Показать определенную валюту или найти валюту по названию, например /showcurrency dollar'),
+    ('showexchangerate', 'Показать определенный обменный курс, например /showexchangerate USD EUR'),
+    ('addcurrency', 'Добавить валюту, например /addcurrency USD, US Dollar, $'),
+    ('addexchangerate', 'Добавить обменный курс, например /addexchangerate USD, EUR, 0.92'),
+    ('editexchangerate', 'Поменять значение обменного курса, например /editexchangerate USD, EUR, 0.93'),
+    ('convertcurrency', 'Конвертировать валюту, например /convertcurrency 100 USD EUR'),
+    ('history', 'Показать историю обменного курса, например /history USD EUR 30d'),
+    ('subscribe', 'Подписаться на ежедневную сводку курсов, например /subscribe USD EUR USD RUB'),
+    ('unsubscribe', 'Убрать курсы из ежедневной сводки или отписаться от нее совсем'),
+    ('myrates', 'Показать избранные курсы одной таблицей'),
+    ('addfavorite', 'Добавить курсы в избранное, например /addfavorite USD EUR USD RUB'),
+    ('removefavorite', 'Убрать курсы из избранного, без кодов валют убирает все'),
 ]
 
 admin_user_commands = [
     ('revoketokens', 'Сделать все имеющиеся у приложения бота токены сервиса недействительными и забыть их'),
-    ('expungetokens', 'Забыть все имеющиеся у приложения бота токены сервиса')
+    ('expungetokens', 'Забыть все имеющиеся у приложения бота токены сервиса'),
+    ('ratematrix', 'Прислать матрицу кросс-курсов между всеми валютами'),
+    ('arbitrage', 'Найти циклы обменных курсов, дающие выгоду (арбитраж или несогласованные курсы)'),
+    ('metrics', 'Показать счетчики работы бота'),
+    ('profile', 'Снять профиль работы бота за N секунд, например /profile 30 raw'),
+    ('memory', 'Показать, чем занята память бота: /memory trace включает трассировку выделений, /memory stop выключает'),
 ]
 
+# commands the bot has handlers for, anything else after a slash is arbitrary text of the user
+KNOWN_COMMANDS = frozenset(['start', *(command for command, _ in default_commands + admin_user_commands)])
+
 
 def get_admin_chats_command_scopes(chat_ids: list[int]) -> list[BotCommandScopeChat]:
     return [BotCommandScopeChat(chat_id) for chat_id in chat_ids]
@@ -24,4 +41,11 @@ def get_commands_and_scopes(admin_chat_ids: list[int]) -> list[tuple[BotCommandS
     default = [(BotCommandScopeDefault(), default_commands)]
     admins_scopes = get_admin_chats_command_scopes(admin_chat_ids)
     admins = [(comscope, admin_user_commands + default_commands) for comscope in admins_scopes]
-    return default + admins
\ No newline at end of file
+    return default + admins
+
+
+async def set_scoped_commands(bot: Bot, admin_chat_ids: list[int]):
+    # scopes are independent of each other, so they are pushed concurrently rather than one by one
+    await asyncio.gather(
+        *(bot.set_my_commands(commands, scope) for scope, commands in get_commands_and_scopes(admin_chat_ids))
+    )
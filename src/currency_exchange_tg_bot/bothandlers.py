@@ -1,62 +1,95 @@
-from telegram.ext import CommandHandler, ConversationHandler, MessageHandler
+from telegram.ext import BaseHandler, CallbackQueryHandler, CommandHandler, ConversationHandler, MessageHandler
 from telegram.ext import filters
 
-from currency_exchange_tg_bot.ioc import (allcurrencies_cb, allexchange_rates_cb, start_cb, get_currency_cbs,
-                                          get_exchange_rate_cbs, add_currency_cbs, add_exchange_rate_cbs,
-                                          update_exchange_rate_cbs, convert_currency_cbs, revoke_tokens_cb,
-                                          expunge_tokens_cb)
+from currency_exchange_tg_bot.ioc import Container
 
 
-handlers = [
-    CommandHandler('start', start_cb),
-    CommandHandler('allcurrencies', allcurrencies_cb),
-    CommandHandler('allexchangerates', allexchange_rates_cb),
-    ConversationHandler(
-        entry_points=[CommandHandler('showcurrency', get_currency_cbs.start)],
-        states={get_currency_cbs.ENTER_CODE: [MessageHandler(filters.TEXT, get_currency_cbs.send_currency)]},
-        fallbacks=[MessageHandler(~filters.TEXT, get_currency_cbs.received_not_text)]
-    ),
-    ConversationHandler(
-        entry_points=[CommandHandler('showexchangerate', get_exchange_rate_cbs.start)],
-        states={
-            get_exchange_rate_cbs.ENTER_CODES: [MessageHandler(filters.TEXT, get_exchange_rate_cbs.send_exchange_rate)]
-        },
-        fallbacks=[MessageHandler(~filters.TEXT, get_exchange_rate_cbs.received_not_text)]
-    ),
-    ConversationHandler(
-        entry_points=[CommandHandler('addcurrency', add_currency_cbs.start)],
-        states={
-            add_currency_cbs.ENTER_FIELDS: [MessageHandler(filters.TEXT, add_currency_cbs.add_currency)]
-        },
-        fallbacks=[MessageHandler(~filters.TEXT, add_currency_cbs.received_not_text)]
-    ),
-    ConversationHandler(
-        entry_points=[CommandHandler('addexchangerate', add_exchange_rate_cbs.start)],
-        states={
-            add_exchange_rate_cbs.ENTER_FIELDS: [MessageHandler(filters.TEXT, add_exchange_rate_cbs.add_exchange_rate)]
-        },
-        fallbacks=[MessageHandler(~filters.TEXT, add_exchange_rate_cbs.received_not_text)]
-    ),
-    ConversationHandler(
-        entry_points=[CommandHandler('editexchangerate', update_exchange_rate_cbs.start)],
-        states={
-            update_exchange_rate_cbs.ENTER_FIELDS: [MessageHandler(filters.TEXT,
-                                                                update_exchange_rate_cbs.update_exchange_rate)]
-        },
-        fallbacks=[MessageHandler(~filters.TEXT, update_exchange_rate_cbs.received_not_text)]
-    ),
-    ConversationHandler(
-        entry_points=[CommandHandler('convertcurrency', convert_currency_cbs.start)],
-        states={
-            convert_currency_cbs.ENTER_BASE: [MessageHandler(filters.TEXT,
-                                                                convert_currency_cbs.receive_currency)],
-            convert_currency_cbs.ENTER_TARGET: [MessageHandler(filters.TEXT,
-                                                                convert_currency_cbs.receive_currency)],
-            convert_currency_cbs.ENTER_AMOUNT: [MessageHandler(filters.TEXT,
-                                                                convert_currency_cbs.receive_amount)],
-        },
-        fallbacks=[MessageHandler(~filters.TEXT, convert_currency_cbs.received_not_text)]
-    ),
-    CommandHandler('revoketokens', revoke_tokens_cb),
-    CommandHandler('expungetokens', expunge_tokens_cb),
-]
+def make_handlers(container: Container) -> list[BaseHandler]:
+    start_cb = container.start_cb
+    allcurrencies_cb = container.allcurrencies_cb
+    allexchange_rates_cb = container.allexchange_rates_cb
+    export_cb = container.export_cb
+    get_currency_cbs = container.get_currency_cbs
+    get_exchange_rate_cbs = container.get_exchange_rate_cbs
+    add_currency_cbs = container.add_currency_cbs
+    add_exchange_rate_cbs = container.add_exchange_rate_cbs
+    update_exchange_rate_cbs = container.update_exchange_rate_cbs
+    convert_currency_cbs = container.convert_currency_cbs
+    history_cb = container.history_cb
+    digest_subscription_cbs = container.digest_subscription_cbs
+    favorites_cbs = container.favorites_cbs
+    revoke_tokens_cb = container.revoke_tokens_cb
+    expunge_tokens_cb = container.expunge_tokens_cb
+    rate_matrix_cb = container.rate_matrix_cb
+    arbitrage_cb = container.arbitrage_cb
+    metrics_cb = container.metrics_cb
+    profile_cb = container.profile_cb
+    memory_cb = container.memory_cb
+
+    return [
+        CommandHandler('start', start_cb),
+        CommandHandler('allcurrencies', allcurrencies_cb),
+        CommandHandler('allexchangerates', allexchange_rates_cb),
+        CommandHandler('export', export_cb),
+        ConversationHandler(
+            entry_points=[CommandHandler('showcurrency', get_currency_cbs.start)],
+            states={get_currency_cbs.ENTER_CODE: [MessageHandler(filters.TEXT, get_currency_cbs.send_currency)]},
+            fallbacks=[MessageHandler(~filters.TEXT, get_currency_cbs.received_not_text)]
+        ),
+        CallbackQueryHandler(get_currency_cbs.send_found_currency,
+                             pattern=f'^{get_currency_cbs.FOUND_CURRENCY_CALLBACK_PREFIX}'),
+        ConversationHandler(
+            entry_points=[CommandHandler('showexchangerate', get_exchange_rate_cbs.start)],
+            states={
+                get_exchange_rate_cbs.ENTER_CODES: [MessageHandler(filters.TEXT, get_exchange_rate_cbs.send_exchange_rate)]
+            },
+            fallbacks=[MessageHandler(~filters.TEXT, get_exchange_rate_cbs.received_not_text)]
+        ),
+        ConversationHandler(
+            entry_points=[CommandHandler('addcurrency', add_currency_cbs.start)],
+            states={
+                add_currency_cbs.ENTER_FIELDS: [MessageHandler(filters.TEXT, add_currency_cbs.add_currency)]
+            },
+            fallbacks=[MessageHandler(~filters.TEXT, add_currency_cbs.received_not_text)]
+        ),
+        ConversationHandler(
+            entry_points=[CommandHandler('addexchangerate', add_exchange_rate_cbs.start)],
+            states={
+                add_exchange_rate_cbs.ENTER_FIELDS: [MessageHandler(filters.TEXT, add_exchange_rate_cbs.add_exchange_rate)]
+            },
+            fallbacks=[MessageHandler(~filters.TEXT, add_exchange_rate_cbs.received_not_text)]
+        ),
+        ConversationHandler(
+            entry_points=[CommandHandler('editexchangerate', update_exchange_rate_cbs.start)],
+            states={
+                update_exchange_rate_cbs.ENTER_FIELDS: [MessageHandler(filters.TEXT,
+                                                                    update_exchange_rate_cbs.update_exchange_rate)]
+            },
+            fallbacks=[MessageHandler(~filters.TEXT, update_exchange_rate_cbs.received_not_text)]
+        ),
+        ConversationHandler(
+            entry_points=[CommandHandler('convertcurrency', convert_currency_cbs.start)],
+            states={
+                convert_currency_cbs.ENTER_BASE: [MessageHandler(filters.TEXT,
+                                                                    convert_currency_cbs.receive_currency)],
+                convert_currency_cbs.ENTER_TARGET: [MessageHandler(filters.TEXT,
+                                                                    convert_currency_cbs.receive_currency)],
+                convert_currency_cbs.ENTER_AMOUNT: [MessageHandler(filters.TEXT,
+                                                                    convert_currency_cbs.receive_amount)],
+            },
+            fallbacks=[MessageHandler(~filters.TEXT, convert_currency_cbs.received_not_text)]
+        ),
+        CommandHandler('history', history_cb),
+        CommandHandler('subscribe', digest_subscription_cbs.subscribe),
+        CommandHandler('unsubscribe', digest_subscription_cbs.unsubscribe),
+        CommandHandler('myrates', favorites_cbs.show),
+        CommandHandler('addfavorite', favorites_cbs.add),
+        CommandHandler('removefavorite', favorites_cbs.remove),
+        CommandHandler('revoketokens', revoke_tokens_cb),
+        CommandHandler('expungetokens', expunge_tokens_cb),
+        CommandHandler('ratematrix', rate_matrix_cb),
+        CommandHandler('arbitrage', arbitrage_cb),
+        CommandHandler('metrics', metrics_cb),
+        CommandHandler('profile', profile_cb),
+        CommandHandler('memory', memory_cb),
+    ]
@@ -0,0 +1,362 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncContextManager, Awaitable, Callable, NamedTuple, Optional
+
+from currency_exchange_tg_bot import rawlists
+from currency_exchange_tg_bot.config import CurrencyExchangeApiSettings
+
+
+logger = logging.getLogger('catalog')
+
+SNAPSHOT_VERSION = 1
+
+
+class CatalogSnapshot(NamedTuple):
+    currencies: list[tuple[str, str, str]]
+    rates: list[tuple[str, str, float]]
+    # unix time the data was fetched from the service at
+    fetched_at: float
+
+    def age(self) -> float:
+        return max(0.0, time.time() - self.fetched_at)
+
+    def find_currency(self, code: str) -> Optional[tuple[str, str, str]]:
+        return next((currency for currency in self.currencies if currency[0] == code), None)
+
+    def find_rate(self, base: str, target: str) -> Optional[tuple[str, str, float]]:
+        return next((rate for rate in self.rates if rate[0] == base and rate[1] == target), None)
+
+
+def read_snapshot(path: Path) -> Optional[CatalogSnapshot]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    if data.get('version') != SNAPSHOT_VERSION:
+        return None
+    return CatalogSnapshot(
+        [tuple(currency) for currency in data['currencies']],
+        [(base, target, float(rate)) for base, target, rate in data['rates']],
+        data['fetched_at'],
+    )
+
+
+def write_snapshot(path: Path, snapshot: CatalogSnapshot):
+    # written next to the target and renamed over it, so a reader never sees a partially written file
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {
+        'version': SNAPSHOT_VERSION,
+        'fetched_at': snapshot.fetched_at,
+        'currencies': snapshot.currencies,
+        'rates': snapshot.rates,
+    }
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def create_catalog_store_schema(connection: sqlite3.Connection):
+    # processes read the catalog while the refreshing one writes a new version of it
+    connection.execute('PRAGMA journal_mode=WAL;')
+    with connection:
+        # a single row, its version is bumped by each write of the catalog
+        connection.execute(
+            '''CREATE TABLE IF NOT EXISTS catalog_version (
+               id INTEGER PRIMARY KEY CHECK (id = 1),
+               version INTEGER,
+               fetched_at REAL
+               );
+            '''
+        )
+        # rows keep the order the service returned them in
+        connection.execute(
+            '''CREATE TABLE IF NOT EXISTS catalog_currency (
+               position INTEGER PRIMARY KEY,
+               code TEXT,
+               name TEXT,
+               sign TEXT
+               );
+            '''
+        )
+        connection.execute(
+            '''CREATE TABLE IF NOT EXISTS catalog_rate (
+               position INTEGER PRIMARY KEY,
+               base TEXT,
+               target TEXT,
+               rate REAL
+               );
+            '''
+        )
+        # a lease held by the process that refreshes the catalog
+        connection.execute(
+            '''CREATE TABLE IF NOT EXISTS catalog_lease (
+               name TEXT PRIMARY KEY,
+               owner TEXT,
+               expiry REAL
+               );
+            '''
+        )
+
+
+class Sqlite3CatalogStore:
+    """
+    Catalog shared by the bot processes of a host. The process holding the refresher lease writes each catalog
+    it fetches as a new version, the others check the version and read the catalog only when it has changed
+    """
+
+    _lease_name = 'catalog_refresher'
+
+    def __init__(self, connection: Callable[..., sqlite3.Connection]):
+        self._db_connection = connection
+
+    def get_version(self) -> Optional[int]:
+        with self._db_connection() as conn:
+            row = conn.execute('SELECT version FROM catalog_version WHERE id = 1;').fetchone()
+        return row[0] if row else None
+
+    def read(self) -> Optional[tuple[int, CatalogSnapshot]]:
+        with self._db_connection() as conn:
+            # one read transaction, so that the rows belong to the version read with them
+            conn.execute('BEGIN;')
+            try:
+                row = conn.execute('SELECT version, fetched_at FROM catalog_version WHERE id = 1;').fetchone()
+                if row is None:
+                    return None
+                currencies = conn.execute('SELECT code, name, sign FROM catalog_currency ORDER BY position;').fetchall()
+                rates = conn.execute('SELECT base, target, rate FROM catalog_rate ORDER BY position;').fetchall()
+            finally:
+                conn.rollback()
+        version, fetched_at = row
+        return version, CatalogSnapshot(currencies, rates, fetched_at)
+
+    def write(self, snapshot: CatalogSnapshot) -> int:
+        """Replaces the catalog, returns its new version"""
+        with self._db_connection() as conn:
+            with conn:
+                conn.execute('DELETE FROM catalog_currency;')
+                conn.executemany('INSERT INTO catalog_currency (code, name, sign) VALUES (?, ?, ?);',
+                                 snapshot.currencies)
+                conn.execute('DELETE FROM catalog_rate;')
+                conn.executemany('INSERT INTO catalog_rate (base, target, rate) VALUES (?, ?, ?);', snapshot.rates)
+                conn.execute('INSERT INTO catalog_version VALUES (1, 1, ?) '
+                             'ON CONFLICT (id) DO UPDATE SET version = version + 1, fetched_at = excluded.fetched_at;',
+                             (snapshot.fetched_at,))
+                return conn.execute('SELECT version FROM catalog_version WHERE id = 1;').fetchone()[0]
+
+    def try_acquire_lease(self, owner: str, ttl: float) -> bool:
+        """Takes or renews the lease unless another owner holds it and its ttl (in seconds) has not run out yet"""
+        now = time.time()
+        with self._db_connection() as conn:
+            with conn:
+                res = conn.execute("INSERT INTO catalog_lease VALUES (?, ?, ?) "
+                                   "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expiry = excluded.expiry "
+                                   "WHERE catalog_lease.expiry < ? OR catalog_lease.owner = excluded.owner;",
+                                   (self._lease_name, owner, now + ttl, now))
+                return res.rowcount == 1
+
+    def release_lease(self, owner: str) -> None:
+        with self._db_connection() as conn:
+            with conn:
+                conn.execute('DELETE FROM catalog_lease WHERE name = ? AND owner = ?;', (self._lease_name, owner))
+
+
+class Catalog:
+    """
+    Currencies and exchange rates known to the service, kept in memory and in a snapshot file.
+    A snapshot older than `max_age` is still served right away, while a refresh runs in the background
+    (stale-while-revalidate), so reads only wait for the service when there has never been a snapshot.
+    Concurrent refreshes share one request to the service.
+    With a store shared by the processes of the host the catalog is kept there instead of the file: a refresh
+    fetches it from the service only in the process holding the refresher lease, others take the version
+    written to the store by that process
+    """
+
+    def __init__(self, api_session_factory: Callable[..., AsyncContextManager],
+                 api_settings: CurrencyExchangeApiSettings, snapshot_file: Path, max_age: float, *,
+                 store: Optional[Sqlite3CatalogStore] = None, lease_ttl: float = 900.0):
+        self.api_session = api_session_factory
+        self.api_settings = api_settings
+        self._snapshot_file = Path(snapshot_file)
+        self._max_age = max_age
+        self._store = store
+        self._lease_ttl = lease_ttl
+        self._lease_owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}'
+        self._snapshot: Optional[CatalogSnapshot] = None
+        # version of the snapshot in the store, None if it wasn't taken from the store
+        self._version: Optional[int] = None
+        self._refreshing: Optional[asyncio.Task] = None
+        # a refresh queued after the running one by a change, until it starts fetching
+        self._queued_refresh: Optional[asyncio.Task] = None
+        self._listeners: list[tuple[Callable[[CatalogSnapshot], Awaitable], bool]] = []
+
+    @property
+    def snapshot(self) -> Optional[CatalogSnapshot]:
+        """The last known snapshot as is, without triggering a refresh"""
+        return self._snapshot
+
+    def is_stale(self, snapshot: CatalogSnapshot) -> bool:
+        return snapshot.age() > self._max_age
+
+    def add_listener(self, listener: Callable[[CatalogSnapshot], Awaitable], *, fetched_only: bool = False):
+        """
+        Listener is awaited with each new snapshot; with fetched_only, only with those fetched by this process
+        and not with those taken from the shared store, e.g. to record them once per host
+        """
+        self._listeners.append((listener, fetched_only))
+
+    async def load(self) -> Optional[CatalogSnapshot]:
+        """Reads the snapshot file left by a previous run or the shared store, call before serving updates"""
+        if self._store is not None:
+            return await self.sync()
+        try:
+            snapshot = await asyncio.to_thread(read_snapshot, self._snapshot_file)
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.exception('Catalog snapshot %s is unreadable, ignoring it', self._snapshot_file)
+            return None
+        if snapshot is not None and self._snapshot is None:
+            self._snapshot = snapshot
+            logger.info('Loaded catalog snapshot of %d currencies and %d rates, %.0f s old',
+                        len(snapshot.currencies), len(snapshot.rates), snapshot.age())
+        return snapshot
+
+    async def get(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return await self.refresh()
+        if self.is_stale(snapshot):
+            self.revalidate()
+        return snapshot
+
+    async def refresh(self) -> CatalogSnapshot:
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self._refresh())
+        # shielded, so that a cancelled reader doesn't cancel the refresh others are waiting for
+        return await asyncio.shield(self._refreshing)
+
+    def revalidate(self, *, changed: bool = False):
+        """
+        Starts a refresh in the background unless one is already running.
+        With changed, the catalog is known to have been changed in the service (e.g. by a command of the bot):
+        it is fetched from the service even by a process not holding the refresher lease and written to the
+        shared store for the others, after the running refresh if there is one, as it may predate the change.
+        Changes made while that refresh is running share the one queued after it
+        """
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self._refresh(fetch=changed))
+        elif changed and (self._queued_refresh is None or self._queued_refresh.done()):
+            self._refreshing = self._queued_refresh = asyncio.create_task(self._refresh_after(self._refreshing))
+        else:
+            return
+        self._refreshing.add_done_callback(_log_revalidation_failure)
+
+    async def sync(self) -> Optional[CatalogSnapshot]:
+        """Takes the catalog from the shared store if its version has changed since the last time"""
+        version = await asyncio.to_thread(self._store.get_version)
+        if version is None or version == self._version:
+            return self._snapshot
+        stored = await asyncio.to_thread(self._store.read)
+        if stored is None:
+            return self._snapshot
+        self._version, snapshot = stored
+        if self._snapshot is None:
+            logger.info('Took catalog of %d currencies and %d rates from the shared store, %.0f s old',
+                        len(snapshot.currencies), len(snapshot.rates), snapshot.age())
+        self._snapshot = snapshot
+        await self._notify(snapshot, fetched=False)
+        return snapshot
+
+    async def release_lease(self):
+        """Lets another process take over refreshing the shared store right away, call on shutdown"""
+        if self._store is not None:
+            await asyncio.to_thread(self._store.release_lease, self._lease_owner)
+
+    async def _refresh_after(self, previous: asyncio.Task) -> CatalogSnapshot:
+        try:
+            await asyncio.wait([previous])
+        finally:
+            # changes from now on may come after the fetch has read the catalog, so they queue another refresh
+            self._queued_refresh = None
+        return await self._refresh(fetch=True)
+
+    async def _refresh(self, fetch: bool = False) -> CatalogSnapshot:
+        """With fetch, the catalog is fetched and written to the shared store regardless of the lease"""
+        is_refresher = True
+        if self._store is not None and not fetch:
+            is_refresher = await asyncio.to_thread(self._store.try_acquire_lease, self._lease_owner, self._lease_ttl)
+            if not is_refresher:
+                snapshot = await self.sync()
+                if snapshot is not None:
+                    return snapshot
+                # nothing in the store yet, e.g. the refreshing process is still fetching it, so this one
+                # fetches the catalog for itself
+
+        snapshot = await self._fetch()
+        self._snapshot = snapshot
+        if self._store is None:
+            try:
+                await asyncio.to_thread(write_snapshot, self._snapshot_file, snapshot)
+            except OSError:
+                logger.exception('Failed to write catalog snapshot to %s', self._snapshot_file)
+        elif is_refresher:
+            try:
+                self._version = await asyncio.to_thread(self._store.write, snapshot)
+            except sqlite3.Error:
+                logger.exception('Failed to write catalog to the shared store')
+        await self._notify(snapshot, fetched=True)
+        return snapshot
+
+    async def _fetch(self) -> CatalogSnapshot:
+        timeout = self.api_settings.request_timeout
+        async with self.api_session() as api:
+            if self.api_settings.raw_list_responses:
+                currencies, rates = await asyncio.gather(rawlists.get_all_currencies(api, timeout),
+                                                         rawlists.get_all_exchange_rates(api, timeout))
+            else:
+                currency_models, rate_models = await asyncio.gather(
+                    api.currency_exchange_get_all_currencies(_request_timeout=timeout),
+                    api.currency_exchange_get_all_exchange_rates(_request_timeout=timeout),
+                )
+                currencies = [(crncy.code, crncy.name, crncy.sign) for crncy in currency_models]
+                rates = [(er.base_currency.code, er.target_currency.code, float(er.rate)) for er in rate_models]
+        return CatalogSnapshot(currencies, rates, time.time())
+
+    async def _notify(self, snapshot: CatalogSnapshot, fetched: bool):
+        for listener, fetched_only in self._listeners:
+            if fetched_only and not fetched:
+                continue
+            try:
+                await listener(snapshot)
+            except Exception:
+                logger.exception('Catalog listener %r failed', listener)
+
+
+def _log_revalidation_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning('Catalog revalidation failed, stale data is served', exc_info=task.exception())
+
+
+def format_age(seconds: float) -> str:
+    if seconds < 60:
+        return f'{seconds:.0f} с'
+    if seconds < 3600:
+        return f'{seconds // 60:.0f} мин'
+    if seconds < 86400:
+        return f'{seconds // 3600:.0f} ч'
+    return f'{seconds // 86400:.0f} дн'
@@ -0,0 +1,66 @@
+"""
+Grammar of command input, shared by one-shot commands (/convertcurrency 100 usd eur) and the messages
+of the step by step conversations. Patterns are built from the same few pieces and compiled once.
+Parsers return None for input that doesn't match
+"""
+import re
+from typing import Optional
+
+
+_CODE = '([a-zA-Z]{3})'
+# the sign is kept in the number, so that a negative amount or rate is told apart from a malformed one
+_NUMBER = '(-?\\d+(?:\\.\\d+)?)'
+# values can be separated by a comma, spaces or both
+_SEP = '(?: *, *| +)'
+
+CURRENCY_CODE_PATTERN = re.compile(f'^ *{_CODE} *$')
+
+CURRENCY_AMOUNT_PATTERN = re.compile(f'^ *{_NUMBER} *$')
+
+CURRENCY_PAIR_PATTERN = re.compile(f'^ *{_CODE}(?:{_SEP}|/){_CODE} *$')
+
+# code, name and sign; the name may have spaces, so it's ended by a comma
+NEW_CURRENCY_PATTERN = re.compile(f'^ *{_CODE}{_SEP}([a-zA-Z ]+?) *, *([^\\s_]+) *$')
+
+EXCHANGE_RATE_PATTERN = re.compile(f'^ *{_CODE}{_SEP}{_CODE}{_SEP}{_NUMBER} *$')
+
+# amount, base and target, optionally with "to" or "в" before the target: 100 usd eur, 100 usd to eur
+CONVERSION_PATTERN = re.compile(f'^ *{_NUMBER}{_SEP}{_CODE}{_SEP}(?:(?:to|в|in){_SEP})?{_CODE} *$', re.IGNORECASE)
+
+
+def parse_currency_code(text: str) -> Optional[str]:
+    match = CURRENCY_CODE_PATTERN.fullmatch(text)
+    return match.group(1).upper() if match else None
+
+
+def parse_currency_pair(text: str) -> Optional[tuple[str, str]]:
+    match = CURRENCY_PAIR_PATTERN.fullmatch(text)
+    return (match.group(1).upper(), match.group(2).upper()) if match else None
+
+
+def parse_currency_pairs(args: Optional[list[str]]) -> Optional[list[tuple[str, str]]]:
+    """Pairs of codes given as separate command arguments: USD EUR USD RUB"""
+    if not args or len(args) % 2 or not all(CURRENCY_CODE_PATTERN.fullmatch(code) for code in args):
+        return None
+    codes = [code.strip().upper() for code in args]
+    return list(zip(codes[0::2], codes[1::2]))
+
+
+def parse_new_currency(text: str) -> Optional[tuple[str, str, str]]:
+    match = NEW_CURRENCY_PATTERN.fullmatch(text)
+    return (match.group(1).upper(), match.group(2), match.group(3)) if match else None
+
+
+def parse_exchange_rate(text: str) -> Optional[tuple[str, str, float]]:
+    match = EXCHANGE_RATE_PATTERN.fullmatch(text)
+    return (match.group(1).upper(), match.group(2).upper(), float(match.group(3))) if match else None
+
+
+def parse_amount(text: str) -> Optional[float]:
+    match = CURRENCY_AMOUNT_PATTERN.fullmatch(text)
+    return float(match.group(1)) if match else None
+
+
+def parse_conversion(text: str) -> Optional[tuple[float, str, str]]:
+    match = CONVERSION_PATTERN.fullmatch(text)
+    return (float(match.group(1)), match.group(2).upper(), match.group(3).upper()) if match else None
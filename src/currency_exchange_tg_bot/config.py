@@ -1,13 +1,21 @@
+import datetime
 from pathlib import Path
-from typing import Optional, Literal
+from typing import Any, Optional, Literal
 
-from pydantic import HttpUrl, field_validator
+from pydantic import BaseModel, HttpUrl, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Sqlite3Settings(BaseSettings):
     # a name of a file that is used by db to connect
     connection_uri: str = "accesstoken.sqlite3"
+    # how often (in seconds) expired tokens are deleted from db
+    expired_tokens_cleanup_interval: float = 3600.0
+    # only one process gains or refreshes tokens at a time, the lock it holds expires after this many seconds
+    # in case the process dies while holding it
+    token_lock_ttl: float = 30.0
+    # how often (in seconds) other processes check for the token while the lock is held
+    token_lock_poll_interval: float = 0.2
 
 
 class TgBotSettings(BaseSettings):
@@ -15,13 +23,78 @@ class TgBotSettings(BaseSettings):
 
     # token must be set in .env file
     tg_bot_token: str
-    # change this if your file with admin chats ids is named differently
+    # tells the bots served by one process apart in logs and memory reports
+    bot_name: str = 'main'
+    # more bots served by this process, sharing its connections to the service, tokens and caches; set as json
+    # with the settings of each bot that differ from these, e.g.
+    # [{"bot_name": "eu", "tg_bot_token": "...", "admin_records_file": "admin_records_eu"}]
+    extra_bots: list[dict[str, Any]] = []
+    # db of digest subscriptions and favorites of the bot, DIGEST_CONNECTION_URI is used by the main bot if not set
+    # and a file named after the bot next to it by extra bots
+    userdata_connection_uri: Optional[str] = None
+    # change this if your file with admin chats ids is named differently; extra bots not setting it use a file
+    # named after the bot next to it, e.g. admin_records.eu
     admin_records_file: Path = 'admin_records'
     # on /start command, should the bot send chat id of this private chat with user
     send_chat_ids_on_start: bool = False
     # should the bot send a report whenever an error occurs trying to handle an update
     notify_admins_on_error: bool = True
     log_level: Literal["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"] = "INFO"
+    # json format adds update_id, chat_id and command of the update being handled to each record
+    log_format: Literal["text", "json"] = "text"
+    # exchange rate cycles that gain less than this share of the converted amount are not reported on /arbitrage
+    arbitrage_tolerance: float = 1e-6
+    # each user and each chat has a bucket of tokens refilled at a steady rate, an update is handled only
+    # if both buckets have enough tokens for its command. Admins are not limited
+    rate_limit_user_capacity: float = 10.0
+    rate_limit_user_refill_rate: float = 0.2
+    rate_limit_chat_capacity: float = 20.0
+    rate_limit_chat_refill_rate: float = 0.5
+    # buckets over this number are evicted starting from the least recently used
+    rate_limit_max_buckets: int = 10000
+    # tokens taken by a command, updates that are not listed commands (e.g. conversation replies) take the default
+    rate_limit_command_costs: dict[str, float] = {
+        'start': 1.0,
+        'allcurrencies': 5.0,
+        'allexchangerates': 5.0,
+        'history': 3.0,
+        'convertcurrency': 2.0,
+        'export': 5.0,
+        'myrates': 2.0,
+    }
+    rate_limit_default_cost: float = 1.0
+    # the bot is overloaded once more updates than the max wait for handling, or the update being handled
+    # was sent longer than max age (in seconds) ago. Reads are answered from the catalog then,
+    # other updates get a "busy" reply; updates older than the drop age get no reply at all. Admins are not shed
+    admission_max_pending_updates: int = 50
+    admission_max_update_age: float = 15.0
+    admission_drop_update_age: float = 120.0
+    # /profile runs the profiler for this many seconds unless told otherwise, and never longer than the max
+    profile_default_duration: float = 30.0
+    profile_max_duration: float = 300.0
+    # the event loop is checked every interval (in seconds), being blocked for longer than the threshold
+    # gets the stack of the blocking call logged
+    watchdog_interval: float = 0.1
+    watchdog_threshold: float = 0.25
+    # tracemalloc slows allocations down, so it's off until started by /memory trace, unless enabled here;
+    # more frames tell the callers of an allocation site at the cost of more memory per traced block
+    memory_tracing_at_startup: bool = False
+    memory_trace_frames: int = 1
+    # a memory report (allocation growth, object counts, structure sizes) is logged every interval (in seconds)
+    memory_report_interval: float = 3600.0
+    memory_report_top: int = 10
+    # an /export document is kept in memory up to this many bytes while it's written, the rest goes to a temp file
+    export_max_memory: int = 1024 * 1024
+    # number of pairs a user can add to favorites shown on /myrates
+    favorites_max_pairs: int = 10
+    # /myrates tables of this many users are kept between catalog refreshes, the least recently requested
+    # are evicted past it
+    favorites_max_rendered: int = 10000
+
+
+class ApiCredential(BaseModel):
+    username: str
+    password: str
 
 
 class CurrencyExchangeApiSettings(BaseSettings):
@@ -30,11 +103,92 @@ class CurrencyExchangeApiSettings(BaseSettings):
     username: Optional[str] = None
     password: Optional[str] = None
     host: Optional[HttpUrl] = None
+    # more accounts of the service to spread requests over, since the service limits requests per account;
+    # set as json, e.g. [{"username": "bot2", "password": "..."}]
+    extra_credentials: list[ApiCredential] = []
+    # a request is sent with the account having the fewest requests in flight, or with each account in turn
+    credential_selection: Literal['least_in_flight', 'round_robin'] = 'least_in_flight'
+    # an account the service answered 429 to is not used for Retry-After seconds, or for this many if not told
+    credential_cooldown: float = 30.0
 
-    # request timeout is set on each request to service api
+    # request timeout is set on each request to service api; for reads it is the upper bound
+    # of the timeout derived from their observed latencies
     request_timeout: Optional[float] = 10.0
+    # latencies of this many latest requests of each endpoint are kept, timeouts are derived and requests are
+    # hedged only once an endpoint has at least the min number of them
+    latency_window: int = 200
+    latency_min_samples: int = 20
+    # read timeout is this quantile of the observed latencies times the multiplier, but not less than the min
+    adaptive_timeout_quantile: float = 0.99
+    adaptive_timeout_multiplier: float = 3.0
+    min_request_timeout: float = 1.0
+    # a read that takes longer than this quantile of the observed latencies is sent once more, the first answer
+    # is used. Hedged requests are kept under the budget share of all requests, set it to 0 to disable hedging
+    hedge_quantile: float = 0.95
+    hedge_budget_ratio: float = 0.05
+    # bodies of list responses are parsed straight into rows instead of generated models, set it to false
+    # to go through the models if the service changes its response shape
+    raw_list_responses: bool = True
+    # exchange rate updates of a pair requested within this many seconds of the first one are sent as one update
+    # with the last requested rate, everyone who requested one gets its result
+    exchange_rate_write_window: float = 2.0
 
     @field_validator('host', mode='after')
     @classmethod
     def validate_host(cls, v):
         return v.scheme+'://' + v.host + ':' + str(v.port)
+
+
+class RatesHistorySettings(BaseSettings):
+    model_config = SettingsConfigDict(env_file='.env', extra='ignore', env_prefix='RATES_HISTORY_')
+
+    # directory with a history file per currency pair
+    directory: Path = 'rates_history'
+    # number of characters in the sparkline sent on /history
+    sparkline_width: int = 30
+
+
+class TrafficCaptureSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_file='.env', extra='ignore', env_prefix='TRAFFIC_CAPTURE_')
+
+    # incoming updates and service responses are appended to the file for replaying with
+    # benchmarks/replay_traffic.py; user and chat ids are replaced with keyed hashes of them
+    enabled: bool = False
+    file: Path = 'traffic.capture'
+    # key of the id hashes, a random one is used for each run if not set
+    secret: Optional[str] = None
+
+
+class DigestSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_file='.env', extra='ignore', env_prefix='DIGEST_')
+
+    # db file keeping digest subscriptions and the progress of digest runs
+    connection_uri: str = 'userdata.sqlite3'
+    # time of day (UTC) the digest is sent at
+    send_at: datetime.time = datetime.time(9, 0)
+    # Bot API allows about 30 messages per second to different chats
+    messages_per_second: float = 25.0
+    concurrency: int = 8
+    # number of pairs a chat can subscribe to
+    max_pairs: int = 20
+
+
+class CatalogSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_file='.env', extra='ignore', env_prefix='CATALOG_')
+
+    # currencies and exchange rates fetched last are kept in this file to be served right after a restart
+    snapshot_file: Path = 'catalog_snapshot.json'
+    # how often (in seconds) currencies and exchange rates are fetched, the search index and the rates history
+    # are updated from each fetch
+    refresh_interval: float = 300.0
+    # data older than this (in seconds) is still served, but marked with its age and refreshed in the background
+    max_age: float = 600.0
+    # a db shared by the bot processes of one host: the process holding the refresher lease fetches the catalog
+    # and writes it there, others only re-read it once its version changes. Each process refreshes on its own
+    # if not set
+    store_connection_uri: Optional[str] = None
+    # how often (in seconds) processes check the version of the catalog in the shared store
+    store_poll_interval: float = 5.0
+    # the refresher lease runs out after this many seconds unless the next refresh renews it, so it should be longer
+    # than the refresh interval; another process takes over refreshing once it runs out
+    refresher_lease_ttl: float = 900.0
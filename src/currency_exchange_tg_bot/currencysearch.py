@@ -0,0 +1,179 @@
+import re
+from collections import defaultdict
+from typing import Iterable, NamedTuple, Optional
+
+
+_WORD_SEPARATOR = re.compile(r'[\s,.()\-]+')
+
+# scores of a query term matching a currency in different ways, trigram similarity is scaled by the last one
+EXACT_CODE_SCORE = 100
+EXACT_SIGN_SCORE = 90
+EXACT_WORD_SCORE = 80
+CODE_PREFIX_SCORE = 70
+WORD_PREFIX_SCORE = 60
+TRIGRAM_SCORE = 50
+
+MIN_TRIGRAM_SIMILARITY = 0.3
+
+
+class CurrencyEntry(NamedTuple):
+    code: str
+    name: str
+    sign: str
+
+
+class _TrieNode:
+    __slots__ = ('children', 'codes')
+
+    def __init__(self):
+        self.children: dict[str, _TrieNode] = {}
+        # codes of currencies having a word that starts with the prefix this node stands for
+        self.codes: set[str] = set()
+
+
+def _trigrams(word: str) -> set[str]:
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CurrencySearchIndex:
+    """
+    In-memory index over currency codes, names and signs. Words of each currency are put into
+    a prefix trie for autocomplete and into a trigram index for misspelled queries.
+    Currencies are added and removed one by one, so keeping the index in sync costs as much as the change
+    """
+
+    def __init__(self):
+        self._currencies: dict[str, CurrencyEntry] = {}
+        self._trie = _TrieNode()
+        self._words: dict[str, set[str]] = defaultdict(set)
+        self._signs: dict[str, set[str]] = defaultdict(set)
+        self._word_trigrams: dict[str, set[str]] = {}
+        self._trigram_words: dict[str, set[str]] = defaultdict(set)
+
+    def __len__(self):
+        return len(self._currencies)
+
+    def get(self, code: str) -> Optional[CurrencyEntry]:
+        return self._currencies.get(code.upper())
+
+    def add(self, code: str, name: str, sign: str):
+        entry = CurrencyEntry(code.upper(), name, sign)
+        if self._currencies.get(entry.code) == entry:
+            return
+        self.remove(entry.code)
+        self._currencies[entry.code] = entry
+        for word in self._entry_words(entry):
+            self._add_word(word, entry.code)
+        self._signs[entry.sign.lower()].add(entry.code)
+
+    def remove(self, code: str):
+        entry = self._currencies.pop(code.upper(), None)
+        if entry is None:
+            return
+        for word in self._entry_words(entry):
+            self._remove_word(word, entry.code)
+        self._signs[entry.sign.lower()].discard(entry.code)
+        if not self._signs[entry.sign.lower()]:
+            del self._signs[entry.sign.lower()]
+
+    def update(self, currencies: Iterable[tuple[str, str, str]]):
+        """Syncs the index with a full list of currencies, touching only the added, changed and removed ones"""
+        seen = set()
+        for code, name, sign in currencies:
+            self.add(code, name, sign)
+            seen.add(code.upper())
+        for code in self._currencies.keys() - seen:
+            self.remove(code)
+
+    def search(self, query: str, limit: int = 8) -> list[CurrencyEntry]:
+        terms = self._split_words(query)
+        if not terms:
+            return []
+        scores: dict[str, float] = defaultdict(float)
+        for term in terms:
+            for code, score in self._score_term(term).items():
+                scores[code] += score
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [self._currencies[code] for code, _ in ranked[:limit]]
+
+    def _score_term(self, term: str) -> dict[str, float]:
+        scores: dict[str, float] = {}
+
+        def put(codes: Iterable[str], score: float):
+            for code in codes:
+                if scores.get(code, 0) < score:
+                    scores[code] = score
+
+        prefixed = self._trie_lookup(term)
+        put(prefixed, WORD_PREFIX_SCORE)
+        put((code for code in prefixed if code.lower().startswith(term)), CODE_PREFIX_SCORE)
+        put(self._words.get(term, ()), EXACT_WORD_SCORE)
+        put(self._signs.get(term, ()), EXACT_SIGN_SCORE)
+        if term.upper() in self._currencies:
+            put([term.upper()], EXACT_CODE_SCORE)
+        # misspelled terms match no prefix, only then they are looked up by trigrams
+        if not scores:
+            for word, similarity in self._similar_words(term):
+                put(self._words[word], TRIGRAM_SCORE * similarity)
+        return scores
+
+    def _similar_words(self, term: str) -> list[tuple[str, float]]:
+        term_trigrams = _trigrams(term)
+        common: dict[str, int] = defaultdict(int)
+        for trigram in term_trigrams:
+            for word in self._trigram_words.get(trigram, ()):
+                common[word] += 1
+        similar = []
+        for word, count in common.items():
+            similarity = count / (len(term_trigrams) + len(self._word_trigrams[word]) - count)
+            if similarity >= MIN_TRIGRAM_SIMILARITY:
+                similar.append((word, similarity))
+        return similar
+
+    def _trie_lookup(self, prefix: str) -> set[str]:
+        node = self._trie
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return node.codes
+
+    def _add_word(self, word: str, code: str):
+        node = self._trie
+        for char in word:
+            node = node.children.setdefault(char, _TrieNode())
+            node.codes.add(code)
+        self._words[word].add(code)
+        if word not in self._word_trigrams:
+            self._word_trigrams[word] = _trigrams(word)
+            for trigram in self._word_trigrams[word]:
+                self._trigram_words[trigram].add(word)
+
+    def _remove_word(self, word: str, code: str):
+        # all words of a currency are removed together, so it is dropped from every node on the way
+        node = self._trie
+        for char in word:
+            child = node.children.get(char)
+            if child is None:
+                break
+            child.codes.discard(code)
+            if not child.codes:
+                del node.children[char]
+                break
+            node = child
+        self._words[word].discard(code)
+        if not self._words[word]:
+            del self._words[word]
+            for trigram in self._word_trigrams.pop(word):
+                self._trigram_words[trigram].discard(word)
+                if not self._trigram_words[trigram]:
+                    del self._trigram_words[trigram]
+
+    def _entry_words(self, entry: CurrencyEntry) -> set[str]:
+        return {entry.code.lower(), entry.sign.lower(), *self._split_words(entry.name)} - {''}
+
+    @staticmethod
+    def _split_words(text: str) -> list[str]:
+        return [word for word in _WORD_SEPARATOR.split(text.lower()) if word]
+
@@ -0,0 +1,289 @@
+import asyncio
+import datetime
+import html
+import logging
+import sqlite3
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+import telegram
+from telegram.error import Forbidden, RetryAfter, TelegramError
+from tabulate import tabulate
+
+from currency_exchange_tg_bot.catalog import Catalog, CatalogSnapshot
+
+
+logger = logging.getLogger('digest')
+
+Pair = tuple[str, str]
+
+
+def create_digest_schema(connection: sqlite3.Connection):
+    connection.execute('PRAGMA journal_mode=WAL;')
+    with connection:
+        connection.execute(
+            '''CREATE TABLE IF NOT EXISTS digest_subscription (
+               chat_id INTEGER,
+               base TEXT,
+               target TEXT,
+               PRIMARY KEY (chat_id, base, target)
+               ) WITHOUT ROWID;
+            '''
+        )
+        connection.execute(
+            '''CREATE TABLE IF NOT EXISTS digest_run (
+               run_date TEXT PRIMARY KEY,
+               started_at REAL,
+               finished_at REAL
+               );
+            '''
+        )
+        # chats the digest of a run was delivered to, a resumed run skips them
+        connection.execute(
+            '''CREATE TABLE IF NOT EXISTS digest_delivery (
+               run_date TEXT,
+               chat_id INTEGER,
+               PRIMARY KEY (run_date, chat_id)
+               ) WITHOUT ROWID;
+            '''
+        )
+
+
+class DigestReport(NamedTuple):
+    run_date: str
+    recipients: int
+    distinct_messages: int
+    sent: int
+    failed: int
+    # seconds from the start of the run (of its first attempt, if it was resumed) to its end
+    duration: float
+
+
+class Sqlite3DigestRepository:
+
+    def __init__(self, connection: Callable[..., sqlite3.Connection]):
+        self._db_connection = connection
+
+    def subscribe(self, chat_id: int, pairs: list[Pair]):
+        with self._db_connection() as conn:
+            with conn:
+                conn.executemany('INSERT OR IGNORE INTO digest_subscription VALUES (?, ?, ?);',
+                                 [(chat_id, base, target) for base, target in pairs])
+
+    def unsubscribe(self, chat_id: int, pairs: Optional[list[Pair]] = None) -> int:
+        """Removes the given pairs of the chat, or all of them"""
+        with self._db_connection() as conn:
+            with conn:
+                if pairs is None:
+                    return conn.execute('DELETE FROM digest_subscription WHERE chat_id = ?;', (chat_id,)).rowcount
+                return sum(
+                    conn.execute('DELETE FROM digest_subscription WHERE chat_id = ? AND base = ? AND target = ?;',
+                                 (chat_id, base, target)).rowcount
+                    for base, target in pairs
+                )
+
+    def get_pairs(self, chat_id: int) -> list[Pair]:
+        with self._db_connection() as conn:
+            return conn.execute('SELECT base, target FROM digest_subscription WHERE chat_id = ? '
+                                'ORDER BY base, target;', (chat_id,)).fetchall()
+
+    def start_run(self, run_date: str) -> Optional[float]:
+        """Returns the time the run was first started at, None if it has already finished"""
+        with self._db_connection() as conn:
+            with conn:
+                conn.execute('INSERT OR IGNORE INTO digest_run VALUES (?, ?, NULL);', (run_date, time.time()))
+                started_at, finished_at = conn.execute(
+                    'SELECT started_at, finished_at FROM digest_run WHERE run_date = ?;', (run_date,)
+                ).fetchone()
+        return None if finished_at is not None else started_at
+
+    def get_unfinished_runs(self) -> list[str]:
+        with self._db_connection() as conn:
+            return [row[0] for row in
+                    conn.execute('SELECT run_date FROM digest_run WHERE finished_at IS NULL ORDER BY run_date;')]
+
+    def finish_run(self, run_date: str):
+        with self._db_connection() as conn:
+            with conn:
+                conn.execute('UPDATE digest_run SET finished_at = ? WHERE run_date = ?;', (time.time(), run_date))
+
+    def get_pending_subscriptions(self, run_date: str) -> dict[int, list[Pair]]:
+        """Pairs of each chat the digest of the run wasn't delivered to yet"""
+        with self._db_connection() as conn:
+            rows = conn.execute(
+                '''SELECT s.chat_id, s.base, s.target FROM digest_subscription AS s
+                   WHERE NOT EXISTS (SELECT 1 FROM digest_delivery AS d WHERE d.run_date = ? AND d.chat_id = s.chat_id)
+                   ORDER BY s.chat_id, s.base, s.target;
+                ''',
+                (run_date,)
+            )
+            subscriptions = defaultdict(list)
+            for chat_id, base, target in rows:
+                subscriptions[chat_id].append((base, target))
+        return subscriptions
+
+    def mark_delivered(self, run_date: str, chat_ids: list[int]):
+        with self._db_connection() as conn:
+            with conn:
+                conn.executemany('INSERT OR IGNORE INTO digest_delivery VALUES (?, ?);',
+                                 [(run_date, chat_id) for chat_id in chat_ids])
+
+
+def group_by_pairs(subscriptions: dict[int, list[Pair]]) -> dict[tuple[Pair, ...], list[int]]:
+    """Chats subscribed to the same set of pairs get the same message"""
+    groups = defaultdict(list)
+    for chat_id, pairs in subscriptions.items():
+        groups[tuple(sorted(pairs))].append(chat_id)
+    return groups
+
+
+def render_digest(pairs: tuple[Pair, ...], rates: dict[Pair, float]) -> str:
+    rows = [(base, target, rates.get((base, target), '—')) for base, target in pairs]
+    table = html.escape(tabulate(rows, tablefmt='psql'))
+    return f'Ежедневная сводка курсов\U0001F4C8\n<pre>{table}</pre>'
+
+
+class _Pacer:
+    """Spaces calls at least 1/rate seconds apart, whichever coroutine makes them"""
+
+    def __init__(self, rate: float):
+        self._interval = 1 / rate
+        self._next_slot = 0.0
+
+    async def wait(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self._interval
+        await asyncio.sleep(slot - now)
+
+    def pause(self, seconds: float):
+        # a flood limit answer stops all senders, not only the one that got it
+        self._next_slot = max(self._next_slot, asyncio.get_running_loop().time() + seconds)
+
+
+class DigestBroadcaster:
+    """
+    Sends a run of the daily digest: rates are taken from one catalog refresh, each distinct set of pairs
+    is rendered once, and messages are sent by concurrent workers paced under the Bot API flood limit.
+    Chats the digest was delivered to are stored in batches, so a run interrupted by a crash
+    is resumed without sending the digest twice (except for the last unsaved batch)
+    """
+
+    def __init__(self, repo: Sqlite3DigestRepository, catalog: Catalog, *, messages_per_second: float,
+                 concurrency: int, delivery_batch: int = 100):
+        self._repo = repo
+        self._catalog = catalog
+        self._messages_per_second = messages_per_second
+        self._concurrency = concurrency
+        self._delivery_batch = delivery_batch
+
+    async def run(self, bot: telegram.Bot, run_date: str) -> Optional[DigestReport]:
+        started_at = await asyncio.to_thread(self._repo.start_run, run_date)
+        if started_at is None:
+            logger.info('Digest of %s was already sent', run_date)
+            return None
+
+        snapshot = await self._get_rates()
+        subscriptions = await asyncio.to_thread(self._repo.get_pending_subscriptions, run_date)
+        groups = group_by_pairs(subscriptions)
+        rates = {(base, target): rate for base, target, rate in snapshot.rates}
+        logger.info('Sending digest of %s to %d chats, %d distinct messages', run_date, len(subscriptions),
+                    len(groups))
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for pairs, chat_ids in groups.items():
+            text = render_digest(pairs, rates)
+            for chat_id in chat_ids:
+                queue.put_nowait((chat_id, text))
+
+        pacer = _Pacer(self._messages_per_second)
+        delivered: list[int] = []
+        counts = {'sent': 0, 'failed': 0}
+        workers = [asyncio.create_task(self._send_all(bot, queue, pacer, run_date, delivered, counts))
+                   for _ in range(self._concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await self._save_delivered(run_date, delivered)
+
+        await asyncio.to_thread(self._repo.finish_run, run_date)
+        report = DigestReport(run_date, len(subscriptions), len(groups), counts['sent'], counts['failed'],
+                              time.time() - started_at)
+        logger.info('Digest of %s sent: %s', run_date, report)
+        return report
+
+    async def _get_rates(self) -> CatalogSnapshot:
+        try:
+            return await self._catalog.refresh()
+        except Exception:
+            if self._catalog.snapshot is None:
+                raise
+            logger.warning('Failed to refresh rates for the digest, the last known ones are sent', exc_info=True)
+            return self._catalog.snapshot
+
+    async def _send_all(self, bot: telegram.Bot, queue: asyncio.Queue, pacer: _Pacer, run_date: str,
+                        delivered: list[int], counts: dict[str, int]):
+        while not queue.empty():
+            chat_id, text = queue.get_nowait()
+            while True:
+                await pacer.wait()
+                try:
+                    await bot.send_message(chat_id=chat_id, text=text, parse_mode=telegram.constants.ParseMode.HTML)
+                    counts['sent'] += 1
+                    break
+                except RetryAfter as e:
+                    retry_after = e.retry_after
+                    pacer.pause(retry_after.total_seconds() if isinstance(retry_after, datetime.timedelta)
+                                else retry_after)
+                except Forbidden:
+                    # the bot was blocked or removed from the chat, it won't get digests anymore
+                    counts['failed'] += 1
+                    await asyncio.to_thread(self._repo.unsubscribe, chat_id)
+                    break
+                except TelegramError:
+                    counts['failed'] += 1
+                    logger.warning('Failed to send digest to chat %s', chat_id, exc_info=True)
+                    break
+            # failed chats are marked too, a resumed run shouldn't retry them forever
+            delivered.append(chat_id)
+            if len(delivered) >= self._delivery_batch:
+                batch = delivered[:]
+                delivered.clear()
+                await self._save_delivered(run_date, batch)
+
+    async def _save_delivered(self, run_date: str, chat_ids: list[int]):
+        if chat_ids:
+            await asyncio.to_thread(self._repo.mark_delivered, run_date, chat_ids)
+
+
+def seconds_until(send_at: datetime.time, now: datetime.datetime) -> float:
+    """Seconds from now (UTC) till the next moment of the day equal to send_at (UTC)"""
+    next_run = datetime.datetime.combine(now.date(), send_at, tzinfo=datetime.timezone.utc)
+    if next_run <= now:
+        next_run += datetime.timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+
+async def run_daily_digest(broadcaster: DigestBroadcaster, repo: Sqlite3DigestRepository, bot: telegram.Bot,
+                           send_at: datetime.time, on_report: Callable[[DigestReport], Awaitable]):
+    """Resumes runs interrupted by a restart, then sends the digest every day at send_at (UTC)"""
+
+    async def run(run_date: str):
+        try:
+            report = await broadcaster.run(bot, run_date)
+        except Exception:
+            logger.exception('Digest of %s failed, it will be resumed on restart', run_date)
+            return
+        if report is not None:
+            await on_report(report)
+
+    for run_date in await asyncio.to_thread(repo.get_unfinished_runs):
+        logger.info('Resuming digest of %s', run_date)
+        await run(run_date)
+    while True:
+        await asyncio.sleep(seconds_until(send_at, datetime.datetime.now(datetime.timezone.utc)))
+        await run(datetime.datetime.now(datetime.timezone.utc).date().isoformat())
@@ -0,0 +1,67 @@
+import csv
+import datetime
+import io
+import json
+import tempfile
+from typing import IO, Iterable, Iterator, Literal
+
+from currency_exchange_tg_bot.catalog import CatalogSnapshot
+
+
+ExportFormat = Literal['csv', 'json']
+ExportTable = Literal['currencies', 'rates']
+
+EXPORT_FORMATS = ('csv', 'json')
+
+EXPORT_FIELDS: dict[str, tuple[str, ...]] = {
+    'currencies': ('code', 'name', 'sign'),
+    'rates': ('base', 'target', 'rate'),
+}
+
+
+def iter_csv(fields: tuple[str, ...], rows: Iterable[tuple]) -> Iterator[str]:
+    """Yields the csv document line by line, the buffer of the writer never holds more than a row"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    yield buffer.getvalue()
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row)
+        yield buffer.getvalue()
+
+
+def iter_json(fields: tuple[str, ...], rows: Iterable[tuple], fetched_at: float) -> Iterator[str]:
+    """Yields the json document row by row: {"fetched_at": ..., "rows": [{field: value, ...}, ...]}"""
+    fetched_at = datetime.datetime.fromtimestamp(fetched_at, datetime.timezone.utc).isoformat()
+    yield f'{{"fetched_at": {json.dumps(fetched_at)}, "rows": ['
+    separator = '\n'
+    for row in rows:
+        yield separator + json.dumps(dict(zip(fields, row)), ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]}\n'
+
+
+def iter_export(snapshot: CatalogSnapshot, table: ExportTable, export_format: ExportFormat) -> Iterator[str]:
+    rows = snapshot.currencies if table == 'currencies' else snapshot.rates
+    fields = EXPORT_FIELDS[table]
+    if export_format == 'csv':
+        return iter_csv(fields, rows)
+    return iter_json(fields, rows, snapshot.fetched_at)
+
+
+def write_spooled(chunks: Iterable[str], max_memory: int) -> IO[bytes]:
+    """
+    Writes the chunks into a file that is kept in memory up to max_memory bytes and rolled over to disk past it,
+    positioned at its start. The caller closes it
+    """
+    file = tempfile.SpooledTemporaryFile(max_size=max_memory, mode='w+b')
+    try:
+        for chunk in chunks:
+            file.write(chunk.encode())
+        file.seek(0)
+    except BaseException:
+        file.close()
+        raise
+    return file
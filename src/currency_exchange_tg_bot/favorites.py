@@ -0,0 +1,202 @@
+import asyncio
+import html
+import logging
+import sqlite3
+from collections import OrderedDict
+from typing import AsyncContextManager, Callable, NamedTuple, Optional
+
+from tabulate import tabulate
+
+from currency_exchange_fapi_client import exceptions as apiexc
+
+from currency_exchange_tg_bot.catalog import Catalog, CatalogSnapshot
+from currency_exchange_tg_bot.config import CurrencyExchangeApiSettings
+
+
+logger = logging.getLogger('favorites')
+
+Pair = tuple[str, str]
+
+
+def create_favorites_schema(connection: sqlite3.Connection):
+    connection.execute('PRAGMA journal_mode=WAL;')
+    with connection:
+        connection.execute(
+            '''CREATE TABLE IF NOT EXISTS favorite_pair (
+               user_id INTEGER,
+               base TEXT,
+               target TEXT,
+               PRIMARY KEY (user_id, base, target)
+               ) WITHOUT ROWID;
+            '''
+        )
+
+
+class Sqlite3FavoritesRepository:
+
+    def __init__(self, connection: Callable[..., sqlite3.Connection]):
+        self._db_connection = connection
+
+    def add(self, user_id: int, pairs: list[Pair]):
+        with self._db_connection() as conn:
+            with conn:
+                conn.executemany('INSERT OR IGNORE INTO favorite_pair VALUES (?, ?, ?);',
+                                 [(user_id, base, target) for base, target in pairs])
+
+    def remove(self, user_id: int, pairs: Optional[list[Pair]] = None) -> int:
+        """Removes the given pairs of the user, or all of them"""
+        with self._db_connection() as conn:
+            with conn:
+                if pairs is None:
+                    return conn.execute('DELETE FROM favorite_pair WHERE user_id = ?;', (user_id,)).rowcount
+                return sum(
+                    conn.execute('DELETE FROM favorite_pair WHERE user_id = ? AND base = ? AND target = ?;',
+                                 (user_id, base, target)).rowcount
+                    for base, target in pairs
+                )
+
+    def get_pairs(self, user_id: int) -> list[Pair]:
+        with self._db_connection() as conn:
+            return conn.execute('SELECT base, target FROM favorite_pair WHERE user_id = ? ORDER BY base, target;',
+                                (user_id,)).fetchall()
+
+
+def render_favorites(pairs: tuple[Pair, ...], rates: dict[Pair, Optional[float]]) -> str:
+    rows = [(base, target, '—' if rates.get((base, target)) is None else rates[(base, target)])
+            for base, target in pairs]
+    table = html.escape(tabulate(rows, tablefmt='psql'))
+    return f'Избранные курсы\U00002B50\n<pre>{table}</pre>'
+
+
+class _Rendered(NamedTuple):
+    pairs: tuple[Pair, ...]
+    # rates of the pairs in the catalog at render time, None for pairs it didn't have
+    catalog_rates: tuple[Optional[float], ...]
+    # time the catalog was fetched at, if some rates were fetched from the service instead: their underlying
+    # rates may have changed with any refresh of the catalog, so the table is kept only until the next one
+    fetched_with: Optional[float]
+    text: str
+
+
+class FavoritesDashboard:
+    """
+    Favorite pairs of users and the table of their rates sent on /myrates.
+    Rates are taken from the catalog, pairs it doesn't have are fetched from the service concurrently
+    in one session. The table of each user is kept until a rate of one of the pairs changes in the catalog,
+    or until the next refresh of the catalog if some rates were fetched from the service (or the pairs are edited),
+    so repeated requests between catalog refreshes are answered without rendering.
+    Tables are evicted starting from the least recently requested once there are more than max_rendered
+    """
+
+    def __init__(self, repo: Sqlite3FavoritesRepository, catalog: Catalog,
+                 api_session_factory: Callable[..., AsyncContextManager], api_settings: CurrencyExchangeApiSettings,
+                 *, max_rendered: int):
+        self._repo = repo
+        self._catalog = catalog
+        self.api_session = api_session_factory
+        self.api_settings = api_settings
+        self._max_rendered = max_rendered
+        self._rendered: OrderedDict[int, _Rendered] = OrderedDict()
+        # the rates of the last seen snapshot by pair, rebuilt once per catalog refresh
+        self._indexed: tuple[Optional[CatalogSnapshot], dict[Pair, float]] = (None, {})
+        # pairs of users, kept next to their tables so that a cached table costs no db read
+        self._pairs: dict[int, tuple[Pair, ...]] = {}
+
+    def __len__(self):
+        return len(self._rendered)
+
+    async def get_pairs(self, user_id: int) -> tuple[Pair, ...]:
+        pairs = self._pairs.get(user_id)
+        if pairs is None:
+            pairs = tuple(await asyncio.to_thread(self._repo.get_pairs, user_id))
+        return pairs
+
+    async def add(self, user_id: int, pairs: list[Pair]):
+        await asyncio.to_thread(self._repo.add, user_id, pairs)
+        self.forget(user_id)
+
+    async def remove(self, user_id: int, pairs: Optional[list[Pair]] = None) -> int:
+        removed = await asyncio.to_thread(self._repo.remove, user_id, pairs)
+        self.forget(user_id)
+        return removed
+
+    def forget(self, user_id: int):
+        self._rendered.pop(user_id, None)
+        self._pairs.pop(user_id, None)
+
+    async def render(self, user_id: int) -> Optional[str]:
+        """The table of the user's favorite rates, None if the user has no favorites"""
+        rendered = self._rendered.get(user_id)
+        catalog_rates = self._get_catalog_rates()
+        snapshot = self._catalog.snapshot
+        if (rendered is not None
+                and tuple(catalog_rates.get(pair) for pair in rendered.pairs) == rendered.catalog_rates
+                and (rendered.fetched_with is None or rendered.fetched_with == snapshot.fetched_at)):
+            self._rendered.move_to_end(user_id)
+            return rendered.text
+
+        pairs = await self.get_pairs(user_id)
+        if not pairs:
+            return None
+        rates: dict[Pair, Optional[float]] = {pair: catalog_rates.get(pair) for pair in pairs}
+        missing = [pair for pair, rate in rates.items() if rate is None]
+        complete = True
+        fetched_with = None
+        if missing:
+            fetched, complete = await self._fetch_rates(missing)
+            rates.update(fetched)
+            fetched_with = snapshot.fetched_at if snapshot is not None else None
+
+        text = render_favorites(pairs, rates)
+        # a table with rates the service failed to return is not kept, the next request retries them;
+        # nor is one with fetched rates while there is no catalog, as there is no refresh to keep it until
+        if complete and (not missing or snapshot is not None):
+            self._keep(user_id, _Rendered(pairs, tuple(catalog_rates.get(pair) for pair in pairs), fetched_with, text))
+        return text
+
+    def _get_catalog_rates(self) -> dict[Pair, float]:
+        snapshot = self._catalog.snapshot
+        if snapshot is None:
+            return {}
+        if self._catalog.is_stale(snapshot):
+            self._catalog.revalidate()
+        indexed_snapshot, rates = self._indexed
+        if indexed_snapshot is not snapshot:
+            rates = {(base, target): rate for base, target, rate in snapshot.rates}
+            self._indexed = (snapshot, rates)
+        return rates
+
+    async def _fetch_rates(self, pairs: list[Pair]) -> tuple[dict[Pair, Optional[float]], bool]:
+        """Rates of the pairs from the service, None for the missing ones; False if some requests failed"""
+        timeout = self.api_settings.request_timeout
+        try:
+            async with self.api_session() as api:
+                results = await asyncio.gather(
+                    *(api.currency_exchange_get_exchange_rate(f'{base}{target}', _request_timeout=timeout)
+                      for base, target in pairs),
+                    return_exceptions=True,
+                )
+        except Exception:
+            logger.warning('Failed to fetch favorite rates %s', pairs, exc_info=True)
+            return {pair: None for pair in pairs}, False
+
+        rates: dict[Pair, Optional[float]] = {}
+        complete = True
+        for pair, result in zip(pairs, results):
+            if isinstance(result, apiexc.NotFoundException):
+                rates[pair] = None
+            elif isinstance(result, BaseException):
+                logger.warning('Failed to fetch favorite rate %s%s', *pair, exc_info=result)
+                rates[pair] = None
+                complete = False
+            else:
+                rates[pair] = float(result.rate)
+        return rates, complete
+
+    def _keep(self, user_id: int, rendered: _Rendered):
+        self._rendered[user_id] = rendered
+        self._rendered.move_to_end(user_id)
+        self._pairs[user_id] = rendered.pairs
+        while len(self._rendered) > self._max_rendered:
+            evicted, _ = self._rendered.popitem(last=False)
+            self._pairs.pop(evicted, None)
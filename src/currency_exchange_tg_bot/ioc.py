@@ -1,44 +1,533 @@
+import asyncio
+import logging
+from functools import cached_property, partial
+from pathlib import Path
+from typing import Optional
+
+from telegram.ext import Application
 from currency_exchange_fapi_client import Configuration, CurrencyExchangeApi, AuthApi
 
 from currency_exchange_tg_bot import config
-from currency_exchange_tg_bot.accesstokens import Sqlite3TokenRepository, get_sqlite3_connection, AccessTokenService
-from currency_exchange_tg_bot.apitools import api_session_factory
+from currency_exchange_tg_bot.accesstokens import (Sqlite3TokenRepository, get_sqlite3_connection, AccessTokenService,
+                                                   CredentialPool, PooledCredential)
+from currency_exchange_tg_bot.apitools import api_session_factory, RequestHedging
 from currency_exchange_tg_bot.botcallbacks import (StartCallback, GetAllCurrenciesCallback,
                                                    GetCurrencyConversationCallbacks, GetAllExchangeRatesCallback,
                                                    GetExchangeRateCallbacks, AddCurrencyConversationCallbacks,
                                                    AddExchangeRateConversationCallbacks,
                                                    UpdateExchangeRateConversationCallbacks,
                                                    ConvertCurrencyConversationCallbacks, ErrorHandler,
-                                                   RevokeTokensCallback, ExpungeTokensCallback)
+                                                   RevokeTokensCallback, ExpungeTokensCallback, RateHistoryCallback,
+                                                   RateMatrixCallback, ArbitrageCallback, RateLimitCallback,
+                                                   MetricsCallback, ProfileCallback, TrafficCaptureCallback,
+                                                   DigestSubscriptionCallbacks, MemoryCallback, ExportCallback,
+                                                   AdmissionControlCallback, FavoritesCallbacks)
+from currency_exchange_tg_bot.botcommands import set_scoped_commands
+from currency_exchange_tg_bot.admission import AdmissionPolicy
 from currency_exchange_tg_bot.adminsrecord import AdminsRecord
 from currency_exchange_tg_bot.accesstokens.db import create_schema
+from currency_exchange_tg_bot.backgroundtasks import BackgroundTasks
+from currency_exchange_tg_bot.memory import MemoryInspector, render_report
+from currency_exchange_tg_bot.metrics import Metrics
+from currency_exchange_tg_bot.profiling import EventLoopProfiler
+from currency_exchange_tg_bot.ratelimit import RateLimiter, TokenBuckets
+from currency_exchange_tg_bot.catalog import Catalog, CatalogSnapshot, Sqlite3CatalogStore, create_catalog_store_schema
+from currency_exchange_tg_bot.currencysearch import CurrencySearchIndex
+from currency_exchange_tg_bot.digest import (Sqlite3DigestRepository, DigestBroadcaster, DigestReport,
+                                             create_digest_schema, run_daily_digest)
+from currency_exchange_tg_bot.favorites import Sqlite3FavoritesRepository, FavoritesDashboard, create_favorites_schema
+from currency_exchange_tg_bot.ratehistory import RateHistoryStore, RateHistoryRecorder
+from currency_exchange_tg_bot.startuptimer import StartupTimer
+from currency_exchange_tg_bot.traffic import Pseudonymizer, TrafficRecorder, make_secret
+from currency_exchange_tg_bot.watchdog import LoopWatchdog
+from currency_exchange_tg_bot.writecoalescer import WriteCoalescer
+
+
+logger = logging.getLogger('ioc')
+
+
+class SharedContainer:
+    """
+    Holds dependencies shared by all bots served by the process: settings of the service and of the process,
+    databases of tokens, connections to the service with their credentials, the catalog and the caches built
+    from it. Each of them is resolved on first access, so that importing this module neither reads settings
+    nor touches the database
+    """
+
+    def __init__(self):
+        self.startup_timer = StartupTimer()
+        self.background_tasks = BackgroundTasks()
+        self._started: Optional[asyncio.Task] = None
+        self._bots_running = 0
+
+    @cached_property
+    def bot_settings(self) -> config.TgBotSettings:
+        """Settings of the main bot, process wide ones (logging, watchdog, memory reports) are taken from them"""
+        return config.TgBotSettings(send_chat_ids_on_start=True)
+
+    @cached_property
+    def extra_bot_settings(self) -> list[config.TgBotSettings]:
+        main = self.bot_settings
+        base = main.model_dump(exclude={'extra_bots', 'userdata_connection_uri', 'admin_records_file'})
+        userdata_uri = Path(self.digest_settings.connection_uri)
+        settings = []
+        for overrides in main.extra_bots:
+            bot_settings = config.TgBotSettings(**{**base, 'extra_bots': [], **overrides})
+            if 'admin_records_file' not in overrides:
+                # admins are users of a bot and errors are reported to their chats with it, so each bot has its own
+                admin_records = Path(main.admin_records_file)
+                bot_settings.admin_records_file = admin_records.with_name(
+                    f'{admin_records.stem}.{bot_settings.bot_name}{admin_records.suffix}'
+                )
+            if bot_settings.userdata_connection_uri is None:
+                # subscriptions and favorites belong to the chats of a bot, so each bot keeps them in its own db
+                bot_settings.userdata_connection_uri = str(
+                    userdata_uri.with_name(f'{userdata_uri.stem}.{bot_settings.bot_name}{userdata_uri.suffix}')
+                )
+            settings.append(bot_settings)
+        names = [main.bot_name] + [bot_settings.bot_name for bot_settings in settings]
+        if len(set(names)) != len(names):
+            raise ValueError(f'Bot names must be unique, got {names}')
+        return settings
+
+    @cached_property
+    def api_settings(self) -> config.CurrencyExchangeApiSettings:
+        return config.CurrencyExchangeApiSettings()
+
+    @cached_property
+    def db_settings(self) -> config.Sqlite3Settings:
+        return config.Sqlite3Settings()
+
+    @cached_property
+    def history_settings(self) -> config.RatesHistorySettings:
+        return config.RatesHistorySettings()
+
+    @cached_property
+    def catalog_settings(self) -> config.CatalogSettings:
+        return config.CatalogSettings()
+
+    @cached_property
+    def capture_settings(self) -> config.TrafficCaptureSettings:
+        return config.TrafficCaptureSettings()
+
+    @cached_property
+    def digest_settings(self) -> config.DigestSettings:
+        return config.DigestSettings()
+
+    @cached_property
+    def db_connection(self):
+        db_connection = get_sqlite3_connection(self.db_settings.connection_uri)
+        with db_connection() as conn:
+            create_schema(conn)
+        return db_connection
+
+    @cached_property
+    def token_repo(self) -> Sqlite3TokenRepository:
+        return Sqlite3TokenRepository(self.db_connection)
+
+    @cached_property
+    def auth_token_gateway(self) -> AccessTokenService:
+        return AccessTokenService(self.token_repo, self.api_settings,
+                                  lock_ttl=self.db_settings.token_lock_ttl,
+                                  lock_poll_interval=self.db_settings.token_lock_poll_interval)
+
+    @cached_property
+    def credential_pool(self) -> CredentialPool:
+        settings = self.api_settings
+        credentials = [PooledCredential(settings.username, settings.password, self.auth_token_gateway)]
+        for extra in settings.extra_credentials:
+            token_service = AccessTokenService(Sqlite3TokenRepository(self.db_connection, owner=extra.username),
+                                               settings, username=extra.username, password=extra.password,
+                                               lock_ttl=self.db_settings.token_lock_ttl,
+                                               lock_poll_interval=self.db_settings.token_lock_poll_interval)
+            credentials.append(PooledCredential(extra.username, extra.password, token_service))
+        return CredentialPool(credentials, strategy=settings.credential_selection,
+                              cooldown=settings.credential_cooldown)
+
+    @cached_property
+    def configuration(self) -> Configuration:
+        return Configuration(self.api_settings.host,
+                             username=self.api_settings.username,
+                             password=self.api_settings.password)
+
+    @cached_property
+    def request_hedging(self) -> RequestHedging:
+        return RequestHedging(self.api_settings, self.metrics)
+
+    @cached_property
+    def traffic_recorder(self) -> TrafficRecorder | None:
+        settings = self.capture_settings
+        if not settings.enabled:
+            return None
+        return TrafficRecorder(settings.file, Pseudonymizer(make_secret(settings.secret)))
+
+    @cached_property
+    def cur_exch_api_factory(self):
+        # auth api responses hold tokens, so only the currency exchange api is captured
+        return api_session_factory(self.credential_pool, self.configuration, CurrencyExchangeApi,
+                                   hedging=self.request_hedging, capture=self.traffic_recorder)
+
+    @cached_property
+    def auth_api_factory(self):
+        return api_session_factory(self.credential_pool, self.configuration, AuthApi,
+                                   ensure_access_token_activeness=False)
+
+    @cached_property
+    def exchange_rate_writes(self) -> WriteCoalescer:
+        return WriteCoalescer(self._write_exchange_rate, self.api_settings.exchange_rate_write_window, self.metrics,
+                              name='exchange_rate')
+
+    @cached_property
+    def metrics(self) -> Metrics:
+        return Metrics()
+
+    @cached_property
+    def watchdog(self) -> LoopWatchdog:
+        return LoopWatchdog(self.metrics, interval=self.bot_settings.watchdog_interval,
+                            threshold=self.bot_settings.watchdog_threshold)
+
+    @cached_property
+    def event_loop_profiler(self) -> EventLoopProfiler:
+        # all bots run on one event loop, so there is one profile of it at a time
+        return EventLoopProfiler()
+
+    @cached_property
+    def memory_inspector(self) -> MemoryInspector:
+        inspector = MemoryInspector(top=self.bot_settings.memory_report_top,
+                                    frames=self.bot_settings.memory_trace_frames)
+        # state that lives as long as the process and grows with its users, bots add their own on startup
+        inspector.register('currency_search_index.currencies', lambda: len(self.currency_search_index))
+        inspector.register('catalog.currencies',
+                           lambda: len(self.catalog.snapshot.currencies) if self.catalog.snapshot else 0)
+        inspector.register('catalog.rates', lambda: len(self.catalog.snapshot.rates) if self.catalog.snapshot else 0)
+        inspector.register('metrics.series', lambda: len(self.metrics))
+        inspector.register('exchange_rate_writes.pending', lambda: self.exchange_rate_writes.pending_writes)
+        return inspector
+
+    @cached_property
+    def currency_search_index(self) -> CurrencySearchIndex:
+        return CurrencySearchIndex()
+
+    @cached_property
+    def catalog_store(self) -> Sqlite3CatalogStore | None:
+        uri = self.catalog_settings.store_connection_uri
+        if uri is None:
+            return None
+        db_connection = get_sqlite3_connection(uri)
+        with db_connection() as conn:
+            create_catalog_store_schema(conn)
+        return Sqlite3CatalogStore(db_connection)
+
+    @cached_property
+    def catalog(self) -> Catalog:
+        settings = self.catalog_settings
+        catalog = Catalog(self.cur_exch_api_factory, self.api_settings, settings.snapshot_file, settings.max_age,
+                          store=self.catalog_store, lease_ttl=settings.refresher_lease_ttl)
+        catalog.add_listener(self._sync_currency_search_index)
+        # history files may be shared by the processes as well, so only the process that fetched a catalog records it
+        catalog.add_listener(self.rates_history_recorder, fetched_only=True)
+        return catalog
+
+    @cached_property
+    def rates_history(self) -> RateHistoryStore:
+        return RateHistoryStore(self.history_settings.directory)
+
+    @cached_property
+    def rates_history_recorder(self) -> RateHistoryRecorder:
+        return RateHistoryRecorder(self.rates_history)
+
+    async def start(self):
+        """
+        Called on startup of each bot: the first call prepares the database, loads the catalog snapshot and starts
+        background tasks, others wait for it
+        """
+        if self._started is None:
+            self._started = asyncio.create_task(self._start())
+        await asyncio.shield(self._started)
+        self._bots_running += 1
+
+    async def stop(self):
+        """Called on shutdown of each bot, the last one stops background tasks"""
+        self._bots_running -= 1
+        if self._bots_running > 0:
+            return
+        await self.background_tasks.stop()
+        await self.catalog.release_lease()
+        if self.traffic_recorder is not None:
+            self.traffic_recorder.close()
+
+    async def _start(self):
+        timer = self.startup_timer
+        with timer.phase('database'):
+            self.db_connection
+            self.catalog_store
+        with timer.phase('catalog snapshot'):
+            snapshot = await self.catalog.load()
+            if snapshot is not None:
+                await self._sync_currency_search_index(snapshot)
+        with timer.phase('background tasks'):
+            self._start_background_tasks()
+
+    def _start_background_tasks(self):
+        self.background_tasks.start(self.watchdog.run(), 'loop watchdog')
+        if self.bot_settings.memory_tracing_at_startup:
+            self.memory_inspector.start_tracing()
+        self.background_tasks.start_periodic(self._log_memory_report, self.bot_settings.memory_report_interval,
+                                             'memory report', immediately=True)
+        self.background_tasks.start_periodic(self._remove_expired_tokens,
+                                             self.db_settings.expired_tokens_cleanup_interval,
+                                             'expired tokens cleanup')
+        if self.traffic_recorder is not None:
+            self.background_tasks.start_periodic(self._flush_traffic_capture, 5.0, 'traffic capture flush')
+        # the search index and the rates history are updated by the catalog listeners on each refresh
+        self.background_tasks.start_periodic(self.catalog.refresh, self.catalog_settings.refresh_interval,
+                                             'catalog refresh', immediately=True)
+        if self.catalog_store is not None:
+            self.background_tasks.start_periodic(self.catalog.sync, self.catalog_settings.store_poll_interval,
+                                                 'catalog sync')
+
+    async def _sync_currency_search_index(self, snapshot: CatalogSnapshot):
+        self.currency_search_index.update(snapshot.currencies)
+
+    async def _log_memory_report(self):
+        report = await asyncio.to_thread(self.memory_inspector.report)
+        logger.info('Memory report:\n%s', render_report(report))
+
+    async def _flush_traffic_capture(self):
+        await asyncio.to_thread(self.traffic_recorder.flush)
+
+    async def _remove_expired_tokens(self):
+        await asyncio.to_thread(self.credential_pool.remove_expired_tokens)
+
+    async def _write_exchange_rate(self, pair: tuple[str, str], rate: float):
+        base, target = pair
+        async with self.cur_exch_api_factory() as api:
+            return await api.currency_exchange_update_exchange_rate(f'{base}{target}', rate,
+                                                                    _request_timeout=self.api_settings.request_timeout)
+
+
+class Container:
+    """
+    Holds dependencies of one bot: its settings, admins, rate limits, user data and callbacks, built on top
+    of the shared ones. Several containers over one shared container serve several bots from one process.
+    Dependencies are resolved on first access, like the shared ones
+    """
+
+    def __init__(self, shared: Optional[SharedContainer] = None, bot_settings: Optional[config.TgBotSettings] = None):
+        self.shared = shared if shared is not None else SharedContainer()
+        self.startup_timer = self.shared.startup_timer
+        self.background_tasks = BackgroundTasks()
+        if bot_settings is not None:
+            self.bot_settings = bot_settings
+
+    @cached_property
+    def bot_settings(self) -> config.TgBotSettings:
+        return self.shared.bot_settings
+
+    @cached_property
+    def userdata_db_connection(self):
+        uri = self.bot_settings.userdata_connection_uri or self.shared.digest_settings.connection_uri
+        db_connection = get_sqlite3_connection(uri)
+        with db_connection() as conn:
+            create_digest_schema(conn)
+            create_favorites_schema(conn)
+        return db_connection
+
+    @cached_property
+    def digest_repo(self) -> Sqlite3DigestRepository:
+        return Sqlite3DigestRepository(self.userdata_db_connection)
+
+    @cached_property
+    def digest_broadcaster(self) -> DigestBroadcaster:
+        digest_settings = self.shared.digest_settings
+        return DigestBroadcaster(self.digest_repo, self.shared.catalog,
+                                 messages_per_second=digest_settings.messages_per_second,
+                                 concurrency=digest_settings.concurrency)
+
+    @cached_property
+    def favorites_repo(self) -> Sqlite3FavoritesRepository:
+        return Sqlite3FavoritesRepository(self.userdata_db_connection)
+
+    @cached_property
+    def favorites_dashboard(self) -> FavoritesDashboard:
+        return FavoritesDashboard(self.favorites_repo, self.shared.catalog, self.shared.cur_exch_api_factory,
+                                  self.shared.api_settings, max_rendered=self.bot_settings.favorites_max_rendered)
+
+    @cached_property
+    def admins_rec(self) -> AdminsRecord:
+        return AdminsRecord(self.bot_settings)
+
+    @cached_property
+    def rate_limiter(self) -> RateLimiter:
+        settings = self.bot_settings
+        return RateLimiter(
+            TokenBuckets(settings.rate_limit_user_capacity, settings.rate_limit_user_refill_rate,
+                         settings.rate_limit_max_buckets),
+            TokenBuckets(settings.rate_limit_chat_capacity, settings.rate_limit_chat_refill_rate,
+                         settings.rate_limit_max_buckets),
+        )
+
+    @cached_property
+    def traffic_capture_cb(self) -> TrafficCaptureCallback | None:
+        recorder = self.shared.traffic_recorder
+        return TrafficCaptureCallback(recorder) if recorder is not None else None
+
+    @cached_property
+    def admission_cb(self) -> AdmissionControlCallback:
+        settings = self.bot_settings
+        policy = AdmissionPolicy(max_pending_updates=settings.admission_max_pending_updates,
+                                 max_update_age=settings.admission_max_update_age,
+                                 drop_update_age=settings.admission_drop_update_age)
+        return AdmissionControlCallback(policy, self.shared.catalog, self.admins_rec, self.shared.metrics)
+
+    @cached_property
+    def rate_limit_cb(self) -> RateLimitCallback:
+        return RateLimitCallback(self.rate_limiter, self.admins_rec, self.shared.metrics, self.bot_settings)
+
+    @cached_property
+    def start_cb(self) -> StartCallback:
+        return StartCallback(self.shared.cur_exch_api_factory, self.shared.api_settings,
+                             send_chat_id=self.bot_settings.send_chat_ids_on_start)
+
+    @cached_property
+    def allcurrencies_cb(self) -> GetAllCurrenciesCallback:
+        return GetAllCurrenciesCallback(self.shared.catalog)
+
+    @cached_property
+    def allexchange_rates_cb(self) -> GetAllExchangeRatesCallback:
+        return GetAllExchangeRatesCallback(self.shared.catalog)
+
+    @cached_property
+    def export_cb(self) -> ExportCallback:
+        return ExportCallback(self.shared.catalog, self.bot_settings)
+
+    @cached_property
+    def get_currency_cbs(self) -> GetCurrencyConversationCallbacks:
+        shared = self.shared
+        return GetCurrencyConversationCallbacks(shared.currency_search_index, shared.catalog,
+                                                shared.cur_exch_api_factory, shared.api_settings)
+
+    @cached_property
+    def get_exchange_rate_cbs(self) -> GetExchangeRateCallbacks:
+        shared = self.shared
+        return GetExchangeRateCallbacks(shared.catalog, shared.cur_exch_api_factory, shared.api_settings)
+
+    @cached_property
+    def add_currency_cbs(self) -> AddCurrencyConversationCallbacks:
+        shared = self.shared
+        return AddCurrencyConversationCallbacks(shared.currency_search_index, shared.catalog,
+                                                shared.cur_exch_api_factory, shared.api_settings)
+
+    @cached_property
+    def add_exchange_rate_cbs(self) -> AddExchangeRateConversationCallbacks:
+        shared = self.shared
+        return AddExchangeRateConversationCallbacks(shared.catalog, shared.cur_exch_api_factory, shared.api_settings)
+
+    @cached_property
+    def update_exchange_rate_cbs(self) -> UpdateExchangeRateConversationCallbacks:
+        shared = self.shared
+        return UpdateExchangeRateConversationCallbacks(shared.exchange_rate_writes, shared.catalog,
+                                                       shared.cur_exch_api_factory, shared.api_settings)
+
+    @cached_property
+    def convert_currency_cbs(self) -> ConvertCurrencyConversationCallbacks:
+        return ConvertCurrencyConversationCallbacks(self.shared.cur_exch_api_factory, self.shared.api_settings)
+
+    @cached_property
+    def history_cb(self) -> RateHistoryCallback:
+        shared = self.shared
+        return RateHistoryCallback(shared.rates_history, shared.history_settings, shared.cur_exch_api_factory,
+                                   shared.api_settings)
+
+    @cached_property
+    def digest_subscription_cbs(self) -> DigestSubscriptionCallbacks:
+        return DigestSubscriptionCallbacks(self.digest_repo, self.shared.digest_settings.max_pairs)
+
+    @cached_property
+    def favorites_cbs(self) -> FavoritesCallbacks:
+        return FavoritesCallbacks(self.favorites_dashboard, self.bot_settings.favorites_max_pairs)
+
+    @cached_property
+    def revoke_tokens_cb(self) -> RevokeTokensCallback:
+        return RevokeTokensCallback(self.shared.credential_pool, self.admins_rec, self.shared.auth_api_factory,
+                                    self.shared.api_settings)
+
+    @cached_property
+    def expunge_tokens_cb(self) -> ExpungeTokensCallback:
+        return ExpungeTokensCallback(self.shared.credential_pool, self.admins_rec)
+
+    @cached_property
+    def rate_matrix_cb(self) -> RateMatrixCallback:
+        return RateMatrixCallback(self.admins_rec, self.shared.cur_exch_api_factory, self.shared.api_settings,
+                                  tolerance=self.bot_settings.arbitrage_tolerance)
+
+    @cached_property
+    def arbitrage_cb(self) -> ArbitrageCallback:
+        return ArbitrageCallback(self.admins_rec, self.shared.cur_exch_api_factory, self.shared.api_settings,
+                                 tolerance=self.bot_settings.arbitrage_tolerance)
+
+    @cached_property
+    def metrics_cb(self) -> MetricsCallback:
+        return MetricsCallback(self.shared.metrics, self.admins_rec)
+
+    @cached_property
+    def profile_cb(self) -> ProfileCallback:
+        return ProfileCallback(self.shared.event_loop_profiler, self.admins_rec, self.bot_settings)
+
+    @cached_property
+    def memory_cb(self) -> MemoryCallback:
+        return MemoryCallback(self.shared.memory_inspector, self.admins_rec)
+
+    @cached_property
+    def error_handler(self) -> ErrorHandler:
+        return ErrorHandler(self.admins_rec, self.bot_settings)
+
+    async def startup(self, app: Application):
+        """
+        Runs as Application.post_init: starts the shared dependencies unless another bot has, prepares the user data
+        database and pushes bot commands before polling starts
+        """
+        await self.shared.start()
+        timer = self.startup_timer
+        name = self.bot_settings.bot_name
+        with timer.phase(f'{name} database'):
+            self.userdata_db_connection
+        with timer.phase(f'{name} commands'):
+            await set_scoped_commands(app.bot, self.admins_rec.read_ids())
+        with timer.phase(f'{name} background tasks'):
+            self._register_memory_sizers()
+            self._start_background_tasks(app)
+        logger.info(timer.report())
+
+    async def shutdown(self, app: Application):
+        """Runs as Application.post_shutdown, after polling has stopped"""
+        logger.info('Shutting down bot %s', self.bot_settings.bot_name)
+        await self.background_tasks.stop()
+        await self.shared.stop()
+
+    def _register_memory_sizers(self):
+        name = self.bot_settings.bot_name
+        inspector = self.shared.memory_inspector
+        inspector.register(f'{name}.convert_currency.conversations',
+                           lambda: self.convert_currency_cbs.conversations_in_progress)
+        inspector.register(f'{name}.rate_limiter.user_buckets', lambda: len(self.rate_limiter.user_buckets))
+        inspector.register(f'{name}.rate_limiter.chat_buckets', lambda: len(self.rate_limiter.chat_buckets))
+        inspector.register(f'{name}.favorites_dashboard.rendered', lambda: len(self.favorites_dashboard))
+
+    def _start_background_tasks(self, app: Application):
+        self.background_tasks.start(
+            run_daily_digest(self.digest_broadcaster, self.digest_repo, app.bot, self.shared.digest_settings.send_at,
+                             partial(self._report_digest, app)),
+            f'{self.bot_settings.bot_name} daily digest'
+        )
+
+    async def _report_digest(self, app: Application, report: DigestReport):
+        text = (f'Digest of {report.run_date} sent to {report.sent} of {report.recipients} chats '
+                f'({report.failed} failed, {report.distinct_messages} distinct messages) '
+                f'in {report.duration:.0f} s')
+        await asyncio.gather(*(app.bot.send_message(chat_id=chat_id, text=text)
+                               for chat_id in self.admins_rec.read_ids()), return_exceptions=True)
+
 
-bot_settings = config.TgBotSettings(send_chat_ids_on_start=True)
-api_settings = config.CurrencyExchangeApiSettings()
-db_settings = config.Sqlite3Settings()
-
-db_connection = get_sqlite3_connection(db_settings.connection_uri)
-with db_connection() as conn:
-    create_schema(conn)
-
-token_repo = Sqlite3TokenRepository(db_connection)
-auth_token_gateway = AccessTokenService(token_repo, api_settings)
-configuration = Configuration(api_settings.host,
-                              username=api_settings.username,
-                              password=api_settings.password)
-cur_exch_api_factory = api_session_factory(auth_token_gateway, configuration, CurrencyExchangeApi)
-auth_api_factory = api_session_factory(auth_token_gateway, configuration, AuthApi, ensure_access_token_activeness=False)
-admins_rec = AdminsRecord(bot_settings)
-
-start_cb = StartCallback(cur_exch_api_factory, api_settings, send_chat_id=bot_settings.send_chat_ids_on_start)
-allcurrencies_cb = GetAllCurrenciesCallback(cur_exch_api_factory, api_settings)
-allexchange_rates_cb = GetAllExchangeRatesCallback(cur_exch_api_factory, api_settings)
-get_currency_cbs = GetCurrencyConversationCallbacks(cur_exch_api_factory, api_settings)
-get_exchange_rate_cbs = GetExchangeRateCallbacks(cur_exch_api_factory, api_settings)
-add_currency_cbs = AddCurrencyConversationCallbacks(cur_exch_api_factory, api_settings)
-add_exchange_rate_cbs = AddExchangeRateConversationCallbacks(cur_exch_api_factory, api_settings)
-update_exchange_rate_cbs = UpdateExchangeRateConversationCallbacks(cur_exch_api_factory, api_settings)
-convert_currency_cbs = ConvertCurrencyConversationCallbacks(cur_exch_api_factory, api_settings)
-revoke_tokens_cb = RevokeTokensCallback(auth_token_gateway, admins_rec, auth_api_factory, api_settings)
-expunge_tokens_cb = ExpungeTokensCallback(auth_token_gateway, admins_rec)
-error_handler = ErrorHandler(admins_rec, bot_settings)
\ No newline at end of file
+shared_container = SharedContainer()
+container = Container(shared_container)
@@ -1,7 +1,13 @@
+import contextvars
+import copy
+import json
 import logging
+import logging.handlers
 import sys
 
-from currency_exchange_tg_bot.ioc import bot_settings
+
+# fields of an update being handled (bot, update_id, chat_id, command), attached to every record logged while handling it
+update_log_context: contextvars.ContextVar[dict] = contextvars.ContextVar('update_log_context', default={})
 
 
 def info_and_below_logrecord_filter(logrecord: logging.LogRecord):
@@ -10,10 +16,50 @@ def info_and_below_logrecord_filter(logrecord: logging.LogRecord):
 	return True
 
 def silence_httpx_and_httpcore_logs_filter(logrecord: logging.LogRecord):
-	if logrecord.name in ('httpx', 'httpcore'):
+	# runs on the queue handler, so only records that some handler (stderr) would accept are enqueued
+	if logrecord.name.partition('.')[0] in ('httpx', 'httpcore') and logrecord.levelno < logging.WARNING:
 		return False
 	return True
 
+def add_update_context_filter(logrecord: logging.LogRecord):
+	# context variables are only visible in the thread that logs, so they are copied to the record before enqueuing
+	logrecord.__dict__.update(update_log_context.get())
+	return True
+
+
+class DeferredFormattingQueueHandler(logging.handlers.QueueHandler):
+	"""
+	Merges the message with its args before enqueuing, so a mutable arg changed right after the log call
+	is logged as it was at the call, and leaves formatting the record and its traceback to the listener thread
+	instead of doing it on the event loop
+	"""
+
+	def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+		record = copy.copy(record)
+		record.msg = record.getMessage()
+		record.args = None
+		return record
+
+
+class JsonFormatter(logging.Formatter):
+
+	context_fields = ('bot', 'update_id', 'chat_id', 'command')
+
+	def format(self, record: logging.LogRecord) -> str:
+		entry = {
+			'time': self.formatTime(record, self.datefmt),
+			'name': record.name,
+			'level': record.levelname,
+			'message': record.getMessage(),
+		}
+		for field in self.context_fields:
+			value = getattr(record, field, None)
+			if value is not None:
+				entry[field] = value
+		if record.exc_info:
+			entry['exc_info'] = self.formatException(record.exc_info)
+		return json.dumps(entry, ensure_ascii=False)
+
 
 LOGGING_CONF = {
 	"version": 1,
@@ -22,7 +68,11 @@ LOGGING_CONF = {
 		"standard": {
 			"format": "%(asctime)s %(name)s (%(levelname)s): %(message)s",
 			"datefmt": "%Y-%m-%d %H:%M:%S",
-		}
+		},
+		"json": {
+			"()": JsonFormatter,
+			"datefmt": "%Y-%m-%d %H:%M:%S",
+		},
 	},
 	"handlers": {
 		"to_stdout": {
@@ -30,7 +80,7 @@ LOGGING_CONF = {
 			"class": "logging.StreamHandler",
 			"formatter": "standard",
 			"stream": sys.stdout,
-			"filters": [info_and_below_logrecord_filter, silence_httpx_and_httpcore_logs_filter],
+			"filters": [info_and_below_logrecord_filter],
 		},
 		"to_stderr": {
 			"level": "WARNING",
@@ -38,9 +88,30 @@ LOGGING_CONF = {
 			"formatter": "standard",
 			"stream": sys.stderr,
 		},
+		"queue": {
+			"class": "currency_exchange_tg_bot.loggingconf.DeferredFormattingQueueHandler",
+			"handlers": ["to_stdout", "to_stderr"],
+			"respect_handler_level": True,
+			"filters": [silence_httpx_and_httpcore_logs_filter, add_update_context_filter],
+		},
 	},
 	"root": {
-		"handlers": ["to_stdout", "to_stderr"],
-		"level": bot_settings.log_level,
+		"handlers": ["queue"],
+		"level": "INFO",
 	},
 }
+
+
+def get_logging_conf(log_level: str, log_format: str = 'text') -> dict:
+	formatter = 'json' if log_format == 'json' else 'standard'
+	handlers = {
+		name: {**handler, "formatter": formatter} if "formatter" in handler else handler
+		for name, handler in LOGGING_CONF["handlers"].items()
+	}
+	return {**LOGGING_CONF, "handlers": handlers, "root": {**LOGGING_CONF["root"], "level": log_level}}
+
+def start_queue_listener() -> logging.handlers.QueueListener:
+	"""Starts the listener thread created by dictConfig for the queue handler; call after configuring logging"""
+	listener = logging.getHandlerByName('queue').listener
+	listener.start()
+	return listener
@@ -1,31 +1,93 @@
+import asyncio
+import contextlib
 import logging.config
+import signal
+from typing import Optional
 
-from telegram.ext import Application
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from telegram.request import BaseRequest
 
-from currency_exchange_tg_bot.bothandlers import handlers
-from currency_exchange_tg_bot.botcommands import get_commands_and_scopes
-from currency_exchange_tg_bot.ioc import admins_rec, bot_settings, error_handler
-from currency_exchange_tg_bot.loggingconf import LOGGING_CONF
+from currency_exchange_tg_bot.botcallbacks import bind_update_log_context
+from currency_exchange_tg_bot.bothandlers import make_handlers
+from currency_exchange_tg_bot.ioc import Container, container, shared_container
+from currency_exchange_tg_bot.loggingconf import get_logging_conf, start_queue_listener
 
 
-logging.config.dictConfig(LOGGING_CONF)
+def build_application(container: Container, request: Optional[BaseRequest] = None) -> Application:
+    builder = (
+        Application.builder()
+        .token(container.bot_settings.tg_bot_token)
+        .post_init(container.startup)
+        .post_shutdown(container.shutdown)
+    )
+    if request is not None:
+        # Bot API requests go to a fake in benchmarks and traffic replay
+        builder = builder.request(request)
+    application = builder.build()
 
-scoped_commands = get_commands_and_scopes(admins_rec.read_ids()) # used with Bot.set_my_commands
+    if container.traffic_capture_cb is not None:
+        # captured before admission control and the rate limiter, as a replay should face the same limits
+        application.add_handler(TypeHandler(Update, container.traffic_capture_cb), group=-4)
 
-async def app_post_init(app: Application):
-    for scope, commands in scoped_commands:
-        await app.bot.set_my_commands(commands, scope)
+    # groups below 0 run before the command handlers: log records of admission control, the rate limiter
+    # and the handlers carry the update fields, and a shed or limited update never reaches the handlers
+    application.add_handler(TypeHandler(Update, bind_update_log_context), group=-3)
+    application.add_handler(TypeHandler(Update, container.admission_cb), group=-2)
+    application.add_handler(TypeHandler(Update, container.rate_limit_cb), group=-1)
+    application.add_handlers(make_handlers(container))
+    application.add_error_handler(container.error_handler)
 
+    return application
 
-def main():
-    application = Application.builder().token(bot_settings.tg_bot_token).build()
 
-    application.add_handlers(handlers)
-    application.add_error_handler(error_handler)
+async def run_applications(applications: list[Application]):
+    """
+    Polls updates for all applications on one event loop until SIGINT or SIGTERM, what Application.run_polling
+    does for a single one. They are stopped in reverse order, the last one stops the shared dependencies
+    """
+    stop_signal = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop_signal.set)
+
+    async with contextlib.AsyncExitStack() as stack:
+        for application in applications:
+            stack.push_async_callback(application.post_shutdown, application)
+            await stack.enter_async_context(application)
+            await application.post_init(application)
+            await application.updater.start_polling()
+            await application.start()
+            stack.push_async_callback(stop_application, application)
+        await stop_signal.wait()
+
 
-    application.post_init = app_post_init
+async def stop_application(application: Application):
+    await application.updater.stop()
+    await application.stop()
+
+
+def main():
+    timer = container.startup_timer
+    with timer.phase('settings'):
+        bot_settings = container.bot_settings
+        extra_bot_settings = shared_container.extra_bot_settings
+    with timer.phase('logging'):
+        logging.config.dictConfig(get_logging_conf(bot_settings.log_level, bot_settings.log_format))
+        log_listener = start_queue_listener()
+    with timer.phase('application'):
+        application = build_application(container)
+        # extra bots share the connections to the service, tokens and caches of the main one
+        extra_applications = [build_application(Container(shared_container, settings))
+                              for settings in extra_bot_settings]
 
-    application.run_polling()
+    try:
+        if extra_applications:
+            asyncio.run(run_applications([application, *extra_applications]))
+        else:
+            application.run_polling()
+    finally:
+        log_listener.stop()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,137 @@
+import gc
+import linecache
+import resource
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Callable, NamedTuple, Optional
+
+
+# classes of these packages are counted in reports, objects of other ones are too many to tell anything
+_OWN_PACKAGES = ('currency_exchange_tg_bot', 'currency_exchange_fapi_client')
+
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, linecache.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+class AllocationGrowth(NamedTuple):
+    location: str
+    size_diff: int
+    size: int
+    count_diff: int
+
+
+class MemoryReport(NamedTuple):
+    max_rss: int
+    # None while tracemalloc isn't tracing
+    traced: Optional[int]
+    # growth since the previous report, None for the first report after tracing started
+    growth: Optional[list[AllocationGrowth]]
+    object_counts: list[tuple[str, int, int]]
+    structure_sizes: list[tuple[str, int]]
+
+
+class MemoryInspector:
+    """
+    Tells what the process memory is taken by: tracemalloc snapshots are diffed against the previous one
+    to find the allocation sites that grow, objects of the bot's own classes are counted, and sizes
+    of its in-memory structures are taken from the sizers registered for them.
+    Tracing slows every allocation down, so it's on only if started, at startup or by an admin
+    """
+
+    def __init__(self, *, top: int = 10, frames: int = 1):
+        self._top = top
+        self._frames = frames
+        self._sizers: dict[str, Callable[[], int]] = {}
+        self._previous: Optional[tracemalloc.Snapshot] = None
+        self._previous_counts: Counter[str] = Counter()
+        # reports are taken in a thread, a periodic one and one by an admin must not mix their snapshots
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def register(self, name: str, sizer: Callable[[], int]):
+        self._sizers[name] = sizer
+
+    def start_tracing(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self._frames)
+            self._previous = None
+
+    def stop_tracing(self):
+        tracemalloc.stop()
+        self._previous = None
+
+    def report(self) -> MemoryReport:
+        with self._lock:
+            traced = growth = None
+            if tracemalloc.is_tracing():
+                traced = tracemalloc.get_traced_memory()[0]
+                snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+                if self._previous is not None:
+                    stats = [stat for stat in snapshot.compare_to(self._previous, 'lineno') if stat.size_diff > 0]
+                    growth = [AllocationGrowth(str(stat.traceback), stat.size_diff, stat.size, stat.count_diff)
+                              for stat in stats[:self._top]]
+                self._previous = snapshot
+
+            counts = count_own_objects()
+            object_counts = [(name, count, count - self._previous_counts[name])
+                             for name, count in counts.most_common(self._top)]
+            self._previous_counts = counts
+
+        structure_sizes = [(name, sizer()) for name, sizer in sorted(self._sizers.items())]
+        return MemoryReport(max_rss_bytes(), traced, growth, object_counts, structure_sizes)
+
+
+def count_own_objects() -> Counter[str]:
+    counts = Counter()
+    for obj in gc.get_objects():
+        cls = type(obj)
+        # some extension types have a descriptor in place of the module name
+        module = cls.__module__
+        if isinstance(module, str) and module.startswith(_OWN_PACKAGES):
+            counts[f'{module}.{cls.__qualname__}'] += 1
+    return counts
+
+
+def max_rss_bytes() -> int:
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def format_size(size: int) -> str:
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(size) < 1024:
+            return f'{size:.0f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GiB'
+
+
+def render_report(report: MemoryReport) -> str:
+    lines = [f'Max RSS: {format_size(report.max_rss)}']
+    if report.traced is None:
+        lines.append('Tracing is off')
+    else:
+        lines.append(f'Traced: {format_size(report.traced)}')
+        if report.growth is None:
+            lines.append('First snapshot, growth is shown from the next report on')
+        elif not report.growth:
+            lines.append('No allocation site grew since the previous report')
+        else:
+            lines.append('Growing allocation sites:')
+            lines.extend(f'  {format_size(growth.size_diff):>10} ({growth.count_diff:+d} blocks, '
+                         f'{format_size(growth.size)} total) {growth.location}' for growth in report.growth)
+    lines.append('Objects:')
+    lines.extend(f'  {count:>8} ({diff:+d}) {name}' for name, count, diff in report.object_counts)
+    lines.append('Structures:')
+    lines.extend(f'  {size:>8} {name}' for name, size in report.structure_sizes)
+    return '\n'.join(lines)
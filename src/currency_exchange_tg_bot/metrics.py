@@ -0,0 +1,73 @@
+import bisect
+from collections import defaultdict
+
+
+# upper bounds (in seconds) of histogram buckets suitable for latencies
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        # the last count is for values above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    In-process counters and histograms, each identified by a name and a set of labels.
+    Rendered as text in the Prometheus exposition style for the /metrics admin command
+    """
+
+    def __init__(self):
+        self._counters: dict[tuple[str, tuple[tuple[str, str], ...]], float] = defaultdict(float)
+        self._histograms: dict[tuple[str, tuple[tuple[str, str], ...]], Histogram] = {}
+
+    def __len__(self):
+        """Number of series, each set of labels of a name is a series"""
+        return len(self._counters) + len(self._histograms)
+
+    def increment(self, name: str, amount: float = 1, **labels: str):
+        self._counters[(name, tuple(sorted(labels.items())))] += amount
+
+    def counter(self, name: str, **labels: str) -> float:
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def observe(self, name: str, value: float, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def histogram(self, name: str, **labels: str) -> Histogram | None:
+        return self._histograms.get((name, tuple(sorted(labels.items()))))
+
+    def render(self) -> str:
+        lines = []
+        for (name, labels), value in sorted(self._counters.items()):
+            lines.append(f'{name}{_render_labels(labels)} {value:g}')
+        for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+            cumulative = 0
+            for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+                cumulative += count
+                le = bound if isinstance(bound, str) else f'{bound:g}'
+                lines.append(f'{name}_bucket{_render_labels((*labels, ("le", le)))} {cumulative}')
+            lines.append(f'{name}_sum{_render_labels(labels)} {histogram.sum:g}')
+            lines.append(f'{name}_count{_render_labels(labels)} {histogram.count}')
+        return '\n'.join(lines)
+
+
+def _render_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
@@ -0,0 +1,56 @@
+import asyncio
+import cProfile
+import io
+import marshal
+import pstats
+
+
+class ProfilerBusyError(Exception):
+    pass
+
+
+class EventLoopProfiler:
+    """
+    Profiles the event loop thread for a while: every handler and background task runs there, so the profile
+    covers live traffic. Work moved to threads with asyncio.to_thread isn't covered.
+    Nothing is hooked into the interpreter outside of a profiling run
+    """
+
+    def __init__(self):
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    async def profile(self, duration: float) -> cProfile.Profile:
+        # only one profiler can be active in a thread
+        if self._running:
+            raise ProfilerBusyError('Profiling is already running')
+        self._running = True
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                await asyncio.sleep(duration)
+            finally:
+                profiler.disable()
+        finally:
+            self._running = False
+        return profiler
+
+
+def render_stats(profiler: cProfile.Profile, limit: int = 40) -> str:
+    """Top functions by cumulative time and by own time"""
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    for sort_key, title in ((pstats.SortKey.CUMULATIVE, 'cumulative'), (pstats.SortKey.TIME, 'own')):
+        out.write(f'==== Top {limit} functions by {title} time ====\n')
+        stats.sort_stats(sort_key).print_stats(limit)
+    return out.getvalue()
+
+
+def dump_stats(profiler: cProfile.Profile) -> bytes:
+    """Raw profile in the format of Profile.dump_stats, to be loaded with pstats or snakeviz"""
+    profiler.create_stats()
+    return marshal.dumps(profiler.stats)
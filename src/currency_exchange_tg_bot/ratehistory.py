@@ -0,0 +1,185 @@
+import asyncio
+import bisect
+import fcntl
+import operator
+import os
+import re
+import struct
+import sys
+from array import array
+from itertools import chain
+from pathlib import Path
+from typing import BinaryIO, Iterable, NamedTuple, Optional
+
+from currency_exchange_tg_bot.catalog import CatalogSnapshot
+
+
+# (timestamp, rate) as little-endian doubles
+RECORD = struct.Struct('<dd')
+
+SPARKLINE_CHARS = '▁▂▃▄▅▆▇█'
+
+_CURRENCY_CODE_PATTERN = re.compile('[A-Z]{3}')
+
+
+class RateSeries(NamedTuple):
+    start: float
+    end: float
+    # moments the rate changed at; the first one is `start` when the rate was already known by then
+    timestamps: array
+    rates: array
+
+
+class RateStats(NamedTuple):
+    min: float
+    max: float
+    # time-weighted, as a rate is recorded only when it changes
+    avg: float
+    changes: int
+
+
+class _RecordTimestamps:
+    """Sequence view of timestamps in a history file, lets bisect search the file without reading all of it"""
+
+    def __init__(self, file: BinaryIO, count: int):
+        self._file = file
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index: int) -> float:
+        self._file.seek(index * RECORD.size)
+        return RECORD.unpack(self._file.read(RECORD.size))[0]
+
+
+class RateHistoryStore:
+    """
+    Keeps an append-only file of fixed size (timestamp, rate) records per currency pair.
+    A record is appended only when the rate differs from the last recorded one and is newer than it,
+    so records are ordered by time, and a range of them is found by binary search and read in one go.
+    Processes sharing the directory append under a lock of the file, each checking the last record
+    written by any of them
+    """
+
+    def __init__(self, directory: Path):
+        self._directory = Path(directory)
+        # (file size, timestamp, rate) of the last record of each pair, reread when the file size changes
+        self._last_records: dict[tuple[str, str], tuple[int, Optional[float], Optional[float]]] = {}
+
+    def record_rates(self, rates: Iterable[tuple[str, str, float]], timestamp: float) -> int:
+        return sum(self.append_if_changed(base, target, rate, timestamp) for base, target, rate in rates)
+
+    def append_if_changed(self, base: str, target: str, rate: float, timestamp: float) -> bool:
+        pair = (base, target)
+        path = self._pair_file(base, target)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a+b') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            size = os.fstat(f.fileno()).st_size
+            last = self._last_records.get(pair)
+            if last is None or last[0] != size:
+                last = self._read_last_record(f, size)
+                size = last[0]
+            _, last_timestamp, last_rate = last
+            if last_rate == rate or (last_timestamp is not None and timestamp <= last_timestamp):
+                self._last_records[pair] = last
+                return False
+            f.write(RECORD.pack(timestamp, rate))
+            f.flush()
+            self._last_records[pair] = (size + RECORD.size, timestamp, rate)
+        return True
+
+    def query(self, base: str, target: str, start: float, end: float) -> RateSeries:
+        path = self._pair_file(base, target)
+        if not path.exists():
+            return RateSeries(start, end, array('d'), array('d'))
+
+        with open(path, 'rb') as f:
+            timestamps = _RecordTimestamps(f, os.fstat(f.fileno()).st_size // RECORD.size)
+            # the last record made before the start holds the rate in effect at the start
+            lo = max(bisect.bisect_right(timestamps, start) - 1, 0)
+            hi = bisect.bisect_right(timestamps, end)
+            values = array('d')
+            if hi > lo:
+                f.seek(lo * RECORD.size)
+                values.frombytes(f.read((hi - lo) * RECORD.size))
+        if sys.byteorder == 'big':
+            values.byteswap()
+
+        series = RateSeries(start, end, values[0::2], values[1::2])
+        if series.timestamps and series.timestamps[0] < start:
+            series.timestamps[0] = start
+        return series
+
+    @staticmethod
+    def _read_last_record(f: BinaryIO, size: int) -> tuple[int, Optional[float], Optional[float]]:
+        # a record partially written before a crash is dropped
+        if size % RECORD.size:
+            size -= size % RECORD.size
+            f.truncate(size)
+        if not size:
+            return size, None, None
+        f.seek(size - RECORD.size)
+        return (size, *RECORD.unpack(f.read(RECORD.size)))
+
+    def _pair_file(self, base: str, target: str) -> Path:
+        if not (_CURRENCY_CODE_PATTERN.fullmatch(base) and _CURRENCY_CODE_PATTERN.fullmatch(target)):
+            raise ValueError(f'Invalid currency pair {base}{target}')
+        return self._directory / f'{base}{target}.bin'
+
+
+def rate_stats(series: RateSeries) -> Optional[RateStats]:
+    if not series.rates:
+        return None
+    timestamps, rates = series.timestamps, series.rates
+    durations = list(map(operator.sub, chain(timestamps[1:], [series.end]), timestamps))
+    total_duration = sum(durations)
+    if total_duration > 0:
+        avg = sum(map(operator.mul, rates, durations)) / total_duration
+    else:
+        avg = rates[-1]
+    changes = len(rates) - (timestamps[0] == series.start)
+    return RateStats(min(rates), max(rates), avg, changes)
+
+
+def downsample(series: RateSeries, buckets: int) -> list[Optional[float]]:
+    """
+    Splits the series period into equal intervals and averages rates that were in effect during each of them,
+    None stands for an interval before the first known rate
+    """
+    timestamps, rates = series.timestamps, series.rates
+    step = (series.end - series.start) / buckets
+    values = []
+    for i in range(buckets):
+        bucket_start = series.start + i * step
+        lo = max(bisect.bisect_right(timestamps, bucket_start) - 1, 0)
+        hi = max(bisect.bisect_left(timestamps, bucket_start + step), lo + 1)
+        if not rates or timestamps[lo] >= bucket_start + step:
+            values.append(None)
+        else:
+            values.append(sum(rates[lo:hi]) / (hi - lo))
+    return values
+
+
+def sparkline(values: list[Optional[float]]) -> str:
+    known = [value for value in values if value is not None]
+    if not known:
+        return ''
+    lowest, span = min(known), max(known) - min(known)
+    top = len(SPARKLINE_CHARS) - 1
+    return ''.join(
+        ' ' if value is None else SPARKLINE_CHARS[round((value - lowest) / span * top) if span else top // 2]
+        for value in values
+    )
+
+
+class RateHistoryRecorder:
+    """Catalog listener recording the changed exchange rates of each fetched snapshot to the history store"""
+
+    def __init__(self, store: RateHistoryStore):
+        self._store = store
+
+    async def __call__(self, snapshot: CatalogSnapshot) -> int:
+        # appending touches a file per changed pair, which is kept off the event loop
+        return await asyncio.to_thread(self._store.record_rates, snapshot.rates, snapshot.fetched_at)
@@ -0,0 +1,108 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated_at', 'notified')
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+        # whether the owner was told they are limited since the last request that passed
+        self.notified = False
+
+
+class TokenBuckets:
+    """
+    Token buckets of `capacity` tokens refilled at `refill_rate` tokens per second, one per key.
+    A bucket left idle for long enough to refill is the same as a new one, so such buckets are evicted.
+    Buckets are kept in order of use, which makes the idle ones (and, over `max_size`, the least recently
+    used ones) the first to go
+    """
+
+    def __init__(self, capacity: float, refill_rate: float, max_size: int,
+                 clock: Callable[[], float] = time.monotonic):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self._max_size = max_size
+        self._clock = clock
+        self._buckets: OrderedDict[Hashable, TokenBucket] = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def get(self, key: Hashable) -> TokenBucket:
+        """Returns the bucket of the key with tokens refilled up to now"""
+        now = self._clock()
+        self._evict_idle(now)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.capacity, now)
+            if len(self._buckets) > self._max_size:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.tokens = min(self.capacity, bucket.tokens + (now - bucket.updated_at) * self.refill_rate)
+            bucket.updated_at = now
+        return bucket
+
+    def retry_after(self, bucket: TokenBucket, cost: float) -> float:
+        """Seconds until the bucket has `cost` tokens"""
+        return max(0.0, (min(cost, self.capacity) - bucket.tokens) / self.refill_rate)
+
+    def _evict_idle(self, now: float):
+        refill_time = self.capacity / self.refill_rate
+        while self._buckets:
+            bucket = next(iter(self._buckets.values()))
+            if now - bucket.updated_at < refill_time:
+                break
+            self._buckets.popitem(last=False)
+
+
+class RateLimiter:
+    """
+    Admits a request only if both the bucket of its user and the bucket of its chat have enough tokens
+    for its cost, tokens are taken from both then. A cost above a bucket capacity is capped to it,
+    so that any request can pass once the bucket is full
+    """
+
+    def __init__(self, user_buckets: TokenBuckets, chat_buckets: TokenBuckets):
+        self._user_buckets = user_buckets
+        self._chat_buckets = chat_buckets
+
+    @property
+    def user_buckets(self) -> TokenBuckets:
+        return self._user_buckets
+
+    @property
+    def chat_buckets(self) -> TokenBuckets:
+        return self._chat_buckets
+
+    def acquire(self, user_id: int | None, chat_id: int | None, cost: float) -> tuple[str | None, float]:
+        """
+        Returns (None, 0) if the request is admitted, otherwise the scope ('user' or 'chat') that limited it
+        and how many seconds later it would be admitted
+        """
+        scopes = []
+        if user_id is not None:
+            scopes.append(('user', self._user_buckets, self._user_buckets.get(user_id)))
+        if chat_id is not None:
+            scopes.append(('chat', self._chat_buckets, self._chat_buckets.get(chat_id)))
+
+        for scope, buckets, bucket in scopes:
+            if bucket.tokens < min(cost, buckets.capacity):
+                return scope, buckets.retry_after(bucket, cost)
+        for _, buckets, bucket in scopes:
+            bucket.tokens -= min(cost, buckets.capacity)
+            bucket.notified = False
+        return None, 0.0
+
+    def should_notify(self, scope: str, user_id: int | None, chat_id: int | None) -> bool:
+        """Tells whether a limited request is the first one since the last admitted, only that one gets a reply"""
+        buckets, key = (self._user_buckets, user_id) if scope == 'user' else (self._chat_buckets, chat_id)
+        bucket = buckets.get(key)
+        if bucket.notified:
+            return False
+        bucket.notified = True
+        return True
@@ -0,0 +1,125 @@
+import csv
+import io
+import math
+from typing import Iterable, NamedTuple
+
+import numpy as np
+
+
+class RateCycle(NamedTuple):
+    codes: list[str]
+    # how much converting along the cycle multiplies an amount by, minus 1
+    profit: float
+
+
+class RateMatrix:
+    """
+    Cross rates between all known currencies. Rates are kept in log space as weights -log(rate),
+    so that converting along a path sums the weights and the best cross rate is the shortest path.
+    An arbitrage (or inconsistent) cycle is a cycle of negative total weight
+    """
+
+    def __init__(self, codes: list[str], direct: np.ndarray, shortest: np.ndarray, next_hop: np.ndarray,
+                 tolerance: float):
+        self.codes = codes
+        self._direct = direct
+        self._shortest = shortest
+        self._next_hop = next_hop
+        self._tolerance = tolerance
+
+    @classmethod
+    def from_rates(cls, rates: Iterable[tuple[str, str, float]], *, tolerance: float = 1e-6) -> 'RateMatrix':
+        """
+        Builds the matrix from (base, target, rate) triples, a rate also allows the reverse conversion
+        at 1/rate. Cycles which profit is below `tolerance` are treated as rounding noise
+        """
+        rates = [(base, target, float(rate)) for base, target, rate in rates if rate > 0]
+        codes = sorted({code for base, target, _ in rates for code in (base, target)})
+        index = {code: i for i, code in enumerate(codes)}
+        size = len(codes)
+
+        base_idx = np.fromiter((index[base] for base, _, _ in rates), dtype=np.intp, count=len(rates))
+        target_idx = np.fromiter((index[target] for _, target, _ in rates), dtype=np.intp, count=len(rates))
+        weights = -np.log(np.fromiter((rate for _, _, rate in rates), dtype=np.float64, count=len(rates)))
+
+        direct = np.full((size, size), np.inf)
+        np.fill_diagonal(direct, 0.0)
+        np.minimum.at(direct, (base_idx, target_idx), weights)
+        np.minimum.at(direct, (target_idx, base_idx), -weights)
+
+        shortest, next_hop = _all_pairs_shortest_paths(direct, math.log1p(tolerance))
+        return cls(codes, direct, shortest, next_hop, tolerance)
+
+    def cross_rates(self) -> np.ndarray:
+        """
+        Best rate for each (base, target) pair, 0 where the target can't be reached from the base
+        and inf where the way to it goes through an arbitrage cycle
+        """
+        with np.errstate(over='ignore'):
+            return np.exp(-self._shortest)
+
+    def to_csv(self) -> str:
+        cross_rates = self.cross_rates()
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(['', *self.codes])
+        for code, row in zip(self.codes, cross_rates):
+            writer.writerow([code, *(f'{rate:.6g}' if rate else '' for rate in row.tolist())])
+        return out.getvalue()
+
+    def cycles(self) -> list[RateCycle]:
+        """Distinct cycles converting along which yields more than was converted, the most profitable first"""
+        threshold = -math.log1p(self._tolerance)
+        found = {}
+        for start in np.flatnonzero(np.diagonal(self._shortest) < threshold):
+            cycle = self._find_cycle(int(start))
+            if cycle is None:
+                continue
+            # the same cycle is reached from each of its nodes, it is kept rotated to start from the lowest index
+            lowest = cycle.index(min(cycle))
+            cycle = tuple(cycle[lowest:] + cycle[:lowest])
+            if cycle in found:
+                continue
+            weight = sum(self._direct[a, b] for a, b in zip(cycle, cycle[1:] + cycle[:1]))
+            if weight < threshold:
+                found[cycle] = RateCycle([self.codes[i] for i in cycle + cycle[:1]], math.expm1(-weight))
+        return sorted(found.values(), key=lambda c: c.profit, reverse=True)
+
+    def _find_cycle(self, start: int) -> list[int] | None:
+        # following next hops towards a node on a negative cycle ends up going round some negative cycle
+        visited = {}
+        node = start
+        path = []
+        while node not in visited:
+            visited[node] = len(path)
+            path.append(node)
+            node = int(self._next_hop[node, start])
+            if node < 0:
+                return None
+        return path[visited[node]:]
+
+
+def _all_pairs_shortest_paths(weights: np.ndarray, min_gain: float) -> tuple[np.ndarray, np.ndarray]:
+    # Floyd-Warshall: one vectorized relaxation of the whole matrix per intermediate node
+    size = len(weights)
+    shortest = weights.copy()
+    next_hop = np.where(np.isfinite(weights), np.arange(size)[np.newaxis, :], -1)
+    through = np.empty_like(shortest)
+    improved = np.empty(shortest.shape, dtype=bool)
+    for k in range(size):
+        to_k = shortest[:, k, np.newaxis].copy()
+        from_k = shortest[np.newaxis, k, :].copy()
+        if shortest[k, k] < -min_gain:
+            # k is on a negative cycle, going round it makes a path through k as cheap as wanted; settling such paths
+            # at -inf right away keeps the following nodes from improving them over and over again
+            np.logical_and(to_k < np.inf, from_k < np.inf, out=improved)
+            improved &= shortest > -np.inf
+            np.copyto(shortest, -np.inf, where=improved)
+        else:
+            # improvements within the tolerance are rounding noise and would make up false cycles
+            with np.errstate(invalid='ignore'):
+                np.add(to_k + min_gain, from_k, out=through)
+            np.less(through, shortest, out=improved)
+            np.add(to_k, from_k, out=shortest, where=improved)
+        np.copyto(next_hop, next_hop[:, k, np.newaxis], where=improved)
+    return shortest, next_hop
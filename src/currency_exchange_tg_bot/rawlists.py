@@ -0,0 +1,66 @@
+"""
+Fast path for the list endpoints of the service: the response body is parsed straight into row tuples
+instead of a generated model per row, which the callers flatten into tuples anyway.
+Generated `*_without_preload_content` methods return the http response as is, without checking its status
+"""
+import json
+from typing import Any, Optional
+
+from currency_exchange_fapi_client import exceptions as apiexc
+
+
+RAW_RESPONSE_SUFFIX = '_without_preload_content'
+
+CurrencyRow = tuple[str, str, str]
+ExchangeRateRow = tuple[str, str, float]
+
+
+class RawResponse:
+    """A response replayed from a capture, it reads like the http response of the generated client"""
+
+    __slots__ = ('status', 'reason', 'headers', '_body')
+
+    def __init__(self, status: int, body: bytes, reason: str = 'Replayed', headers: Optional[dict] = None):
+        self.status = status
+        self.reason = reason
+        self.headers = headers or {}
+        self._body = body
+
+    async def read(self) -> bytes:
+        return self._body
+
+    def getheaders(self) -> dict:
+        return self.headers
+
+
+async def read_json(response: Any) -> Any:
+    body = await response.read()
+    if not 200 <= response.status < 300:
+        # list endpoints fail only on the service side, so the base exception tells enough
+        exc = apiexc.ApiException(status=response.status, reason=response.reason, body=body.decode(errors='replace'))
+        exc.headers = response.getheaders()
+        raise exc
+    return json.loads(body)
+
+
+def parse_currencies(data: list[dict]) -> list[CurrencyRow]:
+    return [(currency['code'], currency['name'], currency['sign']) for currency in data]
+
+
+def parse_exchange_rates(data: list[dict]) -> list[ExchangeRateRow]:
+    # decimal rates may come as strings
+    return [(er['base_currency']['code'], er['target_currency']['code'], float(er['rate'])) for er in data]
+
+
+async def get_all_currencies(api, request_timeout: Optional[float]) -> list[CurrencyRow]:
+    response = await api.currency_exchange_get_all_currencies_without_preload_content(
+        _request_timeout=request_timeout
+    )
+    return parse_currencies(await read_json(response))
+
+
+async def get_all_exchange_rates(api, request_timeout: Optional[float]) -> list[ExchangeRateRow]:
+    response = await api.currency_exchange_get_all_exchange_rates_without_preload_content(
+        _request_timeout=request_timeout
+    )
+    return parse_exchange_rates(await read_json(response))
@@ -0,0 +1,31 @@
+import contextlib
+import time
+
+
+class StartupTimer:
+    """
+    Measures how long each named startup phase takes, counting total time from the timer creation
+    """
+
+    def __init__(self):
+        self._created_at = time.perf_counter()
+        self._phases: list[tuple[str, float]] = []
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._phases.append((name, time.perf_counter() - started_at))
+
+    @property
+    def phases(self) -> list[tuple[str, float]]:
+        return list(self._phases)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._created_at
+
+    def report(self) -> str:
+        phases = ', '.join(f'{name} {duration * 1000:.1f} ms' for name, duration in self._phases)
+        return f'Startup took {self.elapsed() * 1000:.1f} ms ({phases})'
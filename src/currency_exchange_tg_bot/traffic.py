@@ -0,0 +1,138 @@
+import hashlib
+import hmac
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, BinaryIO, Iterator, NamedTuple, Optional
+
+
+UPDATE = 1
+API_RESPONSE = 2
+
+# (kind, unix time, payload length) followed by the zlib-compressed json payload
+FRAME_HEADER = struct.Struct('<BdI')
+
+# objects of an update that describe a person or a chat; their ids and names are pseudonymized
+_IDENTITY_KEYS = frozenset(('from', 'chat', 'user', 'sender_chat', 'forward_from', 'forward_from_chat'))
+_NAME_KEYS = ('first_name', 'last_name', 'username', 'title')
+
+
+class TrafficRecord(NamedTuple):
+    kind: int
+    timestamp: float
+    payload: dict
+
+
+class Pseudonymizer:
+    """
+    Replaces user and chat ids with keyed hashes of them: the same id always gets the same pseudonym
+    within a capture, so conversations are kept together, but the real id can't be recovered without the key
+    """
+
+    def __init__(self, secret: bytes):
+        self._secret = secret
+
+    def pseudonymize_id(self, value: int) -> int:
+        digest = hmac.new(self._secret, str(abs(value)).encode(), hashlib.sha256).digest()
+        # group chats have negative ids, which changes how they are handled, so the sign is kept
+        pseudonym = int.from_bytes(digest[:6], 'little') or 1
+        return -pseudonym if value < 0 else pseudonym
+
+    def pseudonymize_update(self, data: Any) -> Any:
+        if isinstance(data, list):
+            return [self.pseudonymize_update(item) for item in data]
+        if not isinstance(data, dict):
+            return data
+        result = {}
+        for key, value in data.items():
+            if key in _IDENTITY_KEYS and isinstance(value, dict):
+                value = self._pseudonymize_identity(value)
+            elif key in ('chat_id', 'user_id') and isinstance(value, int):
+                value = self.pseudonymize_id(value)
+            result[key] = self.pseudonymize_update(value)
+        return result
+
+    def _pseudonymize_identity(self, identity: dict) -> dict:
+        identity = dict(identity)
+        if isinstance(identity.get('id'), int):
+            identity['id'] = self.pseudonymize_id(identity['id'])
+        for key in _NAME_KEYS:
+            if key in identity:
+                identity[key] = f'{key}_{abs(identity.get("id", 0)) % 10 ** 6}'
+        return identity
+
+
+def to_jsonable(value: Any) -> Any:
+    """Turns api responses into json, keeping the model names to rebuild them on replay"""
+    if isinstance(value, list):
+        return [to_jsonable(item) for item in value]
+    if hasattr(value, 'to_dict'):
+        return {'__model__': type(value).__name__, 'data': value.to_dict()}
+    return value
+
+
+class TrafficRecorder:
+    """
+    Appends incoming updates and api responses to a capture file, one frame per record.
+    Writes are buffered, a frame cut by a crash is skipped on reading
+    """
+
+    def __init__(self, path: Path, pseudonymizer: Pseudonymizer):
+        self._path = Path(path)
+        self._pseudonymizer = pseudonymizer
+        self._file: Optional[BinaryIO] = None
+        # api responses may be recorded from threads running sync code, frames must not interleave
+        self._lock = threading.Lock()
+
+    def record_update(self, update: dict):
+        self._append(UPDATE, self._pseudonymizer.pseudonymize_update(update))
+
+    def record_api_response(self, method: str, args: list, result: Any = None, error: Optional[str] = None,
+                            latency: float = 0.0):
+        payload = {'method': method, 'args': to_jsonable(args), 'latency': latency}
+        if error is not None:
+            payload['error'] = error
+        else:
+            payload['result'] = to_jsonable(result)
+        self._append(API_RESPONSE, payload)
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _append(self, kind: int, payload: dict):
+        data = zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=str).encode())
+        with self._lock:
+            if self._file is None:
+                self._path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self._path, 'ab')
+            self._file.write(FRAME_HEADER.pack(kind, time.time(), len(data)) + data)
+
+
+def read_traffic(path: Path) -> Iterator[TrafficRecord]:
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+            kind, timestamp, length = FRAME_HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield TrafficRecord(kind, timestamp, json.loads(zlib.decompress(data)))
+
+
+def make_secret(secret: Optional[str]) -> bytes:
+    # without a configured secret pseudonyms can't be linked across restarts, nor reversed by anyone
+    return secret.encode() if secret else os.urandom(32)
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from currency_exchange_tg_bot.metrics import Metrics
+
+
+logger = logging.getLogger('watchdog')
+
+
+class LoopWatchdog:
+    """
+    Measures event loop lag with a heartbeat task that should wake up every `interval` seconds:
+    the delay of each wake up goes to the lag histogram. A monitor thread checks the heartbeat meanwhile,
+    and once it is late by more than `threshold` the loop is blocked, so the stack of the loop thread
+    is captured right then to name the blocking call. Each stall is logged once
+    """
+
+    def __init__(self, metrics: Metrics, *, interval: float = 0.1, threshold: float = 0.25):
+        self._metrics = metrics
+        self._interval = interval
+        self._threshold = threshold
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._stopped = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+
+    async def run(self):
+        """The heartbeat, runs until cancelled; the monitor thread is running meanwhile"""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._monitor = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._monitor.start()
+        try:
+            while True:
+                await asyncio.sleep(self._interval)
+                now = time.monotonic()
+                lag = max(0.0, now - self._last_beat - self._interval)
+                self._last_beat = now
+                self._metrics.observe('event_loop_lag_seconds', lag)
+                if lag > self._threshold:
+                    self._metrics.increment('event_loop_stalls_total')
+        finally:
+            self._stopped.set()
+            self._monitor.join()
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stopped.wait(self._interval / 2):
+            last_beat = self._last_beat
+            late_by = time.monotonic() - last_beat - self._interval
+            if late_by <= self._threshold or last_beat == reported_beat:
+                continue
+            reported_beat = last_beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame is not None else '(no frame)\n'
+            logger.warning('Event loop is blocked for %.3f s, stack of the loop thread:\n%s',
+                           late_by + self._interval, stack.rstrip('\n'))
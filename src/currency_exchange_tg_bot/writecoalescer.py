@@ -0,0 +1,91 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Generic, Hashable, Optional, TypeVar
+
+from currency_exchange_tg_bot.metrics import Metrics
+
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+R = TypeVar('R')
+
+# upper bounds of the number of requests a write was coalesced from
+BATCH_SIZE_BUCKETS = (1, 2, 3, 5, 10, 20, 50)
+
+
+class _PendingWrite(Generic[V, R]):
+    __slots__ = ('value', 'requests', 'first_requested_at', 'result')
+
+    def __init__(self, value: V, result: asyncio.Future):
+        self.value = value
+        self.requests = 1
+        self.first_requested_at = time.monotonic()
+        self.result = result
+
+
+class WriteCoalescer(Generic[K, V, R]):
+    """
+    Holds writes of a key for a short window after the first of them and sends only the last value
+    to the backend; everyone who requested a write within the window gets the result of that one write.
+    Writes of a key reach the backend in the order they were requested: a window closing while the write
+    of the previous one is in flight waits for it.
+    Requested and sent writes are counted in the metrics, the difference is what coalescing saved
+    """
+
+    def __init__(self, write: Callable[[K, V], Awaitable[R]], window: float, metrics: Metrics, *, name: str):
+        self._write = write
+        self._window = window
+        self._metrics = metrics
+        self._name = name
+        self._pending: dict[K, _PendingWrite[V, R]] = {}
+        self._flushing: dict[K, asyncio.Task] = {}
+
+    @property
+    def pending_writes(self) -> int:
+        return len(self._pending)
+
+    async def submit(self, key: K, value: V) -> R:
+        self._metrics.increment('coalesced_writes_requested_total', writer=self._name)
+        pending = self._pending.get(key)
+        if pending is not None:
+            pending.value = value
+            pending.requests += 1
+        else:
+            pending = self._pending[key] = _PendingWrite(value, asyncio.get_running_loop().create_future())
+            flush = asyncio.create_task(self._flush(key, pending, self._flushing.get(key)))
+            self._flushing[key] = flush
+            flush.add_done_callback(lambda task: self._forget_flush(key, task))
+        # shielded, so that a cancelled requester doesn't cancel the write others are waiting for
+        return await asyncio.shield(pending.result)
+
+    async def _flush(self, key: K, pending: _PendingWrite[V, R], previous: Optional[asyncio.Task]):
+        try:
+            await asyncio.sleep(self._window)
+            if previous is not None:
+                await asyncio.wait([previous])
+        except asyncio.CancelledError:
+            del self._pending[key]
+            pending.result.cancel()
+            raise
+        # requests coming from now on start the next window
+        del self._pending[key]
+
+        self._metrics.increment('coalesced_writes_sent_total', writer=self._name)
+        self._metrics.observe('coalesced_write_batch_size', pending.requests, BATCH_SIZE_BUCKETS, writer=self._name)
+        try:
+            result = await self._write(key, pending.value)
+        except Exception as e:
+            self._metrics.increment('coalesced_writes_failed_total', writer=self._name)
+            pending.result.set_exception(e)
+        except BaseException:
+            pending.result.cancel()
+            raise
+        else:
+            pending.result.set_result(result)
+        finally:
+            self._metrics.observe('coalesced_write_latency_seconds', time.monotonic() - pending.first_requested_at,
+                                  writer=self._name)
+
+    def _forget_flush(self, key: K, task: asyncio.Task):
+        if self._flushing.get(key) is task:
+            del self._flushing[key]
@@ -0,0 +1,84 @@
+import asyncio
+import datetime
+import multiprocessing
+import os
+import types
+from unittest.mock import MagicMock
+
+import pytest
+
+from currency_exchange_fapi_client.models import TokenCreatedResponse, AccessExpiresIn, RefreshExpiresIn
+
+from currency_exchange_tg_bot.accesstokens import (AccessTokenService, Sqlite3TokenRepository,
+                                                   get_sqlite3_connection, accesstokenservice)
+from currency_exchange_tg_bot.accesstokens.db import create_schema
+from currency_exchange_tg_bot.apitools import ApiClient
+
+
+WORKERS = 4
+
+
+class FakeAuthApi:
+    """Stands for the auth endpoint: records every call to a file shared by all worker processes"""
+
+    calls_file: str
+
+    def __init__(self, *args, **kwargs): ...
+
+    async def auth_create_token(self, username, password):
+        with open(self.calls_file, 'a', encoding='utf-8') as f:
+            f.write(f'{os.getpid()}\n')
+        # keeps the token being gained long enough for the other workers to run into the lock
+        await asyncio.sleep(0.5)
+        return make_token_response(f'token_of_{os.getpid()}')
+
+    async def auth_refresh_access_token(self, grant_type, refresh_token):
+        raise AssertionError('no refresh token is expected to be in db')
+
+
+def make_token_response(token: str) -> TokenCreatedResponse:
+    access_expires_in = datetime.datetime.now() + datetime.timedelta(minutes=1)
+    refresh_expires_in = datetime.datetime.now() + datetime.timedelta(minutes=2)
+    return TokenCreatedResponse(
+        token_type='access',
+        access_token=token,
+        refresh_token=token,
+        access_expires_in=AccessExpiresIn(int(access_expires_in.timestamp())),
+        refresh_expires_in=RefreshExpiresIn(int(refresh_expires_in.timestamp())),
+    )
+
+
+def get_access_token_in_worker(db_path: str, calls_file: str, start_barrier) -> str:
+    accesstokenservice.ApiClient = MagicMock(ApiClient)
+    FakeAuthApi.calls_file = calls_file
+    accesstokenservice.AuthApi = FakeAuthApi
+
+    settings = types.SimpleNamespace(host='host', username='user', password='password')
+    token_repo = Sqlite3TokenRepository(get_sqlite3_connection(db_path))
+    service = AccessTokenService(token_repo, settings, lock_poll_interval=0.05)
+
+    start_barrier.wait()
+    return asyncio.run(service.get_access_token())
+
+
+@pytest.fixture
+def shared_db_path(tmp_path) -> str:
+    db_path = str(tmp_path / 'accesstoken.sqlite3')
+    with get_sqlite3_connection(db_path)() as conn:
+        create_schema(conn)
+    return db_path
+
+
+def test_only_one_process_gains_token(shared_db_path, tmp_path):
+    calls_file = str(tmp_path / 'auth_calls')
+    ctx = multiprocessing.get_context('spawn')
+
+    with ctx.Manager() as manager, ctx.Pool(WORKERS) as pool:
+        start_barrier = manager.Barrier(WORKERS)
+        tokens = pool.starmap(get_access_token_in_worker,
+                              [(shared_db_path, calls_file, start_barrier)] * WORKERS)
+
+    with open(calls_file, encoding='utf-8') as f:
+        gaining_processes = f.read().split()
+    assert len(gaining_processes) == 1
+    assert set(tokens) == {f'token_of_{gaining_processes[0]}'}
@@ -0,0 +1,110 @@
+import datetime
+import time
+from types import SimpleNamespace
+
+import pytest
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, CommandHandler
+
+from currency_exchange_tg_bot.admission import Admission, AdmissionPolicy, get_update_age
+from currency_exchange_tg_bot.botcallbacks import AdmissionControlCallback
+from currency_exchange_tg_bot.metrics import Metrics
+
+
+@pytest.fixture
+def policy():
+    return AdmissionPolicy(max_pending_updates=10, max_update_age=5.0, drop_update_age=60.0)
+
+
+def test_updates_are_admitted_under_normal_load(policy):
+    assert policy.decide(3, 1.0, 'convertcurrency', is_admin=False) is Admission.ADMIT
+
+
+@pytest.mark.parametrize('pending_updates, update_age', [(11, 0.0), (0, 6.0)])
+def test_overload_sheds_by_command(policy, pending_updates, update_age):
+    def decide(command):
+        return policy.decide(pending_updates, update_age, command, is_admin=False)
+
+    assert decide('allexchangerates') is Admission.ADMIT
+    assert decide('showexchangerate') is Admission.SERVE_CACHED
+    assert decide('convertcurrency') is Admission.REJECT
+    # a reply in a conversation in progress
+    assert decide(None) is Admission.REJECT
+    # group chatter and stray text no handler would answer
+    assert policy.decide(pending_updates, update_age, None, is_admin=False, is_answerable=False) is Admission.DROP
+    assert policy.decide(pending_updates, update_age, 'allcurrencies', is_admin=False,
+                         is_answerable=False) is Admission.ADMIT
+
+
+def test_too_old_updates_are_dropped_but_admins_are_never_shed(policy):
+    assert policy.decide(0, 61.0, 'allcurrencies', is_admin=False) is Admission.DROP
+    assert policy.decide(100, 61.0, 'ratematrix', is_admin=True) is Admission.ADMIT
+
+
+def test_update_age():
+    now = datetime.datetime(2025, 1, 1, 12, 0, 30, tzinfo=datetime.timezone.utc)
+    message = SimpleNamespace(date=now - datetime.timedelta(seconds=30), edit_date=None)
+
+    assert get_update_age(SimpleNamespace(effective_message=message, callback_query=None), now) == 30.0
+    assert get_update_age(SimpleNamespace(effective_message=message, callback_query=object()), now) == 0.0
+
+
+class FakeApplication:
+
+    def __init__(self, handlers, pending_updates: int):
+        self.handlers = {0: handlers}
+        self.update_queue = SimpleNamespace(qsize=lambda: pending_updates)
+        self.tasks = []
+
+    def create_task(self, coroutine, update=None):
+        self.tasks.append(coroutine.cr_code.co_name)
+        coroutine.close()
+
+
+def make_message_update(text: str, chat_type: str = 'private') -> Update:
+    message = {
+        'message_id': 1,
+        'date': int(time.time()),
+        'chat': {'id': 100, 'type': chat_type},
+        'from': {'id': 100, 'is_bot': False, 'first_name': 'user'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return Update.de_json({'update_id': 1, 'message': message}, SimpleNamespace(username='rates_bot'))
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('text, replied', [('/convertcurrency', True), ('hello everyone', False)])
+async def test_overloaded_bot_replies_only_to_updates_a_handler_would_answer(policy, text, replied):
+    async def noop(update, context):
+        pass
+
+    async def send_message(**kwargs):
+        pass
+
+    application = FakeApplication([CommandHandler('convertcurrency', noop)], pending_updates=100)
+    context = SimpleNamespace(application=application, bot=SimpleNamespace(send_message=send_message))
+    callback = AdmissionControlCallback(policy, SimpleNamespace(snapshot=None),
+                                        SimpleNamespace(is_admin=lambda user_id: False), Metrics())
+
+    with pytest.raises(ApplicationHandlerStop):
+        await callback(make_message_update(text, chat_type='group'), context)
+
+    assert application.tasks == (['send_message'] if replied else [])
+
+
+@pytest.mark.anyio
+async def test_shed_updates_are_counted_by_known_commands_only(policy):
+    application = FakeApplication([], pending_updates=100)
+    context = SimpleNamespace(application=application, bot=None)
+    metrics = Metrics()
+    callback = AdmissionControlCallback(policy, SimpleNamespace(snapshot=None),
+                                        SimpleNamespace(is_admin=lambda user_id: False), metrics)
+
+    for text in ('/convertcurrency', '/random1', '/random2'):
+        with pytest.raises(ApplicationHandlerStop):
+            await callback(make_message_update(text, chat_type='group'), context)
+
+    assert metrics.counter('shed_updates_total', admission='drop', command='convertcurrency') == 1
+    assert metrics.counter('shed_updates_total', admission='drop', command='other') == 2
@@ -0,0 +1,122 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from currency_exchange_tg_bot.apitools import HedgeBudget, HedgedApi, LatencyTracker, RequestHedging
+from currency_exchange_tg_bot.metrics import Metrics
+
+
+pytestmark = pytest.mark.anyio
+
+
+def make_settings(**overrides):
+    settings = dict(request_timeout=10.0, latency_window=100, latency_min_samples=5, adaptive_timeout_quantile=0.99,
+                    adaptive_timeout_multiplier=3.0, min_request_timeout=0.5, hedge_quantile=0.95,
+                    hedge_budget_ratio=1.0)
+    settings.update(overrides)
+    return SimpleNamespace(**settings)
+
+
+class FakeApi:
+
+    def __init__(self, latencies: list[float]):
+        self.latencies = latencies
+        self.calls = []
+
+    async def currency_exchange_get_currency(self, code, _request_timeout=None):
+        attempt = len(self.calls)
+        self.calls.append(_request_timeout)
+        await asyncio.sleep(self.latencies[min(attempt, len(self.latencies) - 1)])
+        return f'{code} from attempt {attempt}'
+
+    async def currency_exchange_get_all_currencies_without_preload_content(self, _request_timeout=None):
+        self.calls.append(_request_timeout)
+        await asyncio.sleep(self.latencies[0])
+        return SimpleNamespace(status=200)
+
+    async def currency_exchange_add_currency(self, name, code, sign, _request_timeout=None):
+        self.calls.append(_request_timeout)
+        return code
+
+
+def warm_up(hedging: RequestHedging, endpoint: str, latency: float, samples: int = 20):
+    for _ in range(samples):
+        hedging.tracker.record(endpoint, latency)
+
+
+def test_quantile_needs_min_samples():
+    tracker = LatencyTracker(window=10, min_samples=3)
+    tracker.record('get', 1.0)
+    tracker.record('get', 2.0)
+    assert tracker.quantile('get', 0.5) is None
+
+    tracker.record('get', 3.0)
+    assert tracker.quantile('get', 0.5) == 2.0
+
+
+def test_budget_caps_hedges_share():
+    budget = HedgeBudget(ratio=0.25)
+    spent = 0
+    for _ in range(100):
+        budget.on_request()
+        spent += budget.try_spend()
+
+    assert spent == 25
+
+
+def test_timeout_is_derived_from_latencies():
+    hedging = RequestHedging(make_settings())
+    assert hedging.timeout('currency_exchange_get_currency') == 10.0
+
+    warm_up(hedging, 'currency_exchange_get_currency', 0.5)
+    assert hedging.timeout('currency_exchange_get_currency') == pytest.approx(1.5)
+
+    warm_up(hedging, 'currency_exchange_get_currency', 5.0, samples=100)
+    assert hedging.timeout('currency_exchange_get_currency') == 10.0
+
+
+async def test_slow_read_is_hedged_and_faster_answer_wins():
+    metrics = Metrics()
+    hedging = RequestHedging(make_settings(), metrics)
+    warm_up(hedging, 'currency_exchange_get_currency', 0.01)
+    api = FakeApi([1.0, 0.01])
+
+    result = await HedgedApi(api, hedging).currency_exchange_get_currency('USD', _request_timeout=10)
+
+    assert result == 'USD from attempt 1'
+    assert len(api.calls) == 2
+    assert metrics.counter('api_hedge_wins_total', endpoint='currency_exchange_get_currency') == 1
+
+
+async def test_read_is_not_hedged_over_budget():
+    hedging = RequestHedging(make_settings(hedge_budget_ratio=0))
+    warm_up(hedging, 'currency_exchange_get_currency', 0.01)
+    api = FakeApi([0.05])
+
+    result = await HedgedApi(api, hedging).currency_exchange_get_currency('USD', _request_timeout=10)
+
+    assert result == 'USD from attempt 0'
+    assert len(api.calls) == 1
+
+
+async def test_writes_are_passed_through():
+    hedging = RequestHedging(make_settings())
+    api = FakeApi([0])
+
+    await HedgedApi(api, hedging).currency_exchange_add_currency('Dollar', 'USD', '$', _request_timeout=10)
+
+    assert api.calls == [10]
+    assert hedging.tracker.quantile('currency_exchange_add_currency', 0.5) is None
+
+
+async def test_raw_reads_get_derived_timeout_but_are_not_hedged():
+    endpoint = 'currency_exchange_get_all_currencies_without_preload_content'
+    hedging = RequestHedging(make_settings())
+    warm_up(hedging, endpoint, 0.01)
+    api = FakeApi([0.05])
+
+    await getattr(HedgedApi(api, hedging), endpoint)(_request_timeout=10)
+
+    assert api.calls == [0.5]
+    assert hedging.tracker.quantile(endpoint, 1.0) >= 0.05
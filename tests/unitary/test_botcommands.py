@@ -0,0 +1,26 @@
+import pytest
+from telegram import BotCommandScopeChat, BotCommandScopeDefault
+
+from currency_exchange_tg_bot.botcommands import admin_user_commands, default_commands, set_scoped_commands
+
+
+class FakeBot:
+
+    def __init__(self):
+        self.commands = []
+
+    async def set_my_commands(self, commands, scope):
+        self.commands.append((scope, commands))
+
+
+@pytest.mark.anyio
+async def test_default_and_every_admin_scope_are_pushed():
+    bot = FakeBot()
+
+    await set_scoped_commands(bot, [10, 20])
+
+    assert bot.commands == [
+        (BotCommandScopeDefault(), default_commands),
+        (BotCommandScopeChat(10), admin_user_commands + default_commands),
+        (BotCommandScopeChat(20), admin_user_commands + default_commands),
+    ]
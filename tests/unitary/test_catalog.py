@@ -0,0 +1,211 @@
+import asyncio
+import contextlib
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from currency_exchange_tg_bot.accesstokens import get_sqlite3_connection
+from currency_exchange_tg_bot.catalog import (Catalog, CatalogSnapshot, Sqlite3CatalogStore,
+                                              create_catalog_store_schema, read_snapshot, write_snapshot)
+
+
+class FakeCurrencyExchangeApi:
+
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+        self.rate = 0.5
+
+    async def currency_exchange_get_all_currencies(self, _request_timeout=None):
+        self.calls += 1
+        await asyncio.sleep(0)
+        if self.fail:
+            raise ConnectionError('service is down')
+        return [SimpleNamespace(code='USD', name='US Dollar', sign='$'),
+                SimpleNamespace(code='EUR', name='Euro', sign='€')]
+
+    async def currency_exchange_get_all_exchange_rates(self, _request_timeout=None):
+        usd, eur = SimpleNamespace(code='USD'), SimpleNamespace(code='EUR')
+        return [SimpleNamespace(base_currency=usd, target_currency=eur, rate=self.rate)]
+
+
+@pytest.fixture
+def api() -> FakeCurrencyExchangeApi:
+    return FakeCurrencyExchangeApi()
+
+
+@pytest.fixture
+def snapshot_file(tmp_path):
+    return tmp_path / 'catalog' / 'snapshot.json'
+
+
+@pytest.fixture
+def make_catalog(api, snapshot_file):
+    @contextlib.asynccontextmanager
+    async def api_session():
+        yield api
+
+    def make_catalog(max_age: float = 60.0, store: Sqlite3CatalogStore = None) -> Catalog:
+        return Catalog(api_session, SimpleNamespace(request_timeout=1, raw_list_responses=False), snapshot_file,
+                       max_age, store=store, lease_ttl=60.0)
+
+    return make_catalog
+
+
+@pytest.fixture
+def catalog_store(tmp_path):
+    connection = get_sqlite3_connection(str(tmp_path / 'catalog.sqlite3'))
+    with connection() as conn:
+        create_catalog_store_schema(conn)
+    return Sqlite3CatalogStore(connection)
+
+
+def test_snapshot_is_written_and_read_back(snapshot_file):
+    snapshot = CatalogSnapshot([('USD', 'US Dollar', '$')], [('USD', 'EUR', 0.5)], 1700000000.0)
+
+    write_snapshot(snapshot_file, snapshot)
+
+    assert read_snapshot(snapshot_file) == snapshot
+    assert [path.name for path in snapshot_file.parent.iterdir()] == ['snapshot.json']
+
+
+def test_missing_snapshot_is_none(snapshot_file):
+    assert read_snapshot(snapshot_file) is None
+
+
+@pytest.mark.anyio
+async def test_refresh_writes_snapshot_and_notifies_listeners(make_catalog, snapshot_file):
+    catalog = make_catalog()
+    received = []
+
+    async def listener(snapshot):
+        received.append(snapshot)
+
+    catalog.add_listener(listener)
+    snapshot = await catalog.refresh()
+
+    assert snapshot.rates == [('USD', 'EUR', 0.5)]
+    assert received == [snapshot]
+    assert read_snapshot(snapshot_file) == snapshot
+
+
+@pytest.mark.anyio
+async def test_loaded_snapshot_is_served_without_request(make_catalog, snapshot_file, api):
+    write_snapshot(snapshot_file, CatalogSnapshot([('GBP', 'Pound', '£')], [], time.time()))
+    catalog = make_catalog()
+
+    await catalog.load()
+    snapshot = await catalog.get()
+
+    assert snapshot.currencies == [('GBP', 'Pound', '£')]
+    assert api.calls == 0
+
+
+@pytest.mark.anyio
+async def test_stale_snapshot_is_served_while_revalidated(make_catalog, snapshot_file, api):
+    write_snapshot(snapshot_file, CatalogSnapshot([('GBP', 'Pound', '£')], [], time.time() - 120))
+    catalog = make_catalog(max_age=60)
+    await catalog.load()
+
+    stale = await catalog.get()
+    assert stale.currencies == [('GBP', 'Pound', '£')]
+    assert catalog.is_stale(stale)
+
+    await asyncio.sleep(0.01)
+    fresh = await catalog.get()
+    assert [code for code, _, _ in fresh.currencies] == ['USD', 'EUR']
+    assert not catalog.is_stale(fresh)
+    assert api.calls == 1
+
+
+@pytest.mark.anyio
+async def test_failed_revalidation_keeps_stale_snapshot(make_catalog, snapshot_file, api):
+    stale = CatalogSnapshot([('GBP', 'Pound', '£')], [], time.time() - 120)
+    write_snapshot(snapshot_file, stale)
+    catalog = make_catalog(max_age=60)
+    await catalog.load()
+    api.fail = True
+
+    await catalog.get()
+    await asyncio.sleep(0.01)
+
+    assert await catalog.get() == stale
+    assert read_snapshot(snapshot_file) == stale
+
+
+@pytest.mark.anyio
+async def test_concurrent_refreshes_share_one_request(make_catalog, api):
+    catalog = make_catalog()
+
+    snapshots = await asyncio.gather(*(catalog.get() for _ in range(10)))
+
+    assert api.calls == 1
+    assert all(snapshot is snapshots[0] for snapshot in snapshots)
+
+
+def test_store_keeps_versions_and_one_lease_holder(catalog_store):
+    assert catalog_store.read() is None
+    snapshot = CatalogSnapshot([('USD', 'US Dollar', '$')], [('USD', 'EUR', 0.5), ('EUR', 'USD', 2.0)], 1.0)
+
+    assert catalog_store.write(snapshot) == 1
+    assert catalog_store.write(snapshot._replace(fetched_at=2.0)) == 2
+    assert catalog_store.read() == (2, snapshot._replace(fetched_at=2.0))
+
+    assert catalog_store.try_acquire_lease('first', 60)
+    assert not catalog_store.try_acquire_lease('second', 60)
+    assert catalog_store.try_acquire_lease('first', 60)
+    catalog_store.release_lease('first')
+    assert catalog_store.try_acquire_lease('second', 60)
+
+
+@pytest.mark.anyio
+async def test_only_lease_holder_fetches_catalog_others_take_it_from_store(make_catalog, catalog_store, api):
+    refresher, reader = make_catalog(store=catalog_store), make_catalog(store=catalog_store)
+    recorded = []
+
+    async def record(snapshot):
+        recorded.append(snapshot)
+
+    for catalog in (refresher, reader):
+        catalog.add_listener(record, fetched_only=True)
+
+    fetched = await refresher.refresh()
+    assert await reader.refresh() == fetched
+    assert api.calls == 1
+
+    api.rate = 0.6
+    await refresher.refresh()
+    assert reader.snapshot.rates == [('USD', 'EUR', 0.5)]
+    assert (await reader.sync()).rates == [('USD', 'EUR', 0.6)]
+    assert api.calls == 2
+    assert len(recorded) == 2
+
+
+@pytest.mark.anyio
+async def test_changed_catalog_is_fetched_and_stored_by_any_process(make_catalog, catalog_store, api):
+    refresher, writer = make_catalog(store=catalog_store), make_catalog(store=catalog_store)
+    await refresher.refresh()
+    await writer.refresh()
+    assert api.calls == 1
+
+    api.rate = 0.6
+    writer.revalidate(changed=True)
+    await asyncio.sleep(0.01)
+    assert writer.snapshot.rates == [('USD', 'EUR', 0.6)]
+    assert api.calls == 2
+    assert (await refresher.sync()).rates == [('USD', 'EUR', 0.6)]
+
+
+@pytest.mark.anyio
+async def test_changes_during_refresh_are_fetched_once_after_it(make_catalog, api):
+    catalog = make_catalog()
+    catalog.revalidate()
+    api.rate = 0.6
+    for _ in range(5):
+        catalog.revalidate(changed=True)
+    catalog.revalidate()
+
+    await asyncio.sleep(0.01)
+    assert catalog.snapshot.rates == [('USD', 'EUR', 0.6)]
+    assert api.calls == 2
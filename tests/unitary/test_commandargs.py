@@ -0,0 +1,51 @@
+import pytest
+
+from currency_exchange_tg_bot.commandargs import (parse_amount, parse_conversion, parse_currency_code,
+                                                  parse_currency_pair, parse_exchange_rate, parse_new_currency)
+
+
+def test_currency_code():
+    assert parse_currency_code(' usd ') == 'USD'
+    assert parse_currency_code('usdt') is None
+
+
+@pytest.mark.parametrize('text', ['usd eur', 'USD  EUR', 'usd, eur', 'usd/eur'])
+def test_currency_pair(text):
+    assert parse_currency_pair(text) == ('USD', 'EUR')
+
+
+def test_currency_pair_rejects_other_input():
+    assert parse_currency_pair('usd') is None
+    assert parse_currency_pair('usd eur rub') is None
+
+
+def test_new_currency():
+    assert parse_new_currency('usd, US Dollar, $') == ('USD', 'US Dollar', '$')
+    assert parse_new_currency('usd US Dollar, $') == ('USD', 'US Dollar', '$')
+    assert parse_new_currency('usd, US Dollar') is None
+
+
+@pytest.mark.parametrize('text', ['usd, eur, 0.92', 'usd eur 0.92', 'USD,EUR,0.92'])
+def test_exchange_rate(text):
+    assert parse_exchange_rate(text) == ('USD', 'EUR', 0.92)
+
+
+def test_exchange_rate_keeps_the_sign():
+    # a negative rate is parsed, so that it's rejected as a rate rather than as malformed input
+    assert parse_exchange_rate('usd eur -1') == ('USD', 'EUR', -1.0)
+    assert parse_exchange_rate('usd eur abc') is None
+
+
+@pytest.mark.parametrize('text', ['100 usd eur', '100 usd to eur', '100, USD, EUR', '100 usd в eur'])
+def test_conversion(text):
+    assert parse_conversion(text) == (100.0, 'USD', 'EUR')
+
+
+def test_conversion_rejects_other_input():
+    assert parse_conversion('usd eur 100') is None
+    assert parse_conversion('100 usd') is None
+
+
+def test_amount():
+    assert parse_amount(' 12.5 ') == 12.5
+    assert parse_amount('12,5') is None
@@ -0,0 +1,111 @@
+from unittest.mock import AsyncMock
+
+import pytest
+
+from currency_exchange_fapi_client import exceptions as apiexc
+
+from currency_exchange_tg_bot.accesstokens import CredentialPool, PooledCredential
+from currency_exchange_tg_bot.apitools import ApiSession
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeApiClient:
+
+    def __init__(self, configuration):
+        self.configuration = configuration
+
+    async def close(self):
+        pass
+
+
+def make_credential(username: str) -> PooledCredential:
+    token_service = AsyncMock()
+    token_service.get_access_token.return_value = f'{username} token'
+    return PooledCredential(username, 'password', token_service)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def credentials():
+    return [make_credential(username) for username in ('bot1', 'bot2', 'bot3')]
+
+
+def test_least_in_flight_is_picked(credentials, clock):
+    pool = CredentialPool(credentials, clock=clock)
+
+    picked = [pool.acquire() for _ in range(3)]
+    assert sorted(credential.username for credential in picked) == ['bot1', 'bot2', 'bot3']
+
+    pool.release(credentials[1])
+    assert pool.acquire() is credentials[1]
+
+
+def test_round_robin_takes_each_in_turn(credentials, clock):
+    pool = CredentialPool(credentials, strategy='round_robin', clock=clock)
+
+    picked = []
+    for _ in range(6):
+        credential = pool.acquire()
+        pool.release(credential)
+        picked.append(credential.username)
+
+    assert picked == ['bot1', 'bot2', 'bot3', 'bot1', 'bot2', 'bot3']
+
+
+def test_throttled_credential_cools_down(credentials, clock):
+    pool = CredentialPool(credentials[:2], strategy='round_robin', cooldown=30.0, clock=clock)
+    pool.throttle(credentials[0])
+
+    assert [pool.acquire().username for _ in range(2)] == ['bot2', 'bot2']
+
+    clock.now = 31.0
+    assert pool.acquire().username == 'bot1'
+
+
+def test_all_throttled_takes_the_one_free_soonest(credentials, clock):
+    pool = CredentialPool(credentials[:2], clock=clock)
+    pool.throttle(credentials[0], retry_after=10.0)
+    pool.throttle(credentials[1], retry_after=5.0)
+
+    assert pool.acquire() is credentials[1]
+
+
+class FakeApi:
+
+    def __init__(self, api_client):
+        self.api_client = api_client
+
+
+@pytest.fixture
+def patch_api_client(monkeypatch):
+    monkeypatch.setattr('currency_exchange_tg_bot.apitools.ApiClient', FakeApiClient)
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures('patch_api_client')
+async def test_session_is_authorized_as_picked_credential_and_cools_it_down_on_429(credentials, clock):
+    pool = CredentialPool(credentials[:1], clock=clock)
+    configuration = type('Configuration', (), {'username': None, 'password': None, 'access_token': None})()
+    throttled = apiexc.ApiException(status=429, reason='Too Many Requests')
+    throttled.headers = {'Retry-After': '12'}
+
+    with pytest.raises(apiexc.ApiException):
+        async with ApiSession(FakeApi, pool, configuration) as api:
+            assert api.api_client.configuration.access_token == 'bot1 token'
+            assert credentials[0].in_flight == 1
+            raise throttled
+
+    assert credentials[0].in_flight == 0
+    assert credentials[0].cooldown_until == 12.0
@@ -0,0 +1,101 @@
+import contextlib
+from types import SimpleNamespace
+
+import pytest
+
+from currency_exchange_fapi_client import exceptions as apiexc
+
+from currency_exchange_tg_bot.botcallbacks import GetCurrencyConversationCallbacks
+from currency_exchange_tg_bot.currencysearch import CurrencySearchIndex
+
+
+@pytest.fixture
+def index() -> CurrencySearchIndex:
+    index = CurrencySearchIndex()
+    index.update([
+        ('USD', 'US Dollar', '$'),
+        ('AUD', 'Australian Dollar', 'A$'),
+        ('EUR', 'Euro', '€'),
+        ('RUB', 'Russian Ruble', '₽'),
+    ])
+    return index
+
+
+def codes(found) -> list[str]:
+    return [currency.code for currency in found]
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('usd', ['USD']),
+    ('€', ['EUR']),
+    ('dollar', ['AUD', 'USD']),
+    ('Dollar', ['AUD', 'USD']),
+    ('australian dollar', ['AUD', 'USD']),
+    ('ru', ['RUB']),
+    ('eu', ['EUR']),
+])
+def test_search(index, query, expected):
+    assert codes(index.search(query)) == expected
+
+
+def test_exact_code_ranks_above_prefix(index):
+    index.add('US', 'Unknown', 'u')
+
+    assert codes(index.search('us'))[0] == 'US'
+
+
+def test_misspelled_query_is_found_by_trigrams(index):
+    assert codes(index.search('dolar')) == ['AUD', 'USD']
+
+
+def test_unknown_query(index):
+    assert index.search('xyz') == []
+
+
+def test_added_currency_is_found(index):
+    index.add('GBP', 'Pound Sterling', '£')
+
+    assert codes(index.search('pound')) == ['GBP']
+
+
+def test_update_removes_missing_currencies(index):
+    index.update([('EUR', 'Euro', '€')])
+
+    assert len(index) == 1
+    assert index.search('dollar') == []
+    assert index.search('dolar') == []
+
+
+def test_renamed_currency_is_not_found_by_old_name(index):
+    index.add('RUB', 'Rouble', '₽')
+
+    assert index.search('russian') == []
+    assert codes(index.search('rouble')) == ['RUB']
+
+
+@pytest.mark.anyio
+async def test_three_letter_word_unknown_as_code_is_searched(index):
+    index.add('JPY', 'Japanese Yen', '¥')
+
+    class FakeApi:
+        async def currency_exchange_get_currency(self, code, _request_timeout=None):
+            raise apiexc.NotFoundException(status=404)
+
+    @contextlib.asynccontextmanager
+    async def api_session():
+        yield FakeApi()
+
+    sent = []
+
+    async def send_message(**kwargs):
+        sent.append(kwargs)
+
+    callbacks = GetCurrencyConversationCallbacks(index, SimpleNamespace(snapshot=None), api_session,
+                                                 SimpleNamespace(request_timeout=1.0))
+    update = SimpleNamespace(effective_chat=SimpleNamespace(id=1), message=SimpleNamespace(text='yen'))
+
+    await callbacks.send_currency(update, SimpleNamespace(bot=SimpleNamespace(send_message=send_message)))
+
+    [message] = sent
+    [[button]] = message['reply_markup'].inline_keyboard
+    assert button.callback_data == 'currency:JPY'
@@ -0,0 +1,95 @@
+import pytest
+from telegram.error import Forbidden, RetryAfter
+
+from currency_exchange_tg_bot.accesstokens import get_sqlite3_connection
+from currency_exchange_tg_bot.catalog import CatalogSnapshot
+from currency_exchange_tg_bot.digest import (DigestBroadcaster, Sqlite3DigestRepository, create_digest_schema,
+                                             group_by_pairs)
+
+
+@pytest.fixture
+def digest_repo(tmp_path):
+    # the repository is used from worker threads, so it gets a connection per call like in the bot
+    connection = get_sqlite3_connection(str(tmp_path / 'userdata.sqlite3'))
+    with connection() as conn:
+        create_digest_schema(conn)
+    return Sqlite3DigestRepository(connection)
+
+
+class FakeCatalog:
+    snapshot = CatalogSnapshot([], [('USD', 'EUR', 0.9), ('USD', 'RUB', 80.0)], 0.0)
+
+    async def refresh(self):
+        return self.snapshot
+
+
+class FakeBot:
+
+    def __init__(self, failures: dict[int, list[Exception]] = None, crash_after: int = None):
+        self.sent: list[tuple[int, str]] = []
+        self._failures = failures or {}
+        self._crash_after = crash_after
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self._failures.get(chat_id):
+            raise self._failures[chat_id].pop(0)
+        if self._crash_after is not None and len(self.sent) >= self._crash_after:
+            raise RuntimeError('crash')
+        self.sent.append((chat_id, text))
+
+
+def make_broadcaster(digest_repo) -> DigestBroadcaster:
+    return DigestBroadcaster(digest_repo, FakeCatalog(), messages_per_second=10_000, concurrency=4, delivery_batch=2)
+
+
+def test_chats_with_same_pairs_are_grouped():
+    groups = group_by_pairs({1: [('USD', 'EUR')], 2: [('USD', 'EUR')], 3: [('USD', 'RUB'), ('USD', 'EUR')],
+                             4: [('USD', 'EUR'), ('USD', 'RUB')]})
+
+    assert groups == {(('USD', 'EUR'),): [1, 2], (('USD', 'EUR'), ('USD', 'RUB')): [3, 4]}
+
+
+@pytest.mark.anyio
+async def test_each_chat_gets_digest_once(digest_repo):
+    for chat_id in range(10):
+        digest_repo.subscribe(chat_id, [('USD', 'EUR')] if chat_id % 2 else [('USD', 'RUB')])
+    bot = FakeBot()
+
+    report = await make_broadcaster(digest_repo).run(bot, '2026-01-01')
+
+    assert sorted(chat_id for chat_id, _ in bot.sent) == list(range(10))
+    assert len({text for _, text in bot.sent}) == 2
+    assert (report.recipients, report.distinct_messages, report.sent, report.failed) == (10, 2, 10, 0)
+    assert await make_broadcaster(digest_repo).run(bot, '2026-01-01') is None
+
+
+@pytest.mark.anyio
+async def test_flood_limit_is_waited_out_and_blocked_chat_is_unsubscribed(digest_repo):
+    digest_repo.subscribe(1, [('USD', 'EUR')])
+    digest_repo.subscribe(2, [('USD', 'EUR')])
+    bot = FakeBot({1: [RetryAfter(0)], 2: [Forbidden('bot was blocked by the user')]})
+
+    report = await make_broadcaster(digest_repo).run(bot, '2026-01-01')
+
+    assert [chat_id for chat_id, _ in bot.sent] == [1]
+    assert (report.sent, report.failed) == (1, 1)
+    assert digest_repo.get_pairs(2) == []
+
+
+@pytest.mark.anyio
+async def test_interrupted_run_is_resumed(digest_repo):
+    for chat_id in range(6):
+        digest_repo.subscribe(chat_id, [('USD', 'EUR')])
+    broadcaster = DigestBroadcaster(digest_repo, FakeCatalog(), messages_per_second=10_000, concurrency=1,
+                                    delivery_batch=2)
+
+    with pytest.raises(RuntimeError):
+        await broadcaster.run(FakeBot(crash_after=4), '2026-01-01')
+    assert digest_repo.get_unfinished_runs() == ['2026-01-01']
+
+    bot = FakeBot()
+    report = await broadcaster.run(bot, '2026-01-01')
+
+    assert [chat_id for chat_id, _ in bot.sent] == [4, 5]
+    assert report.recipients == 2
+    assert digest_repo.get_unfinished_runs() == []
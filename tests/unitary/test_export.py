@@ -0,0 +1,44 @@
+import csv
+import io
+import json
+
+from currency_exchange_tg_bot.catalog import CatalogSnapshot
+from currency_exchange_tg_bot.export import iter_export, write_spooled
+
+
+SNAPSHOT = CatalogSnapshot(
+    currencies=[('USD', 'US Dollar', '$'), ('EUR', 'Euro', '€')],
+    rates=[('USD', 'EUR', 0.92), ('EUR', 'USD', 1.087)],
+    fetched_at=0.0,
+)
+
+
+def test_csv_export():
+    document = write_spooled(iter_export(SNAPSHOT, 'rates', 'csv'), max_memory=1024)
+
+    rows = list(csv.reader(io.TextIOWrapper(document, encoding='utf-8')))
+
+    assert rows == [['base', 'target', 'rate'], ['USD', 'EUR', '0.92'], ['EUR', 'USD', '1.087']]
+
+
+def test_json_export():
+    document = write_spooled(iter_export(SNAPSHOT, 'currencies', 'json'), max_memory=1024)
+
+    data = json.load(document)
+
+    assert data['fetched_at'] == '1970-01-01T00:00:00+00:00'
+    assert data['rows'][1] == {'code': 'EUR', 'name': 'Euro', 'sign': '€'}
+
+
+def test_empty_json_export_is_valid():
+    empty = CatalogSnapshot(currencies=[], rates=[], fetched_at=0.0)
+
+    assert json.load(write_spooled(iter_export(empty, 'rates', 'json'), max_memory=1024))['rows'] == []
+
+
+def test_big_export_rolls_over_to_disk():
+    rates = [('USD', f'{i:03d}', float(i)) for i in range(1000)]
+    document = write_spooled(iter_export(SNAPSHOT._replace(rates=rates), 'rates', 'csv'), max_memory=1024)
+
+    assert document._rolled
+    assert len(document.read().splitlines()) == 1001
@@ -0,0 +1,96 @@
+import contextlib
+from types import SimpleNamespace
+
+import pytest
+
+from currency_exchange_fapi_client import exceptions as apiexc
+
+from currency_exchange_tg_bot.accesstokens import get_sqlite3_connection
+from currency_exchange_tg_bot.catalog import CatalogSnapshot
+from currency_exchange_tg_bot.favorites import FavoritesDashboard, Sqlite3FavoritesRepository, create_favorites_schema
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def favorites_repo(tmp_path):
+    connection = get_sqlite3_connection(str(tmp_path / 'userdata.sqlite3'))
+    with connection() as conn:
+        create_favorites_schema(conn)
+    return Sqlite3FavoritesRepository(connection)
+
+
+class FakeCatalog:
+
+    def __init__(self, rates):
+        self.snapshot = CatalogSnapshot([], rates, 0.0)
+
+    def is_stale(self, snapshot):
+        return False
+
+
+class FakeApi:
+
+    def __init__(self, rates):
+        self.rates = rates
+        self.requested = []
+
+    async def currency_exchange_get_exchange_rate(self, pair, _request_timeout=None):
+        self.requested.append(pair)
+        if pair not in self.rates:
+            raise apiexc.NotFoundException(status=404)
+        return SimpleNamespace(rate=self.rates[pair])
+
+
+def make_dashboard(favorites_repo, catalog, api):
+    @contextlib.asynccontextmanager
+    async def api_session():
+        yield api
+
+    return FavoritesDashboard(favorites_repo, catalog, api_session, SimpleNamespace(request_timeout=1.0),
+                              max_rendered=10)
+
+
+async def test_rates_missing_from_catalog_are_fetched_and_table_is_kept(favorites_repo):
+    catalog = FakeCatalog([('USD', 'EUR', 0.9)])
+    api = FakeApi({'USDRUB': '80.5'})
+    dashboard = make_dashboard(favorites_repo, catalog, api)
+    await dashboard.add(1, [('USD', 'EUR'), ('USD', 'RUB'), ('USD', 'XXX')])
+
+    text = await dashboard.render(1)
+    assert '0.9' in text and '80.5' in text and '—' in text
+    assert sorted(api.requested) == ['USDRUB', 'USDXXX']
+
+    assert await dashboard.render(1) is text
+    assert len(api.requested) == 2
+
+
+async def test_table_is_rendered_again_once_its_rates_change(favorites_repo):
+    catalog = FakeCatalog([('USD', 'EUR', 0.9), ('EUR', 'RUB', 90.0)])
+    dashboard = make_dashboard(favorites_repo, catalog, FakeApi({}))
+    await dashboard.add(1, [('USD', 'EUR')])
+    text = await dashboard.render(1)
+
+    catalog.snapshot = CatalogSnapshot([], [('USD', 'EUR', 0.9), ('EUR', 'RUB', 91.0)], 1.0)
+    assert await dashboard.render(1) is text
+
+    catalog.snapshot = CatalogSnapshot([], [('USD', 'EUR', 0.95)], 2.0)
+    assert '0.95' in await dashboard.render(1)
+
+    await dashboard.remove(1)
+    assert await dashboard.render(1) is None
+
+
+async def test_table_with_fetched_rates_is_kept_until_catalog_refresh(favorites_repo):
+    catalog = FakeCatalog([('USD', 'EUR', 0.9)])
+    api = FakeApi({'EURUSD': '1.1'})
+    dashboard = make_dashboard(favorites_repo, catalog, api)
+    await dashboard.add(1, [('EUR', 'USD')])
+    text = await dashboard.render(1)
+    assert await dashboard.render(1) is text
+
+    api.rates['EURUSD'] = '1.2'
+    catalog.snapshot = CatalogSnapshot([], [('USD', 'EUR', 0.85)], 1.0)
+    assert '1.2' in await dashboard.render(1)
+    assert api.requested == ['EURUSD', 'EURUSD']
@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from currency_exchange_tg_bot import ioc
+from currency_exchange_tg_bot.ioc import Container, SharedContainer
+
+
+@pytest.fixture
+def shared(monkeypatch, tmp_path):
+    monkeypatch.setenv('TG_BOT_TOKEN', '1:main')
+    monkeypatch.setenv('CURRENCY_EXCHANGE_HOST', 'http://localhost:80')
+    monkeypatch.setenv('ADMIN_RECORDS_FILE', str(tmp_path / 'admin_records'))
+    monkeypatch.setenv('DIGEST_CONNECTION_URI', str(tmp_path / 'userdata.sqlite3'))
+    monkeypatch.setenv('EXTRA_BOTS', json.dumps([
+        {'bot_name': 'eu', 'tg_bot_token': '2:eu', 'admin_records_file': str(tmp_path / 'admin_records_eu')},
+    ]))
+    return SharedContainer()
+
+
+def test_extra_bots_share_dependencies_but_keep_their_settings(shared, tmp_path):
+    main, eu = Container(shared), Container(shared, shared.extra_bot_settings[0])
+
+    assert eu.bot_settings.tg_bot_token == '2:eu'
+    assert eu.bot_settings.rate_limit_user_capacity == main.bot_settings.rate_limit_user_capacity
+    assert eu.bot_settings.extra_bots == []
+    assert eu.bot_settings.userdata_connection_uri == str(tmp_path / 'userdata.eu.sqlite3')
+    assert main.admins_rec is not eu.admins_rec
+    assert main.rate_limiter is not eu.rate_limiter
+    assert main.get_exchange_rate_cbs._catalog is eu.get_exchange_rate_cbs._catalog
+
+
+def test_extra_bots_keep_their_admins_apart_by_default(shared, monkeypatch, tmp_path):
+    monkeypatch.setenv('EXTRA_BOTS', json.dumps([{'bot_name': 'eu', 'tg_bot_token': '2:eu'},
+                                                 {'bot_name': 'us', 'tg_bot_token': '3:us'}]))
+
+    eu, us = SharedContainer().extra_bot_settings
+
+    assert eu.admin_records_file == tmp_path / 'admin_records.eu'
+    assert us.admin_records_file == tmp_path / 'admin_records.us'
+
+
+def test_dependency_is_built_once_on_first_access(shared, monkeypatch):
+    built = []
+
+    def rate_limiter(*args):
+        built.append(args)
+        return object()
+
+    monkeypatch.setattr(ioc, 'RateLimiter', rate_limiter)
+    main = Container(shared)
+    assert built == []
+
+    assert main.rate_limiter is main.rate_limiter
+    assert len(built) == 1
+
+
+def test_bot_names_must_be_unique(shared, monkeypatch):
+    monkeypatch.setenv('EXTRA_BOTS', json.dumps([{'tg_bot_token': '2:eu'}]))
+
+    with pytest.raises(ValueError):
+        SharedContainer().extra_bot_settings
+
+
+@pytest.mark.anyio
+async def test_shared_dependencies_start_once_and_stop_with_the_last_bot(shared, monkeypatch):
+    calls = []
+
+    async def start():
+        calls.append('start')
+
+    async def stop():
+        calls.append('stop')
+
+    monkeypatch.setattr(shared, '_start', start)
+    monkeypatch.setattr(shared.background_tasks, 'stop', stop)
+    monkeypatch.setattr(shared, 'traffic_recorder', None)
+
+    await shared.start()
+    await shared.start()
+    await shared.stop()
+    assert calls == ['start']
+    await shared.stop()
+    assert calls == ['start', 'stop']
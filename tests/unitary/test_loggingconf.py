@@ -0,0 +1,69 @@
+import json
+import logging
+import logging.config
+import queue
+
+import pytest
+
+from currency_exchange_tg_bot.loggingconf import JsonFormatter, get_logging_conf, update_log_context
+
+
+@pytest.fixture
+def queued_logger():
+    """A logger enqueuing its records through the queue handler of the logging config, with its filters"""
+    conf = get_logging_conf('INFO', 'json')['handlers']['queue']
+    handler_class = logging.config.BaseConfigurator({}).resolve(conf['class'])
+    records = queue.Queue()
+    handler = handler_class(records)
+    for log_filter in conf['filters']:
+        handler.addFilter(log_filter)
+    logger = logging.getLogger('test_loggingconf')
+    logger.addHandler(handler)
+    logger.propagate = False
+    yield logger, records
+    logger.removeHandler(handler)
+
+
+def test_mutable_arg_is_logged_as_it_was_at_the_call(queued_logger):
+    logger, records = queued_logger
+    data = {'rate': 1}
+
+    logger.warning('rates %s', data)
+    data['rate'] = 2
+
+    assert records.get_nowait().getMessage() == "rates {'rate': 1}"
+
+
+def test_json_record_carries_fields_of_the_update(queued_logger):
+    logger, records = queued_logger
+
+    token = update_log_context.set({'bot': 'rates_bot', 'update_id': 7, 'chat_id': 42, 'command': 'start'})
+    try:
+        logger.warning('handled %s', 'start')
+    finally:
+        update_log_context.reset(token)
+    logger.warning('outside of updates')
+
+    formatter = JsonFormatter()
+    entry = json.loads(formatter.format(records.get_nowait()))
+    assert entry['message'] == 'handled start'
+    assert entry['level'] == 'WARNING'
+    assert {field: entry[field] for field in JsonFormatter.context_fields} == {
+        'bot': 'rates_bot', 'update_id': 7, 'chat_id': 42, 'command': 'start'
+    }
+    assert not set(JsonFormatter.context_fields) & set(json.loads(formatter.format(records.get_nowait())))
+
+
+def test_exception_is_left_for_the_listener_to_format(queued_logger):
+    logger, records = queued_logger
+
+    try:
+        raise ValueError('unknown currency')
+    except ValueError:
+        logger.exception('failed to handle %s', 'start')
+
+    record = records.get_nowait()
+    assert record.exc_info is not None
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['message'] == 'failed to handle start'
+    assert 'ValueError: unknown currency' in entry['exc_info']
@@ -0,0 +1,53 @@
+import tracemalloc
+
+import pytest
+
+from currency_exchange_tg_bot.memory import MemoryInspector, format_size, render_report
+from currency_exchange_tg_bot.metrics import Metrics
+
+
+@pytest.fixture
+def inspector():
+    inspector = MemoryInspector(top=5)
+    yield inspector
+    if tracemalloc.is_tracing():
+        inspector.stop_tracing()
+
+
+def test_report_without_tracing(inspector):
+    state = {'a': 1}
+    inspector.register('state', lambda: len(state))
+
+    report = inspector.report()
+
+    assert report.traced is None and report.growth is None
+    assert report.structure_sizes == [('state', 1)]
+    assert 'Tracing is off' in render_report(report)
+
+
+def test_growth_is_reported_from_second_snapshot(inspector):
+    inspector.start_tracing()
+    assert inspector.report().growth is None
+
+    leaked = [bytearray(1024) for _ in range(200)]
+    growth = inspector.report().growth
+
+    assert growth
+    assert growth[0].size_diff >= 200 * 1024
+    assert 'test_memory.py' in growth[0].location
+    del leaked
+
+
+def test_own_objects_are_counted_with_their_change(inspector):
+    inspector.report()
+    kept = [Metrics() for _ in range(3)]
+
+    counts = {name: (count, diff) for name, count, diff in inspector.report().object_counts}
+
+    assert counts['currency_exchange_tg_bot.metrics.Metrics'][1] >= 3
+    del kept
+
+
+def test_format_size():
+    assert format_size(512) == '512 B'
+    assert format_size(3 * 1024 * 1024) == '3 MiB'
@@ -0,0 +1,23 @@
+from currency_exchange_tg_bot.metrics import Metrics
+
+
+def test_counters_are_rendered_with_labels():
+    metrics = Metrics()
+    metrics.increment('updates_total', scope='user')
+    metrics.increment('updates_total', 2, scope='user')
+
+    assert metrics.render() == 'updates_total{scope="user"} 3'
+
+
+def test_histogram_is_rendered_cumulatively():
+    metrics = Metrics()
+    for value in (0.001, 0.02, 20):
+        metrics.observe('lag_seconds', value, buckets=(0.01, 0.1))
+
+    assert metrics.render().splitlines() == [
+        'lag_seconds_bucket{le="0.01"} 1',
+        'lag_seconds_bucket{le="0.1"} 2',
+        'lag_seconds_bucket{le="+Inf"} 3',
+        'lag_seconds_sum 20.021',
+        'lag_seconds_count 3',
+    ]
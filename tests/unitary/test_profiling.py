@@ -0,0 +1,46 @@
+import asyncio
+import marshal
+
+import pytest
+
+from currency_exchange_tg_bot.profiling import EventLoopProfiler, ProfilerBusyError, dump_stats, render_stats
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def busy_handler():
+    for _ in range(3):
+        sum(i * i for i in range(10_000))
+        await asyncio.sleep(0)
+
+
+async def test_profile_covers_concurrent_tasks():
+    profiler = EventLoopProfiler()
+
+    profile_task = asyncio.create_task(profiler.profile(0.05))
+    await asyncio.sleep(0)
+    await busy_handler()
+    report = render_stats(await profile_task)
+
+    assert 'busy_handler' in report
+    assert 'cumulative time' in report and 'own time' in report
+
+
+async def test_only_one_profiling_runs_at_a_time():
+    profiler = EventLoopProfiler()
+    profile_task = asyncio.create_task(profiler.profile(0.01))
+    await asyncio.sleep(0)
+
+    with pytest.raises(ProfilerBusyError):
+        await profiler.profile(0.01)
+    await profile_task
+    assert not profiler.running
+
+
+async def test_raw_profile_is_marshalled_stats():
+    profiler = await EventLoopProfiler().profile(0)
+
+    stats = marshal.loads(dump_stats(profiler))
+
+    assert isinstance(stats, dict)
@@ -0,0 +1,95 @@
+import pytest
+
+from currency_exchange_tg_bot.ratehistory import RateHistoryStore, rate_stats, downsample, sparkline, RECORD
+
+
+@pytest.fixture
+def store(tmp_path) -> RateHistoryStore:
+    return RateHistoryStore(tmp_path)
+
+
+class TestRecording:
+
+    def test_unchanged_rate_is_not_appended(self, store, tmp_path):
+        assert store.append_if_changed('USD', 'EUR', 0.9, 100)
+        assert not store.append_if_changed('USD', 'EUR', 0.9, 200)
+        assert store.append_if_changed('USD', 'EUR', 0.91, 300)
+
+        assert (tmp_path / 'USDEUR.bin').stat().st_size == 2 * RECORD.size
+
+    def test_last_rate_is_read_from_file_on_reopen(self, store, tmp_path):
+        store.append_if_changed('USD', 'EUR', 0.9, 100)
+
+        reopened = RateHistoryStore(tmp_path)
+
+        assert not reopened.append_if_changed('USD', 'EUR', 0.9, 200)
+
+    def test_partially_written_record_is_dropped(self, store, tmp_path):
+        store.append_if_changed('USD', 'EUR', 0.9, 100)
+        with open(tmp_path / 'USDEUR.bin', 'ab') as f:
+            f.write(b'\x00' * 3)
+
+        reopened = RateHistoryStore(tmp_path)
+        reopened.append_if_changed('USD', 'EUR', 0.95, 200)
+
+        assert list(reopened.query('USD', 'EUR', 0, 300).rates) == [0.9, 0.95]
+
+    def test_stores_sharing_directory_append_in_time_order(self, store, tmp_path):
+        other = RateHistoryStore(tmp_path)
+        assert store.append_if_changed('USD', 'EUR', 0.9, 100)
+        assert other.append_if_changed('USD', 'EUR', 0.91, 200)
+
+        assert not store.append_if_changed('USD', 'EUR', 0.92, 200)
+        assert not store.append_if_changed('USD', 'EUR', 0.92, 150)
+        assert not store.append_if_changed('USD', 'EUR', 0.91, 300)
+        assert store.append_if_changed('USD', 'EUR', 0.93, 300)
+
+        series = other.query('USD', 'EUR', 0, 400)
+        assert list(series.timestamps) == [100, 200, 300]
+        assert list(series.rates) == [0.9, 0.91, 0.93]
+
+    def test_invalid_pair_is_rejected(self, store):
+        with pytest.raises(ValueError):
+            store.append_if_changed('../', 'EUR', 0.9, 100)
+
+
+class TestQuery:
+
+    @pytest.fixture
+    def filled_store(self, store) -> RateHistoryStore:
+        store.record_rates([('USD', 'EUR', 1.0)], 100)
+        store.record_rates([('USD', 'EUR', 2.0)], 200)
+        store.record_rates([('USD', 'EUR', 4.0)], 300)
+        return store
+
+    def test_rate_in_effect_at_start_is_included(self, filled_store):
+        series = filled_store.query('USD', 'EUR', 150, 250)
+
+        assert list(series.timestamps) == [150, 200]
+        assert list(series.rates) == [1.0, 2.0]
+
+    def test_period_before_first_record(self, filled_store):
+        series = filled_store.query('USD', 'EUR', 0, 50)
+
+        assert not series.rates
+
+    def test_unknown_pair(self, filled_store):
+        assert not filled_store.query('EUR', 'USD', 0, 400).rates
+
+    def test_stats_are_time_weighted(self, filled_store):
+        series = filled_store.query('USD', 'EUR', 100, 400)
+
+        stats = rate_stats(series)
+
+        assert (stats.min, stats.max, stats.changes) == (1.0, 4.0, 2)
+        assert stats.avg == pytest.approx((1.0 + 2.0 + 4.0) / 3)
+
+    def test_downsample(self, filled_store):
+        series = filled_store.query('USD', 'EUR', 0, 400)
+
+        assert downsample(series, 4) == [None, 1.0, 2.0, 4.0]
+
+
+def test_sparkline():
+    assert sparkline([None, 1.0, 4.5, 8.0]) == ' ▁▅█'
+    assert sparkline([2.0, 2.0]) == '▄▄'
@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+
+import pytest
+from telegram.ext import ApplicationHandlerStop
+
+from currency_exchange_tg_bot.botcallbacks import RateLimitCallback
+from currency_exchange_tg_bot.metrics import Metrics
+from currency_exchange_tg_bot.ratelimit import RateLimiter, TokenBuckets
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture
+def limiter(clock) -> RateLimiter:
+    return RateLimiter(TokenBuckets(capacity=5, refill_rate=1, max_size=100, clock=clock),
+                       TokenBuckets(capacity=10, refill_rate=1, max_size=100, clock=clock))
+
+
+def test_requests_within_capacity_are_admitted(limiter):
+    assert all(limiter.acquire(1, 1, cost=1) == (None, 0.0) for _ in range(5))
+
+
+def test_user_is_limited_when_bucket_is_empty(limiter):
+    for _ in range(5):
+        limiter.acquire(1, 1, cost=1)
+
+    assert limiter.acquire(1, 1, cost=1) == ('user', pytest.approx(1.0))
+
+
+def test_bucket_is_refilled_over_time(limiter, clock):
+    limiter.acquire(1, 1, cost=5)
+    clock.now += 2
+
+    assert limiter.acquire(1, 1, cost=2) == (None, 0.0)
+    assert limiter.acquire(1, 1, cost=1)[0] == 'user'
+
+
+def test_chat_is_limited_across_its_users(limiter):
+    for user_id in range(2):
+        limiter.acquire(user_id, 1, cost=5)
+
+    assert limiter.acquire(3, 1, cost=1)[0] == 'chat'
+    assert limiter.acquire(3, 2, cost=1) == (None, 0.0)
+
+
+def test_limited_request_takes_no_tokens(limiter):
+    limiter.acquire(1, 1, cost=5)
+    limiter.acquire(2, 1, cost=3)
+    assert limiter.acquire(3, 1, cost=5)[0] == 'chat'
+
+    assert limiter.acquire(3, 2, cost=5) == (None, 0.0)
+
+
+def test_cost_over_capacity_is_capped(limiter):
+    assert limiter.acquire(1, 1, cost=50) == (None, 0.0)
+    assert limiter.acquire(1, 1, cost=50) == ('user', pytest.approx(5.0))
+
+
+def test_only_first_limited_request_is_notified(limiter):
+    limiter.acquire(1, 1, cost=5)
+    limiter.acquire(1, 1, cost=1)
+
+    assert limiter.should_notify('user', 1, 1)
+    assert not limiter.should_notify('user', 1, 1)
+
+
+def test_idle_buckets_are_evicted(clock):
+    buckets = TokenBuckets(capacity=5, refill_rate=1, max_size=100, clock=clock)
+    buckets.get(1)
+    clock.now += 1
+    buckets.get(2)
+    clock.now += 4.5
+
+    buckets.get(3)
+
+    assert len(buckets) == 2
+
+
+def test_least_recently_used_bucket_is_evicted_over_max_size(clock):
+    buckets = TokenBuckets(capacity=5, refill_rate=1, max_size=2, clock=clock)
+    buckets.get(1).tokens = 0
+    buckets.get(2).tokens = 0
+    buckets.get(1)
+
+    buckets.get(3)
+
+    assert buckets.get(1).tokens == 0
+    assert buckets.get(2).tokens == 5
+
+
+@pytest.mark.anyio
+async def test_limited_updates_are_counted_by_known_commands_only(clock):
+    limiter = RateLimiter(TokenBuckets(capacity=1, refill_rate=0.001, max_size=100, clock=clock),
+                          TokenBuckets(capacity=10, refill_rate=1, max_size=100, clock=clock))
+    metrics = Metrics()
+    settings = SimpleNamespace(rate_limit_command_costs={}, rate_limit_default_cost=1.0)
+    callback = RateLimitCallback(limiter, SimpleNamespace(is_admin=lambda user_id: False), metrics, settings)
+
+    async def send_message(**kwargs):
+        pass
+
+    context = SimpleNamespace(bot=SimpleNamespace(send_message=send_message))
+    for text in ('/start', '/start', '/random1', '/random2@rates_bot'):
+        update = SimpleNamespace(effective_user=SimpleNamespace(id=1), effective_chat=SimpleNamespace(id=1),
+                                 effective_message=SimpleNamespace(text=text))
+        try:
+            await callback(update, context)
+        except ApplicationHandlerStop:
+            pass
+
+    assert metrics.counter('rate_limited_updates_total', scope='user', command='start') == 1
+    assert metrics.counter('rate_limited_updates_total', scope='user', command='other') == 2
@@ -0,0 +1,77 @@
+import itertools
+import random
+import string
+
+import pytest
+
+from currency_exchange_tg_bot.ratematrix import RateMatrix
+
+
+def test_cross_rate_through_intermediate_currency():
+    matrix = RateMatrix.from_rates([('USD', 'EUR', 0.5), ('EUR', 'GBP', 0.5)])
+    rates = dict(zip(matrix.codes, matrix.cross_rates()[matrix.codes.index('USD')]))
+
+    assert rates['GBP'] == pytest.approx(0.25)
+
+
+def test_reverse_rate_is_used():
+    matrix = RateMatrix.from_rates([('USD', 'EUR', 0.5)])
+    rates = dict(zip(matrix.codes, matrix.cross_rates()[matrix.codes.index('EUR')]))
+
+    assert rates['USD'] == pytest.approx(2.0)
+
+
+def test_unreachable_currency_has_zero_rate():
+    matrix = RateMatrix.from_rates([('USD', 'EUR', 0.5), ('GBP', 'JPY', 190)])
+    rates = dict(zip(matrix.codes, matrix.cross_rates()[matrix.codes.index('USD')]))
+
+    assert rates['JPY'] == 0
+
+
+def test_consistent_rates_have_no_cycles():
+    matrix = RateMatrix.from_rates([('USD', 'EUR', 0.5), ('EUR', 'GBP', 0.5), ('USD', 'GBP', 0.25)])
+
+    assert matrix.cycles() == []
+
+
+def test_cycle_within_tolerance_is_ignored():
+    matrix = RateMatrix.from_rates([('USD', 'EUR', 0.5), ('EUR', 'GBP', 0.5), ('USD', 'GBP', 0.2500001)],
+                                   tolerance=1e-6)
+
+    assert matrix.cycles() == []
+
+
+def test_arbitrage_cycle_is_found():
+    matrix = RateMatrix.from_rates([('USD', 'EUR', 0.5), ('EUR', 'GBP', 0.5), ('GBP', 'USD', 4.4)])
+
+    [cycle] = matrix.cycles()
+
+    assert cycle.codes == ['EUR', 'GBP', 'USD', 'EUR']
+    assert cycle.profit == pytest.approx(0.1)
+
+
+def test_rate_through_arbitrage_cycle_is_unbounded():
+    matrix = RateMatrix.from_rates([('USD', 'EUR', 0.5), ('EUR', 'GBP', 0.5), ('GBP', 'USD', 4.4), ('GBP', 'JPY', 190)])
+    rates = dict(zip(matrix.codes, matrix.cross_rates()[matrix.codes.index('USD')]))
+
+    assert rates['JPY'] == float('inf')
+    assert len(matrix.cycles()) == 1
+
+
+def test_csv_has_row_and_column_per_currency():
+    matrix = RateMatrix.from_rates([('USD', 'EUR', 0.5)])
+
+    assert matrix.to_csv().splitlines() == [',EUR,USD', 'EUR,1,2', 'USD,0.5,1']
+
+
+def test_several_hundred_currencies():
+    codes = [''.join(chars) for chars in itertools.islice(itertools.product(string.ascii_uppercase, repeat=3), 300)]
+    values = {code: random.uniform(0.1, 10) for code in codes}
+    rates = [(base, target, values[target] / values[base]) for base, target in zip(codes, codes[1:])]
+    rates.append((codes[-1], codes[0], values[codes[0]] / values[codes[-1]] * 1.01))
+
+    matrix = RateMatrix.from_rates(rates)
+
+    [cycle] = matrix.cycles()
+    assert len(cycle.codes) == 301
+    assert cycle.profit == pytest.approx(0.01)
@@ -0,0 +1,58 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from currency_exchange_fapi_client import exceptions as apiexc
+from currency_exchange_fapi_client.rest import RESTResponse
+
+from currency_exchange_tg_bot import rawlists
+from currency_exchange_tg_bot.rawlists import RawResponse
+
+
+pytestmark = pytest.mark.anyio
+
+CURRENCIES = [{'id': 1, 'code': 'USD', 'name': 'US Dollar', 'sign': '$'},
+              {'id': 2, 'code': 'EUR', 'name': 'Euro', 'sign': '€'}]
+RATES = [{'id': 1, 'base_currency': CURRENCIES[0], 'target_currency': CURRENCIES[1], 'rate': '0.92'}]
+
+
+class FakeRawApi:
+
+    def __init__(self, status: int = 200):
+        self.status = status
+
+    async def currency_exchange_get_all_currencies_without_preload_content(self, _request_timeout=None):
+        return RawResponse(self.status, json.dumps(CURRENCIES).encode())
+
+    async def currency_exchange_get_all_exchange_rates_without_preload_content(self, _request_timeout=None):
+        return RawResponse(self.status, json.dumps(RATES).encode(), headers={'Retry-After': '3'})
+
+
+async def test_lists_are_parsed_into_rows():
+    api = FakeRawApi()
+
+    assert await rawlists.get_all_currencies(api, 1) == [('USD', 'US Dollar', '$'), ('EUR', 'Euro', '€')]
+    assert await rawlists.get_all_exchange_rates(api, 1) == [('USD', 'EUR', 0.92)]
+
+
+async def test_failed_response_raises_api_exception_with_headers():
+    with pytest.raises(apiexc.ApiException) as exc_info:
+        await rawlists.get_all_exchange_rates(FakeRawApi(status=429), 1)
+
+    assert exc_info.value.status == 429
+    assert exc_info.value.headers == {'Retry-After': '3'}
+
+
+async def test_failed_client_response_raises_api_exception_with_headers():
+    async def read():
+        return b'{"detail": "Too many requests"}'
+
+    response = RESTResponse(SimpleNamespace(status=429, reason='Too Many Requests', headers={'Retry-After': '3'},
+                                            read=read))
+
+    with pytest.raises(apiexc.ApiException) as exc_info:
+        await rawlists.read_json(response)
+
+    assert exc_info.value.status == 429
+    assert exc_info.value.headers == {'Retry-After': '3'}
@@ -0,0 +1,22 @@
+import time
+
+import pytest
+
+from currency_exchange_tg_bot.startuptimer import StartupTimer
+
+
+def test_phases_record_their_durations():
+    timer = StartupTimer()
+    with timer.phase('settings'):
+        time.sleep(0.01)
+    with pytest.raises(RuntimeError):
+        with timer.phase('catalog'):
+            raise RuntimeError('service is down')
+
+    (settings, settings_duration), (catalog, catalog_duration) = timer.phases
+    assert (settings, catalog) == ('settings', 'catalog')
+    assert settings_duration >= 0.01
+    assert 0 <= catalog_duration < settings_duration
+    assert timer.elapsed() >= settings_duration + catalog_duration
+    assert timer.report().startswith('Startup took ')
+    assert 'settings ' in timer.report() and 'catalog ' in timer.report()
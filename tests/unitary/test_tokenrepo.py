@@ -0,0 +1,180 @@
+import datetime
+import sqlite3
+import contextlib
+
+import pytest
+
+from currency_exchange_tg_bot.accesstokens import Sqlite3TokenRepository
+from currency_exchange_tg_bot.accesstokens.db import create_schema
+
+
+@pytest.fixture
+def sqlite3_connection():
+    conn = sqlite3.connect(":memory:")
+    create_schema(conn)
+
+    @contextlib.contextmanager
+    def connection():
+        yield conn
+
+    yield connection
+    conn.close()
+
+
+@pytest.fixture
+def token_repo(sqlite3_connection) -> Sqlite3TokenRepository:
+    return Sqlite3TokenRepository(sqlite3_connection)
+
+
+@pytest.fixture
+def executed_statements(sqlite3_connection):
+    statements = []
+    with sqlite3_connection() as conn:
+        conn.set_trace_callback(statements.append)
+        yield statements
+        conn.set_trace_callback(None)
+
+
+def query_plan(sqlite3_connection, statement: str) -> str:
+    with sqlite3_connection() as conn:
+        return ' '.join(row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {statement}'))
+
+
+class TestQueryPlans:
+
+    def test_get_fresh_token_searches_index(self, token_repo, sqlite3_connection, executed_statements):
+        token_repo.get_fresh_token('access')
+
+        plan = query_plan(sqlite3_connection, executed_statements[-1])
+
+        assert 'token_owner_type_expiry_idx (owner=? AND token_type=? AND expiry>?)' in plan
+        assert 'SCAN' not in plan
+        assert 'TEMP B-TREE' not in plan
+
+    def test_remove_expired_tokens_searches_index(self, token_repo, sqlite3_connection, executed_statements):
+        token_repo.remove_expired_tokens('access')
+
+        statement = next(s for s in executed_statements if s.startswith('DELETE'))
+        plan = query_plan(sqlite3_connection, statement)
+
+        assert 'token_owner_type_expiry_idx (owner=? AND token_type=? AND expiry<?)' in plan
+        assert 'SCAN' not in plan
+
+
+def test_remove_expired_tokens_keeps_fresh_ones(token_repo, sqlite3_connection):
+    expired_time = datetime.datetime.now() - datetime.timedelta(minutes=1)
+    not_expired_time = datetime.datetime.now() + datetime.timedelta(minutes=1)
+    token_repo.save_token('stale_token_data...', expired_time, 'access')
+    token_repo.save_token('fresh_token_data...', not_expired_time, 'access')
+    token_repo.save_token('stale_token_data...', expired_time, 'refresh')
+
+    removed = token_repo.remove_expired_tokens('access')
+
+    assert removed == 1
+    with sqlite3_connection() as conn:
+        assert conn.execute('SELECT data, token_type FROM token ORDER BY data').fetchall() == [
+            ('fresh_token_data...', 'access'), ('stale_token_data...', 'refresh')
+        ]
+
+
+def test_fresh_token_expiry_is_returned_as_datetime(token_repo):
+    not_expired_time = (datetime.datetime.now() + datetime.timedelta(minutes=1)).replace(microsecond=0)
+    token_repo.save_token('fresh_token_data...', not_expired_time, 'access')
+
+    token = token_repo.get_fresh_token('access')
+
+    assert token.data == 'fresh_token_data...'
+    assert token.expires_in == not_expired_time
+
+
+def test_tokens_and_locks_are_kept_per_owner(sqlite3_connection):
+    primary, extra = Sqlite3TokenRepository(sqlite3_connection), Sqlite3TokenRepository(sqlite3_connection, 'bot2')
+    not_expired_time = datetime.datetime.now() + datetime.timedelta(minutes=1)
+    primary.save_token('primary_token_data...', not_expired_time, 'access')
+
+    assert extra.get_fresh_token('access') is None
+    extra.delete_all_tokens()
+    assert primary.get_fresh_token('access').data == 'primary_token_data...'
+
+    assert primary.try_acquire_lock('process 1', ttl=30)
+    assert extra.try_acquire_lock('process 2', ttl=30)
+    assert not primary.try_acquire_lock('process 2', ttl=30)
+
+
+class TestLegacySchemaMigration:
+
+    @pytest.fixture
+    def legacy_connection(self):
+        conn = sqlite3.connect(":memory:")
+        conn.execute('CREATE TABLE token (data TEXT, token_type TEXT, expiry_date DATETIME);')
+        expired_time = datetime.datetime.now() - datetime.timedelta(minutes=1)
+        not_expired_time = (datetime.datetime.now() + datetime.timedelta(minutes=1)).replace(microsecond=0)
+        conn.executemany('INSERT INTO token VALUES (?, ?, ?);', [
+            ('stale_token_data...', 'access', expired_time.isoformat()),
+            ('fresh_token_data...', 'access', not_expired_time.isoformat()),
+        ])
+        conn.commit()
+
+        @contextlib.contextmanager
+        def connection():
+            yield conn
+
+        yield connection, not_expired_time
+        conn.close()
+
+    def test_tokens_are_kept(self, legacy_connection):
+        connection, not_expired_time = legacy_connection
+        with connection() as conn:
+            create_schema(conn)
+
+        token = Sqlite3TokenRepository(connection).get_fresh_token('access')
+
+        assert token.data == 'fresh_token_data...'
+        assert token.expires_in == not_expired_time
+        with connection() as conn:
+            assert len(conn.execute('SELECT * FROM token').fetchall()) == 2
+
+    def test_index_is_created(self, legacy_connection):
+        connection, _ = legacy_connection
+        with connection() as conn:
+            create_schema(conn)
+            indexes = [row[1] for row in conn.execute('PRAGMA index_list(token);')]
+
+        assert indexes == ['token_owner_type_expiry_idx']
+
+    def test_migration_is_idempotent(self, legacy_connection):
+        connection, _ = legacy_connection
+        with connection() as conn:
+            create_schema(conn)
+            create_schema(conn)
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(token);')]
+
+        assert columns == ['data', 'token_type', 'expiry', 'owner']
+
+
+class TestTokenLock:
+
+    def test_lock_held_by_another_owner_is_not_acquired(self, token_repo):
+        assert token_repo.try_acquire_lock('first', ttl=30)
+        assert not token_repo.try_acquire_lock('second', ttl=30)
+
+    def test_lock_is_reentrant_for_its_owner(self, token_repo):
+        assert token_repo.try_acquire_lock('first', ttl=30)
+        assert token_repo.try_acquire_lock('first', ttl=30)
+
+    def test_released_lock_is_acquired(self, token_repo):
+        token_repo.try_acquire_lock('first', ttl=30)
+        token_repo.release_lock('first')
+
+        assert token_repo.try_acquire_lock('second', ttl=30)
+
+    def test_expired_lock_is_taken_over(self, token_repo):
+        token_repo.try_acquire_lock('first', ttl=-1)
+
+        assert token_repo.try_acquire_lock('second', ttl=30)
+
+    def test_release_by_another_owner_keeps_lock(self, token_repo):
+        token_repo.try_acquire_lock('first', ttl=30)
+        token_repo.release_lock('second')
+
+        assert not token_repo.try_acquire_lock('second', ttl=30)
@@ -0,0 +1,61 @@
+import pytest
+
+from currency_exchange_tg_bot.traffic import (API_RESPONSE, UPDATE, Pseudonymizer, TrafficRecorder,
+                                              read_traffic)
+
+
+def make_update(user_id: int, chat_id: int, text: str) -> dict:
+    return {
+        'update_id': 1,
+        'message': {
+            'message_id': 1,
+            'chat': {'id': chat_id, 'type': 'group' if chat_id < 0 else 'private', 'title': 'Family'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Ann', 'username': 'ann'},
+            'text': text,
+        },
+    }
+
+
+@pytest.fixture
+def pseudonymizer() -> Pseudonymizer:
+    return Pseudonymizer(b'secret')
+
+
+def test_ids_and_names_are_replaced(pseudonymizer):
+    message = pseudonymizer.pseudonymize_update(make_update(42, -100, '/start'))['message']
+
+    assert message['from']['id'] not in (42, None)
+    assert message['chat']['id'] < 0 and message['chat']['id'] != -100
+    assert 'Ann' not in str(message) and 'ann' not in str(message) and 'Family' not in str(message)
+    assert message['text'] == '/start'
+
+
+def test_pseudonyms_are_stable_within_key(pseudonymizer):
+    assert pseudonymizer.pseudonymize_id(42) == pseudonymizer.pseudonymize_id(42)
+    assert pseudonymizer.pseudonymize_id(42) != pseudonymizer.pseudonymize_id(43)
+    assert pseudonymizer.pseudonymize_id(42) != Pseudonymizer(b'other').pseudonymize_id(42)
+
+
+def test_records_are_read_back_in_order(tmp_path, pseudonymizer):
+    recorder = TrafficRecorder(tmp_path / 'traffic.capture', pseudonymizer)
+    recorder.record_update(make_update(42, 42, '/showcurrency USD'))
+    recorder.record_api_response('currency_exchange_get_currency', ['USD'], error='NotFoundException')
+    recorder.close()
+
+    records = list(read_traffic(tmp_path / 'traffic.capture'))
+
+    assert [record.kind for record in records] == [UPDATE, API_RESPONSE]
+    assert records[0].payload['message']['text'] == '/showcurrency USD'
+    assert records[1].payload == {'method': 'currency_exchange_get_currency', 'args': ['USD'], 'latency': 0.0,
+                                  'error': 'NotFoundException'}
+
+
+def test_frame_cut_by_crash_is_skipped(tmp_path, pseudonymizer):
+    path = tmp_path / 'traffic.capture'
+    recorder = TrafficRecorder(path, pseudonymizer)
+    recorder.record_update(make_update(1, 1, '/start'))
+    recorder.record_update(make_update(2, 2, '/start'))
+    recorder.close()
+    path.write_bytes(path.read_bytes()[:-3])
+
+    assert len(list(read_traffic(path))) == 1
@@ -0,0 +1,51 @@
+import asyncio
+import logging
+import time
+
+import pytest
+
+from currency_exchange_tg_bot.metrics import Metrics
+from currency_exchange_tg_bot.watchdog import LoopWatchdog
+
+
+pytestmark = pytest.mark.anyio
+
+
+def blocking_call():
+    time.sleep(0.2)
+
+
+async def run_watchdog(watchdog: LoopWatchdog, blocking: bool):
+    task = asyncio.create_task(watchdog.run())
+    await asyncio.sleep(0.05)
+    if blocking:
+        blocking_call()
+    await asyncio.sleep(0.05)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+async def test_blocking_call_is_named_in_log(caplog):
+    metrics = Metrics()
+    watchdog = LoopWatchdog(metrics, interval=0.01, threshold=0.05)
+
+    with caplog.at_level(logging.WARNING, logger='watchdog'):
+        await run_watchdog(watchdog, blocking=True)
+
+    assert len(caplog.records) == 1
+    assert 'blocking_call' in caplog.records[0].getMessage()
+    assert metrics.counter('event_loop_stalls_total') == 1
+
+
+async def test_lag_is_observed_without_stalls(caplog):
+    metrics = Metrics()
+    watchdog = LoopWatchdog(metrics, interval=0.01, threshold=0.5)
+
+    with caplog.at_level(logging.WARNING, logger='watchdog'):
+        await run_watchdog(watchdog, blocking=False)
+
+    assert caplog.records == []
+    assert metrics.histogram('event_loop_lag_seconds').count > 0
+    assert metrics.counter('event_loop_stalls_total') == 0
+
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from currency_exchange_tg_bot.metrics import Metrics
+from currency_exchange_tg_bot.writecoalescer import WriteCoalescer
+
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeBackend:
+
+    def __init__(self, fail: bool = False):
+        self.writes = []
+        self.fail = fail
+
+    async def write(self, key, value):
+        self.writes.append((key, value))
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise ConnectionError('service is down')
+        return f'{key}={value}'
+
+
+async def test_burst_of_writes_of_a_key_is_sent_once_with_last_value():
+    backend, metrics = FakeBackend(), Metrics()
+    writes = WriteCoalescer(backend.write, 0.02, metrics, name='test')
+
+    results = await asyncio.gather(writes.submit('USDEUR', 0.91), writes.submit('USDEUR', 0.92),
+                                   writes.submit('USDRUB', 80.0), writes.submit('USDEUR', 0.93))
+
+    assert results == ['USDEUR=0.93', 'USDEUR=0.93', 'USDRUB=80.0', 'USDEUR=0.93']
+    assert sorted(backend.writes) == [('USDEUR', 0.93), ('USDRUB', 80.0)]
+    assert metrics.counter('coalesced_writes_requested_total', writer='test') == 4
+    assert metrics.counter('coalesced_writes_sent_total', writer='test') == 2
+    assert writes.pending_writes == 0
+
+
+async def test_next_window_is_written_after_the_previous_write():
+    backend = FakeBackend()
+    writes = WriteCoalescer(backend.write, 0.0, Metrics(), name='test')
+
+    first = asyncio.create_task(writes.submit('USDEUR', 0.91))
+    await asyncio.sleep(0.001)
+    second = asyncio.create_task(writes.submit('USDEUR', 0.92))
+
+    assert await asyncio.gather(first, second) == ['USDEUR=0.91', 'USDEUR=0.92']
+    assert backend.writes == [('USDEUR', 0.91), ('USDEUR', 0.92)]
+
+
+async def test_failed_write_is_raised_to_every_requester():
+    metrics = Metrics()
+    writes = WriteCoalescer(FakeBackend(fail=True).write, 0.01, metrics, name='test')
+
+    results = await asyncio.gather(writes.submit('USDEUR', 0.91), writes.submit('USDEUR', 0.92),
+                                   return_exceptions=True)
+
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert metrics.counter('coalesced_writes_failed_total', writer='test') == 1